@@ -0,0 +1,75 @@
+# Benchmarks for the acquisition hot paths: reading lines from a serial port, interpreting RBD frames, draining a
+# BufferInput and running measurements and grid searches without any waiting. See conftest.py for how to run them.
+from types import SimpleNamespace
+
+from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import MockOutput
+from srcMAX.pythionMAX._routinesMAX.grid_searchMAX import GridSearch
+from srcMAX.pythionMAX._routinesMAX.measurement_routineMAX import MeasurementRoutine
+from srcMAX.pythionMAX._routinesMAX.routine_handlerMAX import RoutineHandler
+
+from conftest import RBD_FRAMES, ReplayBufferInput
+
+FRAME_LINES = RBD_FRAMES.decode().splitlines(keepends=True)
+
+
+def bench_line_framing(benchmark, rbd, loopback) -> None:
+    def fill() -> None:
+        loopback.write(RBD_FRAMES)
+
+    lines = benchmark.pedantic(rbd.read_newlines, setup=fill, rounds=200)
+    assert lines == FRAME_LINES
+
+
+def bench_rbd_parsing(benchmark, rbd) -> None:
+    def parse() -> list[float | None]:
+        return [rbd.parse_response_string(line) for line in FRAME_LINES]
+
+    values = benchmark(parse)
+    assert None not in values
+
+
+def bench_rbd_corrupt_burst(benchmark, rbd) -> None:
+    # Every line is logged as a warning, so this is the cost of logging on the acquisition thread
+    corrupt = [line.replace(',', ';') for line in FRAME_LINES]
+
+    def parse() -> list[float | None]:
+        return [rbd.parse_response_string(line) for line in corrupt]
+
+    values = benchmark(parse)
+    assert set(values) == {None}
+
+
+def bench_buffer_input_throughput(benchmark, rbd, loopback) -> None:
+    def drain() -> list[float]:
+        return rbd.clear_buffer()
+
+    def fill() -> None:
+        rbd.restart_buffer()
+        loopback.write(RBD_FRAMES)
+
+    values = benchmark.pedantic(drain, setup=fill, rounds=200)
+    assert len(values) == len(FRAME_LINES)
+
+
+def bench_measure_latency(benchmark) -> None:
+    routine = MeasurementRoutine()
+    input = SimpleNamespace(interface=ReplayBufferInput([1.0, 2.0, 3.0]), label='Current')
+    assert benchmark(routine.measure, input, 10, 0) == 2
+
+
+def bench_grid_search_points(benchmark, qapp) -> None:
+    """
+    A 20 x 20 grid search with zero settling and measuring time, i.e. only the overhead of the routine itself.
+    Points per second is 400 / mean.
+    """
+    def output(label: str) -> SimpleNamespace:
+        return SimpleNamespace(interface=MockOutput(target_limit=100), label=label)
+
+    devices = [GridSearch.Device(output(label), list(range(20)), wait_time=0) for label in ('Velocity', 'Magnet')]
+    input = SimpleNamespace(interface=ReplayBufferInput([1.0]), label='Current')
+    search = GridSearch(*devices, input=input, settings=GridSearch.Settings(1, 0, update_graphics=False))
+    RoutineHandler(search, None)
+
+    benchmark(search.execute)
+    assert search.results.shape == (20, 20)
+    assert (search.results == 1).all()
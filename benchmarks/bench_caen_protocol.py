@@ -0,0 +1,48 @@
+# Micro-benchmarks for the CAEN protocol module. Run with
+#     python -m pytest benchmarks --benchmark-only
+# (requires pytest-benchmark, see requirements_dev.txt)
+from srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX import build_command, parse_reply
+
+# Replies as recorded from an R1419ET during a monitoring pass over all four channels
+REPLIES = [
+    ('#BD:00,CMD:OK,VAL:0000.0;0250.3;0499.8;0000.0\r\n', 'VMON'),
+    ('#BD:00,CMD:OK,VAL:000.00;012.35;027.81;000.00\r\n', 'IMON'),
+    ('#BD:00,CMD:OK,VAL:00000;00001;00003;00128\r\n', 'STAT'),
+    ('#BD:00,CMD:OK,VAL:0000.0;0250.0;0500.0;0000.0\r\n', 'VSET'),
+    ('#BD:00,CMD:OK,VAL:030.00;030.00;030.00;030.00\r\n', 'ISET'),
+    ('#BD:00,CMD:OK,VAL:0550;0550;0550;0550\r\n', 'MAXV'),
+    ('#BD:00,CMD:OK,VAL:HIGH;HIGH;LOW;HIGH\r\n', 'IMRANGE'),
+    ('#BD:00,CMD:OK,VAL:KILL;KILL;RAMP;KILL\r\n', 'PDWN'),
+    ('#BD:00,CMD:OK,VAL:+;+;-;+\r\n', 'POL'),
+    ('#BD:00,CMD:OK,VAL:NO\r\n', 'BDILK'),
+    ('#BD:00,CMD:OK,VAL:00000\r\n', 'BDALARM'),
+    ('#BD:00,CMD:OK\r\n', 'VSET'),
+    ('#BD:00,PAR:ERR\r\n', 'ZCADJ'),
+]
+
+
+def parse_all() -> int:
+    parsed = 0
+    for reply, par in REPLIES:
+        try:
+            parsed = parsed + len(parse_reply(reply, par))
+        except Exception:
+            pass
+    return parsed
+
+
+def build_all() -> int:
+    size = 0
+    for ch in range(5):
+        for _, par in REPLIES[:-1]:
+            size = size + len(build_command(0, 'MON', par, ch=ch))
+        size = size + len(build_command(0, 'SET', 'VSET', 250.5, ch=ch))
+    return size
+
+
+def bench_parse_replies(benchmark) -> None:
+    assert benchmark(parse_all) > 0
+
+
+def bench_build_commands(benchmark) -> None:
+    assert benchmark(build_all) > 0
@@ -0,0 +1,55 @@
+# Benchmarks for the plotting and result file paths: redrawing the grid search heatmap and the live PlotStream,
+# writing results through a ResultsSink, and reading a large grid search result file. See conftest.py for how to run them.
+from matplotlib.backends.backend_agg import FigureCanvasAgg  # type: ignore
+from matplotlib.figure import Figure  # type: ignore
+import numpy as np
+
+from srcMAX.pythionMAX._connectionsMAX.input_interfaceMAX import MockInput
+from srcMAX.pythionMAX._routinesMAX.grid_searchMAX import load_gridsearch_result
+from srcMAX.pythionMAX._routinesMAX.heatmapMAX import Heatmap
+from srcMAX.pythionMAX._routinesMAX.results_sinkMAX import ResultsSink
+
+GRID_SIZE = 100
+
+
+def bench_heatmap_update(benchmark) -> None:
+    values = list(range(GRID_SIZE))
+    heatmap = Heatmap(Heatmap.Settings(1, 1000, 10, 21), ['Velocity', 'Magnet'], (values, values), 'Current')
+    # Draw on an off-screen canvas of its own rather than a pyplot window
+    heatmap.fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(heatmap.fig)
+    heatmap.ax, heatmap.cbar_ax = heatmap.fig.subplots(1, 2, gridspec_kw={'width_ratios': (0.9, 0.05), 'wspace': 0.2})
+    data = np.random.default_rng(0).uniform(0, 1000, (GRID_SIZE, GRID_SIZE))
+
+    def update() -> None:
+        heatmap.update(data)
+        heatmap.fig.canvas.draw()
+
+    benchmark(update)
+
+
+def bench_plot_stream_redraw(benchmark, qapp) -> None:
+    from srcMAX.pythionMAX._guiMAX.plotsMAX import PlotStream
+    plot = PlotStream(input=MockInput(), timespan=60)
+    for i in range(500):  # Start from a plot that already has some history
+        plot._add_point(float(i % 10))
+    benchmark(plot._add_point, 5.0)
+
+
+def bench_load_gridsearch_result(benchmark, tmp_path) -> None:
+    path = tmp_path / 'grid.csv'
+    with open(path, 'w') as file:
+        file.write('Velocity [V],Magnet [V],Current [nA]')
+        for i in range(GRID_SIZE):
+            for j in range(GRID_SIZE):
+                file.write(f'\n{10 * i},{10 * j},{i * j / 7}')
+
+    results = benchmark(load_gridsearch_result, str(path), None)
+    assert results.shape == (GRID_SIZE, GRID_SIZE)
+    assert results[3, 7] == 3 * 7 / 7
+
+
+def bench_results_sink_write(benchmark, tmp_path) -> None:
+    # The time a routine spends handing one grid point to the sink, i.e. what writing a result adds to every point
+    with ResultsSink(str(tmp_path / 'grid.csv'), ['Velocity [V]', 'Magnet [V]', 'Current [nA]']) as sink:
+        benchmark(sink.write, 10, 20, 1.5)
@@ -0,0 +1,57 @@
+# Shared fixtures for the benchmarks. Run the suite with
+#     python -m pytest benchmarks --benchmark-only --benchmark-json=benchmark.json
+# to get the results as JSON, or save a baseline with --benchmark-autosave and compare later runs against it with
+#     python -m pytest benchmarks --benchmark-only --benchmark-compare --benchmark-compare-fail=mean:25%
+# which fails if the mean of any benchmark got more than 25 % slower.
+import os
+
+import pytest
+from serial import serial_for_url  # type: ignore
+
+# The plot benchmarks need a QApplication, but never a screen
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput  # noqa: E402
+from srcMAX.pythionMAX._connectionsMAX.emulatorsMAX import RBDEmulator  # noqa: E402
+from srcMAX.pythionMAX._connectionsMAX.rbd_inputMAX import RBDInput  # noqa: E402
+
+# 100 frames is what an RBD sampling at 100 Hz sends between two pulls at 1 Hz
+RBD_FRAMES = b''.join(RBDEmulator.frame(10 + (i % 17) / 10) for i in range(100))
+
+
+class ReplayBufferInput(BufferInput):
+    """
+    BufferInput that receives the same chunk of samples on every read, without any device behind it.
+    """
+    def __init__(self, chunk: list[float]):
+        self.chunk = chunk
+        super().__init__()
+
+    def _read_from_device(self) -> list[float]:
+        return list(self.chunk)
+
+
+@pytest.fixture
+def loopback():
+    """
+    A pyserial loopback port: everything written to it can be read back, with the same framing code paths as a real port.
+    """
+    ser = serial_for_url('loop://', timeout=1)
+    yield ser
+    ser.close()
+
+
+@pytest.fixture
+def rbd(loopback) -> RBDInput:
+    """
+    An RBDInput connected to the loopback port (without sending the sampling setup, so nothing has to be read back).
+    """
+    rbd = RBDInput(port='loop://', rbd_sample_rate=100, pull_rate=1, unit=RBDInput.CurrentUnit.NANO)
+    rbd.ser = loopback
+    return rbd
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
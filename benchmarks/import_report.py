@@ -0,0 +1,70 @@
+# Reports how long it takes to import the parts of the package that the programs start with, and which of the slow
+# optional dependencies (pyplot, seaborn, Qt) each import pulls in. Every import is timed in a fresh interpreter:
+#     python benchmarks/import_report.py [--repeat 5]
+# The last line is the time of importing pyplot and seaborn on their own, which is what importing the package cost
+# before they were only imported when a plot is first drawn.
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['matplotlib.pyplot', 'seaborn', 'PyQt5.QtWidgets']
+
+IMPORTS = {
+    'connectionsMAX': 'import srcMAX.pythionMAX.connectionsMAX',
+    'routinesMAX': 'import srcMAX.pythionMAX.routinesMAX',
+    'guiMAX': 'import srcMAX.pythionMAX.guiMAX',
+    'simbaMAX.py imports': ('from srcMAX.pythionMAX.guiMAX import MainWindow, Output, PlotStream, Input, Action, CAEN\n'
+                            'from srcMAX.pythionMAX.connectionsMAX import (LinearCalibration, RS3000Output, PowerOptions, RBDInput, MockBufferInput,\n'
+                            '                                              MockOutput, SimulatedCAENOutput)\n'
+                            'from srcMAX.pythionMAX.routinesMAX import GridSearch, Heatmap'),
+    'simba_headlessMAX.py': 'import simba_headlessMAX',
+    'pyplot + seaborn': 'import matplotlib.pyplot, seaborn',
+}
+
+# Run in the child interpreter: time the import statement, and report which heavy modules it loaded
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def time_import(statement: str, repeat: int) -> tuple[float, list[str]]:
+    """
+    The fastest of repeat imports of statement, each in a new interpreter, and the heavy modules it loaded.
+    Raises CalledProcessError if the import fails.
+    """
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    best = float('inf')
+    loaded: list[str] = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        best = min(best, result['seconds'])
+        loaded = result['loaded']
+    return best, loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Import time of the package entry points.')
+    parser.add_argument('--repeat', type=int, default=5, help='imports per entry point, the fastest is reported')
+    args = parser.parse_args()
+
+    print(f'{"Import":<24}{"Time [ms]":>10}   Loaded')
+    for name, statement in IMPORTS.items():
+        try:
+            seconds, loaded = time_import(statement, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f'{name:<24}{"failed":>10}   {e.stderr.strip().splitlines()[-1]}')
+            continue
+        print(f'{name:<24}{1000 * seconds:>10.0f}   {", ".join(loaded) or "-"}')
+
+
+if __name__ == '__main__':
+    main()
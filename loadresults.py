@@ -1,8 +1,14 @@
+from datetime import datetime
+import argparse
+import json
 import sys
 import matplotlib.pyplot as plt
 
 
-from pythion._routines.grid_search import load_gridsearch_result, Heatmap
+from srcMAX.pythionMAX._routinesMAX.grid_searchMAX import load_gridsearch_result
+from srcMAX.pythionMAX._routinesMAX.heatmapMAX import Heatmap
+from srcMAX.pythionMAX._routinesMAX.results_storeMAX import ResultsStore
+from srcMAX.pythionMAX._routinesMAX.run_archiveMAX import RunArchive
 
 
 def read_yesno(prompt: str, default: bool):
@@ -43,12 +49,51 @@ def read_int(prompt, default):
             print('Did not understand. Please enter an integer, or leave blank for default')
 
 
-if len(sys.argv) < 2:
-    input('No file selected, press enter to exit.')
-    exit(0)
-
-
-filename = sys.argv[1]
+def parse_parameter(text: str) -> tuple[str, object]:
+    key, value = text.split('=', 1)
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+# Call with a result file, or look up past runs in the index of a results folder, e.g.
+#     python loadresults.py --dir results --name res --since 2024-05-01 --list
+#     python loadresults.py --dir results --param measure_samples=5     (opens the latest matching run)
+#     python loadresults.py --dir results --name res --archive campaign  (adds the matching runs to an archive, and prints the peak of every archived run)
+parser = argparse.ArgumentParser(description='Plot a grid search result.')
+parser.add_argument('file', nargs='?', help='Result file to plot. If left out, the latest run matching the query is plotted')
+parser.add_argument('--dir', default='results', help='Results folder to search')
+parser.add_argument('--name', help='Only runs with this name')
+parser.add_argument('--since', type=datetime.fromisoformat, help='Only runs started at or after this time (e.g. 2024-05-01T12:00)')
+parser.add_argument('--until', type=datetime.fromisoformat, help='Only runs started at or before this time')
+parser.add_argument('--param', type=parse_parameter, action='append', default=[], metavar='KEY=VALUE', help='Only runs with this parameter value')
+parser.add_argument('--list', action='store_true', help='List the matching runs instead of plotting')
+parser.add_argument('--reindex', action='store_true', help='First add result files that are missing from the index')
+parser.add_argument('--archive', metavar='DIR', help='Add the matching runs to this run archive and list the peak of every archived run')
+args = parser.parse_args()
+
+filename = args.file
+if filename is None:
+    store = ResultsStore(args.dir)
+    if args.reindex:
+        print(f'Added {store.reindex()} files to the index')
+    runs = store.find(args.name, args.since, args.until, **dict(args.param))
+    if args.archive:
+        archive = RunArchive(args.archive)
+        print(f'Archived {len(archive.import_store(store, name=args.name, since=args.since, until=args.until, **dict(args.param)))} runs')
+        for archived, peak, position in archive.peaks():
+            print(f'{archived.created}  {archived.id:40} peak {peak} at {dict(zip(archived.labels, position))}')
+        sys.exit(0)
+    if args.list:
+        for run in runs:
+            print(f'{run.created}  {run.file:40} shape={run.shape} {run.parameters} {run.info}')
+        sys.exit(0)
+    if not runs:
+        input('No matching run found, press enter to exit.')
+        sys.exit(0)
+    filename = store.full_path(runs[-1])
+    print(f'Plotting {filename}')
 
 color_min = read_float('Minimum value of color scale', 1)
 color_max = read_float('Maximum value of color scale', 1000)
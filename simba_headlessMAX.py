@@ -0,0 +1,117 @@
+"""
+Runs the SIMBA grid search without the GUI, e.g. for overnight scans on a machine without a display.
+The scan is configured by the same config file as simbaMAX.py, and the results are written to the results folder
+in the same format.
+
+    python simba_headlessMAX.py [--config configMAX.txt] [--demo] [--plan plan.json] [--dry-run]
+"""
+from contextlib import ExitStack
+from types import FrameType
+import argparse
+import logging
+import signal
+import sys
+
+from srcMAX.pythionMAX._configMAX import ConfigError, load_config
+from srcMAX.pythionMAX._connectionsMAX.calibrationMAX import LinearCalibration
+from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import OutputInterface, MockOutput
+from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput, MockBufferInput
+from srcMAX.pythionMAX._connectionsMAX.rs3000_outputMAX import RS3000Output, PowerOptions
+from srcMAX.pythionMAX._connectionsMAX.rbd_inputMAX import RBDInput
+from srcMAX.pythionMAX._routinesMAX.headlessMAX import HeadlessGridSearch
+from srcMAX.pythionMAX._routinesMAX.file_handlingMAX import FileSettings
+
+logger = logging.getLogger('pythion')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run the SIMBA grid search without the GUI.')
+    parser.add_argument('--config', default='configMAX.txt', help='SIMBA config file')
+    parser.add_argument('--demo', action='store_true', help='Use mock devices instead of the hardware')
+    parser.add_argument('--plan', metavar='FILE', help='Save the scan plan (every step with its values and waits) as JSON')
+    parser.add_argument('--dry-run', action='store_true', help='Only check the scan plan and print the estimated duration')
+    args = parser.parse_args()
+    try:
+        config = load_config(args.config)
+    except ConfigError as e:
+        sys.exit(str(e))
+
+    cal = LinearCalibration(35)
+    velocity_filter: OutputInterface
+    magnet: OutputInterface
+    current: BufferInput
+    if args.demo:
+        velocity_filter = MockOutput(control_limit=10, target_limit=config.velocity_maxvoltage, calibration=cal)
+        magnet = MockOutput(target_limit=config.magnet_maxcurrent)
+        current = MockBufferInput(pull_rate=config.current_pullrate, rate=config.current_samplerate)
+    else:
+        velocity_filter = RS3000Output(
+            port=config.port_velocity,
+            control_limit=10,
+            target_limit=config.velocity_maxvoltage,
+            calibration=cal,
+            mode=PowerOptions.VOLTAGE,
+            coalesce_writes=True,
+            feedback_rate=2
+        )
+        magnet = RS3000Output(
+            port=config.port_magnet,
+            target_limit=config.magnet_maxcurrent,
+            mode=PowerOptions.CURRENT,
+            coalesce_writes=True,
+            feedback_rate=2
+        )
+        current = RBDInput(
+            port=config.port_rbd_s,
+            rbd_sample_rate=config.current_samplerate,
+            pull_rate=config.current_pullrate,
+            unit=RBDInput.CurrentUnit.NANO,
+            discard_unstable=config.discard_unstable
+        )
+
+    search = HeadlessGridSearch(
+        HeadlessGridSearch.Device.from_stepsize(magnet, config.magnet_settime, config.magnet_startvalue, config.magnet_endvalue,
+                                                config.magnet_stepsize, label='Magnet [mA]'),
+        HeadlessGridSearch.Device.from_stepsize(velocity_filter, config.velocity_settime, config.velocity_startvalue,
+                                                config.velocity_endvalue, config.velocity_stepsize,
+                                                bidirectional=config.velocity_bidirectional, label='Velocity filter [V]'),
+        input=current,
+        input_label='Sample current [nA]',
+        settings=HeadlessGridSearch.Settings(config.measuring_samples, 1/config.current_pullrate, config.reset_after_gridsearch),
+        file_settings=FileSettings(config.results_filename, './' + config.results_foldername, timestamp=config.results_timestamp),
+        on_progress=lambda done, total: print(f'\r{search.metrics.snapshot()}', end='', flush=True)
+    )
+
+    plan = search.compile()
+    for error in plan.errors:
+        print(f'Warning: {error}')
+    print(f'{plan.n_points} points, estimated duration {plan.estimated_duration:.0f} s')
+    if args.plan:
+        plan.save(args.plan)
+    if args.dry_run:
+        return
+
+    def interrupt(signum: int, frame: FrameType | None) -> None:
+        # The search finishes by itself, so that the devices are reset and the results index is updated.
+        # Pressing Ctrl-C again interrupts the reset as well.
+        print('\nCancelling grid search, press Ctrl-C again to stop immediately')
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        search.cancel()
+
+    with ExitStack() as stack:
+        for device in (velocity_filter, magnet, current):
+            stack.enter_context(device)
+        previous_handler = signal.signal(signal.SIGINT, interrupt)
+        try:
+            search.run()
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+    if search.cancelled:
+        print(f'\nGrid search interrupted, partial results are in {search.filename}')
+        sys.exit(1)
+    print(f'\nGrid search finished, results written to {search.filename}')
+    print(search.metrics.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 import logging
 import os
 
+from srcMAX.pythionMAX._loggingMAX import configure_logging
+
 LOGFOLDER = f'{os.path.expanduser("~")}/.pythion'
 if not os.path.isdir(LOGFOLDER):
     os.makedirs(LOGFOLDER)
 LOGFILE = LOGFOLDER + '/log.txt'
 
-logging.basicConfig(filename=LOGFILE,
-                    format='%(asctime)s %(message)s',
-                    filemode='a')
+# Records are written to the log file by a background thread, see configure_logging
+log_listener = configure_logging(LOGFILE, logging.INFO)
 logger = logging.getLogger('pythion')
-logger.setLevel(logging.INFO)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+from dataclasses import dataclass, fields
+from typing import Any, get_args, get_type_hints
+import ast
+import logging
+import os
+import types
+
+from srcMAX.pythionMAX._connectionsMAX.rbd_inputMAX import RBDInput
+
+# Nothing in this module may depend on Qt: the config is read by both simbaMAX.py and simba_headlessMAX.py.
+
+logger = logging.getLogger('pythion')
+
+
+class ConfigError(ValueError):
+    """
+    A config file that can't be used. problems lists everything that's wrong with it, not only the first thing.
+    """
+    def __init__(self, source: str, problems: list[str]):
+        self.source = source
+        self.problems = problems
+        super().__init__(f'Invalid config {source}:\n' + '\n'.join(f'    {problem}' for problem in problems))
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    The settings of the SIMBA programs, as read from a config file (see configMAX.txt) with load_config. Every
+    field is set by the line with the same key, in any case, e.g. PORT_MAGNET: 'COM5' sets port_magnet.
+    """
+    # Ports
+    port_rbd_a: str
+    port_rbd_s: str
+    port_rbd_fc: str
+    port_velocity: str
+    port_magnet: str
+    port_caen: str
+
+    # Devices
+    magnet_maxcurrent: float
+    velocity_maxvoltage: float
+    current_samplerate: float
+    current_pullrate: float
+    discard_unstable: bool
+    caen_update_rate: float
+
+    # Grid search
+    magnet_settime: float
+    velocity_settime: float
+    measuring_samples: int
+    reset_after_gridsearch: bool
+    magnet_startvalue: int
+    magnet_stepsize: int
+    magnet_endvalue: int
+    velocity_startvalue: int
+    velocity_stepsize: int
+    velocity_endvalue: int
+    velocity_bidirectional: bool
+    plot_every: int | None
+
+    # Heatmap
+    heatmap_scalemin: float
+    heatmap_scalemax: float
+    heatmap_loglimit: float | None
+    heatmap_maxlabels: int
+
+    # Results
+    results_filename: str
+    results_foldername: str
+    results_timestamp: bool
+
+    # Live plot
+    streamplot_refreshrate: float
+    streamplot_timespan: float
+    streamplot_fixscale: bool
+
+    @classmethod
+    def parse(cls, text: str, source: str = '<config>') -> Config:
+        """
+        Read a config from the text of a config file: one KEY: value line per setting, where value is a Python
+        literal (a number, a quoted string, True, False or None), followed by an optional # comment.
+        Raises ConfigError, listing all problems, if a line can't be read, a key is missing, a value has the wrong
+        type, or the settings don't fit together (see validate).
+        """
+        schema = _schema(cls)
+        values: dict[str, Any] = {}
+        seen: set[str] = set()  # Keys with a line, also if its value couldn't be used
+        problems: list[str] = []
+        for number, line in enumerate(text.splitlines(), start=1):
+            code = line.split('#', 1)[0].strip()
+            if not code:
+                continue
+            key, separator, value_string = code.partition(':')
+            name = key.strip().lower()
+            if not separator or not name.isidentifier():
+                problems.append(f'line {number}: expected KEY: value, got "{code}"')
+                continue
+            seen.add(name)
+            try:
+                value = ast.literal_eval(value_string.strip())
+            except (ValueError, SyntaxError):
+                problems.append(f'line {number}: {key.strip()} must be a number, a quoted string, True, False or None, got "{value_string.strip()}"')
+                continue
+            if name not in schema:
+                logger.warning('Config:         %s line %d: unknown key %s, ignoring it', source, number, key.strip())
+                continue
+            if not _has_type(value, schema[name]):
+                problems.append(f'line {number}: {key.strip()} must be {_describe(schema[name])}, got {value!r}')
+                continue
+            values[name] = value
+        problems.extend(f'{name.upper()} is missing' for name in schema if name not in seen)
+        if problems:
+            raise ConfigError(source, problems)
+        config = cls(**values)
+        problems = config.validate()
+        if problems:
+            raise ConfigError(source, problems)
+        return config
+
+    def validate(self) -> list[str]:
+        """
+        Problems with settings that have the right type, but not sensible values or don't fit together.
+        """
+        problems: list[str] = []
+        for name in ('current_samplerate', 'current_pullrate', 'caen_update_rate', 'streamplot_refreshrate',
+                     'streamplot_timespan', 'magnet_maxcurrent', 'velocity_maxvoltage'):
+            if getattr(self, name) <= 0:
+                problems.append(f'{name.upper()} must be positive, got {getattr(self, name)}')
+        if self.current_samplerate > RBDInput.MAX_SAMPLE_RATE:
+            problems.append(f'CURRENT_SAMPLERATE can be at most {RBDInput.MAX_SAMPLE_RATE} Hz, got {self.current_samplerate}')
+        if 0 < self.current_pullrate < RBDInput.min_pull_rate(self.current_samplerate):
+            problems.append(f'CURRENT_PULLRATE {self.current_pullrate} Hz is too low for CURRENT_SAMPLERATE {self.current_samplerate} Hz: '
+                            f'the samples sent between two reads overflow the {RBDInput.BUFFER_CAPACITY} byte USB buffer. '
+                            f'Pull at least {RBDInput.min_pull_rate(self.current_samplerate):.3g} times per second.')
+
+        for name in ('magnet_settime', 'velocity_settime'):
+            if getattr(self, name) < 0:
+                problems.append(f'{name.upper()} can\'t be negative, got {getattr(self, name)}')
+        if self.measuring_samples < 1:
+            problems.append(f'MEASURING_SAMPLES must be at least 1, got {self.measuring_samples}')
+        if self.plot_every is not None and self.plot_every < 0:
+            problems.append(f'PLOT_EVERY can\'t be negative, got {self.plot_every}')
+        for device in ('magnet', 'velocity'):
+            start, step, end = (getattr(self, f'{device}_{name}') for name in ('startvalue', 'stepsize', 'endvalue'))
+            if step == 0:
+                problems.append(f'{device.upper()}_STEPSIZE can\'t be 0')
+            elif (end - start) * step < 0:
+                problems.append(f'{device.upper()}_STEPSIZE {step} doesn\'t lead from {device.upper()}_STARTVALUE {start} to '
+                                f'{device.upper()}_ENDVALUE {end}')
+
+        if self.heatmap_scalemin >= self.heatmap_scalemax:
+            problems.append(f'HEATMAP_SCALEMIN ({self.heatmap_scalemin}) must be less than HEATMAP_SCALEMAX ({self.heatmap_scalemax})')
+        if self.heatmap_loglimit is not None and self.heatmap_loglimit < 0:
+            problems.append(f'HEATMAP_LOGLIMIT can\'t be negative, got {self.heatmap_loglimit}')
+        if self.heatmap_maxlabels < 1:
+            problems.append(f'HEATMAP_MAXLABELS must be at least 1, got {self.heatmap_maxlabels}')
+        return problems
+
+
+# Parsed configs by absolute path, with the modification time and size of the file they were parsed from
+_cache: dict[str, tuple[tuple[int, int], Config]] = {}
+
+
+def load_config(filename: str) -> Config:
+    """
+    Read and validate a config file, see Config.parse. The parsed config is kept until the file changes, so
+    loading the same file again is only a stat call.
+    """
+    path = os.path.abspath(filename)
+    status = os.stat(path)
+    stamp = (status.st_mtime_ns, status.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, 'r') as file:
+        config = Config.parse(file.read(), filename)
+    _cache[path] = (stamp, config)
+    return config
+
+
+def _schema(cls: type) -> dict[str, Any]:
+    hints = get_type_hints(cls)
+    return {field.name: hints[field.name] for field in fields(cls)}
+
+
+def _has_type(value: Any, expected: Any) -> bool:
+    if isinstance(expected, types.UnionType):
+        return any(_has_type(value, option) for option in get_args(expected))
+    if isinstance(value, bool):
+        return expected is bool  # bool is a subclass of int, but True is no number of samples
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def _describe(expected: Any) -> str:
+    if isinstance(expected, types.UnionType):
+        return ' or '.join(_describe(option) for option in get_args(expected))
+    return {str: 'a quoted string', int: 'an integer', float: 'a number', bool: 'True or False', type(None): 'None'}[expected]
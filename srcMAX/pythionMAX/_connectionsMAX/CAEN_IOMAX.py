@@ -1,154 +1,443 @@
 from __future__ import annotations
-from typing import Self
+from typing import Self, Any, Callable, ClassVar, Iterable
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+from enum import Enum
+import threading
 import logging
-import re
+import time
 
-from threading import Timer
+from srcMAX.pythionMAX._connectionsMAX.calibrationMAX import Calibration
+from srcMAX.pythionMAX._connectionsMAX.usbMAX import USBConnection, USBConnectionException
+from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput
+from srcMAX.pythionMAX._connectionsMAX.write_queueMAX import CoalescingWriter
+from srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX import CAENCommandError, CAENValue, build_command, parse_reply
 
 logger = logging.getLogger('pythion')
 
-from srcMAX.pythionMAX._connectionsMAX.calibrationMAX import Calibration
-from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import OutputInterface
-from srcMAX.pythionMAX._connectionsMAX.usbMAX import USBConnection
-from srcMAX.pythionMAX._connectionsMAX.input_interfaceMAX import TimerInput
-from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput
-from typing import TypeGuard
+
+class PollTier(Enum):
+    """
+    How often a CAEN parameter needs to be monitored:
+          - (FAST)      Readings and status bits, which change on their own. Polled on every monitoring pass.
+          - (SLOW)      Setpoints and configuration, which only change when someone sets them. Polled now and then.
+          - (STATIC)    Board info and hardware limits. Read once and cached until the next successful SET.
+    """
+    FAST = 1
+    SLOW = 2
+    STATIC = 3
+
+
+def _resolve(future: Future[Any], result: Any = None, exception: BaseException | None = None) -> None:
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+@dataclass
+class _Request:
+    message: bytes
+    par: str | None = None
+    count: int | None = None  # Number of values the reply should have, if known
+    future: Future[list[CAENValue]] = field(default_factory=Future)
+    deadline: float = 0
+
+
+class CAENCommandEngine:
+    """
+    Sends commands to a CAEN power supply from a background thread and matches each reply to its request.
+    The device answers every command with exactly one '#BD:..' line, in the order the commands were received,
+    so replies are matched first-in-first-out. Commands are written as soon as there's room, keeping up to
+    max_in_flight commands on the line at once; this hides the round trip latency of the 9600 baud link when
+    the device allows it. Set max_in_flight to 1 for strict request-reply behaviour.
+
+    Every submitted command returns a Future, which resolves to the parsed reply values or fails with a
+    CAENCommandError (the device rejected the command) or TimeoutError (no reply within timeout seconds).
+    When a reply is late, the FIFO matching can no longer be trusted, so all commands in flight are failed
+    and the input buffer is cleared before carrying on.
+    """
+    _queue: deque[_Request]
+    _in_flight: deque[_Request]
+    _thread: threading.Thread | None
+
+    def __init__(self,
+                 send: Callable[[bytes], None],
+                 readline: Callable[[], str],
+                 *,
+                 max_in_flight: int = 1,
+                 timeout: float = 1.0,
+                 reset_input: Callable[[], None] | None = None,
+                 name: str = 'CAENCommandEngine'):
+        """
+        send writes one encoded command to the device. readline returns one complete reply line, or an empty string if
+        no complete line arrived within a short time (it must not block much longer than that, since timeouts are checked in between).
+        reset_input, if given, is called to discard unread input after a timeout.
+        """
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+        self._send = send
+        self._readline = readline
+        self._reset_input = reset_input
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.name = name
+        self._queue = deque()
+        self._in_flight = deque()  # Only touched by the engine thread
+        self._stopping = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stop the engine thread. Commands that haven't been answered yet are cancelled.
+        """
+        with self._condition:
+            self._stopping = True
+            thread = self._thread
+            self._condition.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def submit(self, message: bytes, par: str | None = None, count: int | None = None) -> Future[list[CAENValue]]:
+        """
+        Queue a command (see CAEN_protocolMAX.build_command). par is the parameter, used for typing the reply values,
+        and count the number of values the reply must have (see CAEN_protocolMAX.parse_reply).
+        """
+        request = _Request(message, par, count)
+        with self._condition:
+            if self._thread is None:
+                _resolve(request.future, exception=USBConnectionException(f'{self.name} is not running'))
+                return request.future
+            self._queue.append(request)
+            self._condition.notify_all()
+        return request.future
+
+    def submit_many(self, messages: Iterable[tuple[bytes, str | None]]) -> list[Future[list[CAENValue]]]:
+        return [self.submit(message, par) for message, par in messages]
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._stopping or bool(self._queue) or bool(self._in_flight))
+                    if self._stopping:
+                        break
+                    to_send: list[_Request] = []
+                    while self._queue and len(self._in_flight) + len(to_send) < self.max_in_flight:
+                        to_send.append(self._queue.popleft())
+                for request in to_send:
+                    self._send_request(request)
+                if self._in_flight:
+                    self._receive()
+        finally:
+            with self._condition:
+                pending = list(self._in_flight) + list(self._queue)
+                self._in_flight.clear()
+                self._queue.clear()
+                self._thread = None
+            for request in pending:
+                request.future.cancel()
+                _resolve(request.future, exception=USBConnectionException(f'{self.name} was stopped'))
+
+    def _send_request(self, request: _Request) -> None:
+        if not request.future.set_running_or_notify_cancel():
+            return  # Cancelled while waiting in the queue
+        try:
+            self._send(request.message)
+        except Exception as e:
+            _resolve(request.future, exception=e)
+            return
+        request.deadline = time.monotonic() + self.timeout
+        self._in_flight.append(request)
+
+    def _receive(self) -> None:
+        try:
+            line = self._readline()
+        except Exception as e:
+            logger.warning('CAENCommandEngine: Could not read reply: %s', e)
+            line = ''
+        if line.strip():
+            reply = line.strip()
+            if not reply.startswith('#BD:'):
+                logger.warning('CAENCommandEngine: Ignoring unexpected line %r', reply)
+                return
+            request = self._in_flight.popleft()
+            try:
+                _resolve(request.future, parse_reply(reply, request.par, request.count))
+            except CAENCommandError as e:
+                logger.warning('CAENCommandEngine: %r failed: %s', request.message, reply)
+                _resolve(request.future, exception=e)
+        elif self._in_flight[0].deadline < time.monotonic():
+            logger.warning('CAENCommandEngine: No reply to %r, dropping %d command(s) in flight.',
+                           self._in_flight[0].message, len(self._in_flight))
+            while self._in_flight:
+                request = self._in_flight.popleft()
+                _resolve(request.future, exception=TimeoutError(f'No reply to {request.message!r}'))
+            if self._reset_input is not None:
+                self._reset_input()
+
 
 class CAENOutput(USBConnection, BufferInput):
     """
     Specialization of the Output class for a CAEN R1419ET HV power supply.
-    
-    Each parameter
+
+    All communication goes through a CAENCommandEngine, so commands can be sent from any thread. Use command
+    (returns a Future) or monitor (blocks until a batch of values has arrived) rather than writing to the port.
+    Setpoints that are changed often, such as from a slider, should be written with set_setpoint, which only
+    sends values that differ from what the device last acknowledged.
 
     PARAMETERS:
-        port: str                   - The COM port which the power supply is connected to. 
+        port: str                   - The COM port which the power supply is connected to.
+        bd: int                     - Board number, 0 unless several devices are daisy chained.
+        max_in_flight: int          - Number of commands that may be sent before the first one is answered.
+        timeout: float              - Seconds to wait for a reply before failing a command.
     """
+    POLL_TIERS: ClassVar[dict[str, PollTier]] = {
+        **dict.fromkeys(['VMON', 'IMON', 'STAT', 'BDILK', 'BDALARM'], PollTier.FAST),
+        **dict.fromkeys(['VSET', 'ISET', 'MAXV', 'RUP', 'RDW', 'TRIP', 'PDWN', 'IMRANGE', 'BDILKM', 'BDCTR', 'BDTERM'], PollTier.SLOW),
+        **dict.fromkeys(['VMIN', 'VMAX', 'VDEC', 'IMIN', 'IMAX', 'ISDEC', 'IMDEC', 'MVMIN', 'MVMAX', 'MVDEC',
+                         'RUPMIN', 'RUPMAX', 'RUPDEC', 'RDWMIN', 'RDWMAX', 'RDWDEC', 'TRIPMIN', 'TRIPMAX', 'TRIPDEC',
+                         'BDNAME', 'BDNCH', 'BDFREL', 'BDSNUM', 'POL'], PollTier.STATIC)
+    }
+    ALL_CHANNELS: ClassVar[int] = 4
+    CHANNELS: ClassVar[int] = 4  # A MON on ALL_CHANNELS is answered with one value per channel
+    READ_TIMEOUT: ClassVar[float] = 0.05  # Serial read timeout while waiting for replies
+
+    _static_cache: dict[tuple[int | None, str], list[CAENValue]]
+    _shadow: dict[tuple[int | None, str], CAENValue]
 
-    def __init__(self, *, 
+    def __init__(self, *,
                  port: str | None,
                  calibration: Calibration | None = None,
-                 bd: str | None = 0,
-                 pullRate: int | None = None
+                 bd: int | str | None = 0,
+                 pullRate: int | None = None,
+                 max_in_flight: int = 1,
+                 timeout: float = 1.0
                  ):
-        
-        self.bd = bd
+
+        self.bd = int(bd) if bd is not None else 0
         BAUD_RATE = 9600
         USBConnection.__init__(
             self,
             port=port,
             baud_rate=BAUD_RATE,
-            eol_char= ' \r \n',
+            eol_char=' \r \n',
             xon_xoff=True
             )
         BufferInput.__init__(self, pull_rate=pullRate)
+        self.engine = CAENCommandEngine(self.write_bytes, self._readline, max_in_flight=max_in_flight, timeout=timeout,
+                                        reset_input=self._reset_input, name=f'CAEN BD:{self.bd:02d}')
+        self._received = b''  # Start of a reply line that hasn't fully arrived yet
+        self._static_cache = {}
+        self._shadow = {}  # Last acknowledged value of every parameter set through this interface
+        self._cache_lock = threading.Lock()
+        self._setpoints = CoalescingWriter(self._write_setpoint, name=f'CAEN BD:{self.bd:02d} setpoints')
 
-    def __enter__(self)-> Self:
+    def __enter__(self) -> Self:
         super().__enter__()
-        self._write(bd=self.bd, cmd='MON', par='BDSNUM')
+        if self.ser is not None:
+            self.ser.timeout = self.READ_TIMEOUT
+        self._received = b''
+        self.invalidate_static()
+        with self._cache_lock:
+            self._shadow.clear()  # Whatever the device is set to, it wasn't acknowledged to us
+        self.engine.start()
+        self.command('MON', 'BDSNUM').add_done_callback(self._log_serial_number)
         return self
-    
-    def __exit__(self, *args: logging.Any) -> None:
-        self._write(self.bd, cmd='SET', ch=4, par='off') #Turns of all channels before disconnect. 
+
+    def __exit__(self, *args: Any) -> None:
+        self._setpoints.close(flush=False)
+        try:
+            self.command('SET', 'OFF', ch=self.ALL_CHANNELS).result(self.engine.timeout)  # Turns of all channels before disconnect.
+        except Exception as e:
+            logger.warning(f'CAENOutput:     Could not turn off channels before disconnecting: {e}')
+        self.engine.stop()
         super().__exit__(*args)
 
-    def parse_response_string(self, msg:str) -> list[float|str] | None:
+    def command(self, cmd: str, par: str, val: CAENValue | None = None, ch: int | None = None) -> Future[list[CAENValue]]:
+        """
+        Queue a command and return a Future of the reply values. Invalid commands fail the Future with ValueError.
+        See CAEN_protocolMAX for the message format.
+        """
         try:
-            original_message: str = msg.strip()
-            if not bool(re.match(r'^#BD:\d{2},\w{2,3}:\w{2,3}(|(,VAL:(\S|(\w+\.*\w+;?){1,4})))$', original_message)): #regex101.com is a lifesaver
-                logger.warning(f"CAENOutput:       Cannot interpret the line '{original_message}' as it doesn't fit pattern.")
-                return None
-
-            split_message: list[str] = original_message.split(',')
-            msg_end: str = split_message[-1]
-
-            if msg_end[-3:] == 'ERR':
-                err_par: str = msg_end.split(':')[0]
-                logger.warning(f"CAENOutput:       CAEN error. error parameter {err_par}. See documentation")
-                return None
-            
-            if msg_end == 'CMD:OK':
-                logger.debug(f"CAENOutput:         Interpreted {original_message} as OK")
-                return None
-            
-            res: list[float|str] = msg_end[3:].split(';')
-            for index, item in enumerate(res):
-                if bool(re.match(r"^\d+\.*\d*", item)):
-                    res[index] = int(item)
-                elif bool(re.match(r"^\d+\.*\d*", item)):
-                    res[index] = float(item)
-
-            logger.debug(f"CAENOutput:         Interpreted {original_message} as OK, returned {res}")
-            return res
-            
-
-        except (ValueError, AssertionError, IndexError):
-            logger.warning(f"CAENOutput:       Unexpected error when the line '{msg.strip()}' was parsed.")
-            return None
-
-    def _write(self, cmd: str, par: str, val: int|str|None = None, ch: int|None = None, bd = 0) -> None:
-        """
-        Message is of shape " $BD:**,CMD:***,CH*,PAR:***,VAL:***.**\r \n"
-
-            BD:         [0, 31]         | "board"       |   Should always be 0 if there are not multiple daisy chained CAEN devices. \n
-            CDM:        {'MON', 'SET'}  | "command"     |   MON -> Monitor & SET -> set. \n
-            CH:         [0, 3]          | "channel"     |   For the R1419ET CH_max = 3 for other hardware it might be 7. \n
-            PAR:        {see init}      | "parameter"   |   See documentation for all possible, see init for all avaliable. \n
-            VAL:        ###             | "value"       |   compatible numerical value.
-        
-        when MON: VAL = ''.
-
-        """        
-        msg = '$BD:'
-        parlist = ['VSET', 'VMIN', 'VMAX', 'VDEC', 'VMON', 
-                    'ISET', 'IMIN', 'IMAX', 'ISDEC', 'IMON', 'IMRANGE', 'IMDEC',
-                    'MAXV', 'MVMIN', 'MVMAX', 'MVDEC', 
-                    'RUP', 'RUPMIN', 'RUPMAX', 'RUPDEC', 
-                    'RDW', 'RDWMIN', 'RDWMAX', 'RDWDEC',
-                    'TRIP', 'TRIPMIN', 'TRIPMAX', 'TRIPDEC',
-                    'BDNAME', 'BDNCH', 'BDFREL', 'BDSNUM', 'BDILK', 'BDILKM', 'BDCTR', 'BDTERM', 'BDALARM',
-                    'PDDW', 'POL', 'STAT'#, 'ZSDTC', 'ZCADJ'    ### These are not avalible on the R1419ET
-                    ]
-
-        #
-        msg = msg + '0' + str(bd) + ',CMD:'
-
-        #
-        match cmd:
-            case 'MON':
-                msg = msg + 'MON'
-            case 'SET':
-                msg = msg + 'SET'
-            case _:
-                logger.exception(f"CAEN:         Invalid command: {cmd}.")
-        
-        #
-        if ch is not None:
-            msg = msg + ',CH:' + str(ch)
-        
-        #
-        if par not in parlist:
-            logger.exception(f"CAEN:         Invalid parameter: {par}.")
+            message = build_command(self.bd, cmd, par, val, ch)
+        except ValueError as e:
+            future: Future[list[CAENValue]] = Future()
+            future.set_exception(e)
+            return future
+        count = (self.CHANNELS if ch == self.ALL_CHANNELS else 1) if cmd == 'MON' else None
+        future = self.engine.submit(message, par, count)
+        if cmd == 'SET':
+            future.add_done_callback(lambda f: self._on_set_done(f, par, val, ch))
+        elif cmd == 'MON':
+            future.add_done_callback(lambda f: self._on_monitor_done(f, par, ch))
+        return future
+
+    def set_setpoint(self, par: str, val: CAENValue, ch: int | None = None) -> bool:
+        """
+        Set a parameter in the background, skipping the write if the device has already acknowledged the same value.
+        While a write is waiting, newer values for the same parameter and channel replace it, so dragging a slider
+        doesn't build up a queue of stale commands. Returns False if the value equals the acknowledged one.
+        """
+        self._setpoints.put((ch, par), val)
+        return not self._is_acknowledged(par, val, ch)
+
+    def acknowledged(self, par: str, ch: int | None = None) -> CAENValue | None:
+        """
+        The last value of the parameter that the device confirmed with CMD:OK, or None if it's not known.
+        """
+        with self._cache_lock:
+            return self._shadow.get((ch, par))
+
+    def flush_setpoints(self, timeout: float | None = None) -> bool:
+        """
+        Block until every pending setpoint has been written. Returns False if the timeout ran out first.
+        """
+        return self._setpoints.flush(timeout)
+
+    def monitor(self, pars: Iterable[str], ch: int | None = None, timeout: float | None = None) -> dict[str, list[CAENValue]]:
+        """
+        Monitor several parameters in one batch. All commands are queued at once, so they are pipelined by the engine.
+        STATIC parameters are answered from the cache when possible.
+        Returns the values of every parameter that could be read (parameters that failed are left out and logged).
+        """
+        results = {}
+        futures = {}
+        for par in pars:
+            with self._cache_lock:
+                cached = self._static_cache.get((ch, par))
+            if cached is not None:
+                results[par] = cached
+            else:
+                futures[par] = self.command('MON', par, ch=ch)
+        for par, future in futures.items():
+            try:
+                results[par] = future.result(timeout)
+            except Exception as e:
+                logger.warning(f'CAENOutput:     Could not monitor {par}: {e}')
+                continue
+            if self.poll_tier(par) is PollTier.STATIC:
+                with self._cache_lock:
+                    self._static_cache[(ch, par)] = results[par]
+        return results
+
+    @classmethod
+    def poll_tier(cls, par: str) -> PollTier:
+        return cls.POLL_TIERS.get(par, PollTier.SLOW)
+
+    def invalidate_static(self) -> None:
+        """
+        Forget the cached STATIC values, so that they are read from the device again on the next monitor call.
+        """
+        with self._cache_lock:
+            self._static_cache.clear()
+
+    def _on_set_done(self, future: Future[list[CAENValue]], par: str, val: CAENValue | None, ch: int | None) -> None:
+        # A SET is done after every MON that was queued before it, so no stale value can be cached after this
+        if future.cancelled() or future.exception() is not None:
             return
-        else:
-            msg = msg + ',PAR:' + str(par)
-        
-        #
+        self.invalidate_static()
         if val is not None:
-            msg = msg + ',' + str(val)
+            with self._cache_lock:
+                if ch == self.ALL_CHANNELS:
+                    for channel in range(self.CHANNELS):
+                        self._shadow[(channel, par)] = val
+                else:
+                    self._shadow.pop((self.ALL_CHANNELS, par), None)  # The channels may differ now
+                self._shadow[(ch, par)] = val
+
+    def _on_monitor_done(self, future: Future[list[CAENValue]], par: str, ch: int | None) -> None:
+        # Setpoints can be changed behind our back (front panel, another program), and then the device is the one that's right
+        if future.cancelled() or future.exception() is not None:
+            return
+        channels = range(self.CHANNELS) if ch == self.ALL_CHANNELS else [ch]
+        with self._cache_lock:
+            for channel, value in zip(channels, future.result()):
+                shadowed = self._shadow.get((channel, par))
+                if shadowed is not None and not self._same_value(shadowed, value):
+                    self._shadow[(channel, par)] = value
+                    self._shadow.pop((self.ALL_CHANNELS, par), None)
 
-        self.write(message=msg)
-        #print(msg)
-        
-    def _read_from_device(self) -> list[float, str]:
-        generator = (self.parse_response_string(str) for str in self.read_newlines())
+    def _is_acknowledged(self, par: str, val: CAENValue, ch: int | None) -> bool:
+        acknowledged = self.acknowledged(par, ch)
+        return acknowledged is not None and self._same_value(acknowledged, val)
+
+    @staticmethod
+    def _same_value(a: CAENValue, b: CAENValue) -> bool:
+        try:
+            return float(a) == float(b)
+        except (TypeError, ValueError):
+            return str(a) == str(b)
+
+    def _write_setpoint(self, key: tuple[int | None, str], val: CAENValue) -> None:
+        ch, par = key
+        if self._is_acknowledged(par, val, ch):
+            return
+        self.command('SET', par, val, ch).result()
+
+    def _write(self, cmd: str, par: str, val: CAENValue | None = None, ch: int | None = None, bd: Any = None) -> None:
+        """
+        Fire-and-forget version of command, kept for compatibility. Failures are logged.
+        """
+        self.command(cmd, par, val, ch).add_done_callback(self._log_failure)
+
+    def _read_from_device(self) -> list[float]:
+        # Replies are consumed by the command engine, they can't be read as an input stream
+        return []
+
+    def _readline(self) -> str:
+        # A read can time out halfway through a reply (at 9600 baud every byte takes about 1 ms), and then returns
+        # what has arrived so far. That part waits here until the rest of the line is read, so that the engine only
+        # ever gets complete replies.
+        if b'\n' not in self._received:
+            if self.ser is None:
+                time.sleep(self.READ_TIMEOUT)
+                return ''
+            self._received = self._received + self.ser.read_until()
+        line, newline, rest = self._received.partition(b'\n')
+        if not newline:
+            return ''
+        self._received = rest
+        return (line + newline).decode(errors='replace')
+
+    def _reset_input(self) -> None:
+        self._received = b''
+        if self.ser is not None:
+            self.ser.reset_input_buffer()
+
+    @staticmethod
+    def _log_failure(future: Future[list[CAENValue]]) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f'CAENOutput:     Command failed: {future.exception()}')
+
+    @staticmethod
+    def _log_serial_number(future: Future[list[CAENValue]]) -> None:
+        if not future.cancelled() and future.exception() is None:
+            logger.info(f'CAENOutput:     Connected to board with serial number {future.result()}')
+        else:
+            CAENOutput._log_failure(future)
 
-        def check_value(x: float|str|None) -> TypeGuard[float|str]:
-            return x is not None
 
-        return list(filter(check_value, generator))
-    
 def main():
     pass
 
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
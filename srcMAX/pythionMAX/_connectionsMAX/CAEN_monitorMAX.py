@@ -0,0 +1,151 @@
+from __future__ import annotations
+from typing import Callable, Iterable
+import threading
+import logging
+import time
+
+from srcMAX.pythionMAX._connectionsMAX.CAEN_IOMAX import CAENOutput, PollTier
+from srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX import CAENValue
+from srcMAX.pythionMAX._connectionsMAX.input_interfaceMAX import MockCAEN
+
+logger = logging.getLogger('pythion')
+
+# (channel, parameter), channel is None for board parameters
+CAENKey = tuple[int | None, str]
+
+
+class CAENMonitor:
+    """
+    Polls a CAEN power supply on a background thread and keeps a thread-safe snapshot of the latest values.
+    Every pass monitors the channel parameters for all channels at once (CH:4) and then the board parameters,
+    so that the GUI thread never waits for the serial link.
+
+    Parameters are polled according to their CAENOutput.poll_tier: FAST parameters on every pass, SLOW parameters
+    on every slow_every:th pass, and STATIC parameters on every pass too, but those are answered from the
+    interface's cache without touching the link.
+
+    Change handlers are called from the monitor thread with a dict of only the values that changed since the
+    previous pass. GUI code should forward them through a Qt signal, which queues them to the main thread.
+    """
+    CHANNEL_PARAMETERS = ['VMON', 'IMON', 'STAT', 'VSET', 'ISET', 'MAXV', 'RUP', 'RDW', 'TRIP', 'PDWN', 'IMRANGE', 'POL']
+    BOARD_PARAMETERS = ['BDILK', 'BDALARM', 'BDILKM', 'BDCTR', 'BDTERM']
+
+    _snapshot: dict[CAENKey, CAENValue]
+    _handlers: list[Callable[[dict[CAENKey, CAENValue]], None]]
+    _thread: threading.Thread | None
+
+    def __init__(self,
+                 interface: CAENOutput | MockCAEN,
+                 rate: float,
+                 channel_parameters: Iterable[str] | None = None,
+                 board_parameters: Iterable[str] | None = None,
+                 slow_every: int = 10,
+                 timeout: float = 5):
+        """
+        rate is the number of passes per second. A pass that takes longer than 1/rate is followed by the next one
+        right away. SLOW parameters are included in every slow_every:th pass (starting with the first).
+        timeout is the longest time to wait for the replies of a single pass.
+        """
+        if rate <= 0:
+            raise ValueError('Rate must be positive')
+        self.interface = interface
+        self.rate = rate
+        self.channel_parameters = list(self.CHANNEL_PARAMETERS if channel_parameters is None else channel_parameters)
+        self.board_parameters = list(self.BOARD_PARAMETERS if board_parameters is None else board_parameters)
+        self.slow_every = slow_every
+        self.timeout = timeout
+        self._passes = 0
+        self._snapshot = {}
+        self._handlers = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def add_change_handler(self, handler: Callable[[dict[CAENKey, CAENValue]], None]) -> None:
+        self._handlers.append(handler)
+
+    def remove_change_handler(self, handler: Callable[[dict[CAENKey, CAENValue]], None]) -> None:
+        self._handlers.remove(handler)
+
+    def snapshot(self) -> dict[CAENKey, CAENValue]:
+        """
+        Copy of the latest known values.
+        """
+        with self._lock:
+            return dict(self._snapshot)
+
+    def get(self, par: str, ch: int | None = None) -> CAENValue | None:
+        with self._lock:
+            return self._snapshot.get((ch, par))
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop_event = threading.Event()  # A fresh event, so that a thread that's still stopping stays stopped
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,), name='CAENMonitor', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = False) -> None:
+        self._stop_event.set()
+        thread = self._thread
+        self._thread = None
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def clear(self) -> None:
+        """
+        Forget all values, so that every value is polled and reported as changed on the next pass.
+        """
+        with self._lock:
+            self._snapshot.clear()
+            self._passes = 0
+
+    def poll(self, full: bool = False) -> dict[CAENKey, CAENValue]:
+        """
+        Run one monitoring pass right away, update the snapshot and notify the change handlers.
+        If full is True, SLOW parameters are polled regardless of the pass count.
+        Returns the changed values.
+        """
+        with self._lock:
+            full = full or self._passes % self.slow_every == 0
+            self._passes = self._passes + 1
+        channel_parameters = self._due(self.channel_parameters, full)
+        board_parameters = self._due(self.board_parameters, full)
+
+        values: dict[CAENKey, CAENValue] = {}
+        if channel_parameters:
+            replies = self.interface.monitor(channel_parameters, ch=CAENOutput.ALL_CHANNELS, timeout=self.timeout)
+            for par, reply in replies.items():
+                for ch, value in enumerate(reply):
+                    values[(ch, par)] = value
+        if board_parameters:
+            replies = self.interface.monitor(board_parameters, timeout=self.timeout)
+            for par, reply in replies.items():
+                if reply:
+                    values[(None, par)] = reply[0]
+
+        with self._lock:
+            changes = {key: value for key, value in values.items() if self._snapshot.get(key) != value}
+            self._snapshot.update(changes)
+        if changes:
+            for handler in self._handlers:
+                handler(changes)
+        return changes
+
+    @staticmethod
+    def _due(pars: list[str], full: bool) -> list[str]:
+        return [par for par in pars if full or CAENOutput.poll_tier(par) is not PollTier.SLOW]
+
+    def _run(self, stop_event: threading.Event) -> None:
+        interval = 1 / self.rate
+        while not stop_event.is_set():
+            start = time.monotonic()
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('CAENMonitor:    Monitoring pass failed.')
+            stop_event.wait(max(0, start + interval - time.monotonic()))
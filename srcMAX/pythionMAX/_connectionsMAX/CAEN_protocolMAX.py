@@ -0,0 +1,126 @@
+from __future__ import annotations
+from functools import lru_cache
+import re
+
+# The CAEN R1419ET serial protocol. Commands are of shape
+#     $BD:**,CMD:***,CH:*,PAR:***,VAL:***.**
+# and every command is answered with one line of shape
+#     #BD:**,CMD:OK[,VAL:***;***;...]     or     #BD:**,***:ERR
+#
+#     BD:         [0, 31]         | "board"       |   Should always be 0 if there are not multiple daisy chained CAEN devices.
+#     CMD:        {'MON', 'SET'}  | "command"     |   MON -> Monitor & SET -> set.
+#     CH:         [0, 4]          | "channel"     |   For the R1419ET CH_max = 3 for other hardware it might be 7. 4 means all channels.
+#     PAR:        {PARAMETERS}    | "parameter"   |   See documentation for all possible, PARAMETERS for all avaliable.
+#     VAL:        ###             | "value"       |   compatible numerical value, only for SET.
+
+COMMANDS = frozenset({'MON', 'SET'})
+PARAMETERS = frozenset({
+    'VSET', 'VMIN', 'VMAX', 'VDEC', 'VMON',
+    'ISET', 'IMIN', 'IMAX', 'ISDEC', 'IMON', 'IMRANGE', 'IMDEC',
+    'MAXV', 'MVMIN', 'MVMAX', 'MVDEC',
+    'RUP', 'RUPMIN', 'RUPMAX', 'RUPDEC',
+    'RDW', 'RDWMIN', 'RDWMAX', 'RDWDEC',
+    'TRIP', 'TRIPMIN', 'TRIPMAX', 'TRIPDEC',
+    'BDNAME', 'BDNCH', 'BDFREL', 'BDSNUM', 'BDILK', 'BDILKM', 'BDCTR', 'BDTERM', 'BDALARM', 'BDCLR',
+    'PDWN', 'POL', 'STAT', 'ON', 'OFF'  # , 'ZSDTC', 'ZCADJ'    ### These are not avalible on the R1419ET
+})
+ERROR_FIELDS = frozenset({'CMD', 'CH', 'PAR', 'VAL', 'LOC'})
+
+# Names of the bits of the status parameters, starting with the least significant bit
+STATUS_BITS = {
+    'STAT': ('ON', 'RUP', 'RDW', 'OVC', 'OVV', 'UNV', 'MAXV', 'TRIP', 'OVP', 'OVT', 'DIS', 'KILL', 'ILK', 'NOCAL'),
+    'BDALARM': ('CH 00', 'CH 01', 'CH 02', 'CH 03', 'PW FAIL', 'OVP', 'HVCKFAIL'),
+}
+
+EOL = b' \r \n'
+
+_REPLY = re.compile(r'#BD:(\d\d),(?:CMD:OK(?:,VAL:(.*))?|(\w+):ERR)')
+_INT = re.compile(r'[+-]?\d+')
+_FLOAT = re.compile(r'[+-]?(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?')
+
+CAENValue = int | float | str
+
+
+class CAENCommandError(Exception):
+    """
+    Raised when the power supply answers a command with an error, e.g. '#BD:00,PAR:ERR'.
+    field is the part of the command that the device complained about (CMD, CH, PAR, VAL or LOC).
+    """
+    def __init__(self, field: str, reply: str):
+        super().__init__(f'CAEN device rejected the command ({field} error): {reply!r}')
+        self.field = field
+        self.reply = reply
+
+
+class StatusBits(int):
+    """
+    Value of a status bitfield (STAT or BDALARM). It's still an int, but the bits can also be looked up by name.
+    """
+    names: tuple[str, ...]
+
+    def __new__(cls, value: int, names: tuple[str, ...]) -> StatusBits:
+        self = super().__new__(cls, value)
+        self.names = names
+        return self
+
+    def __getitem__(self, name: str) -> bool:
+        return bool(self >> self.names.index(name) & 1)
+
+    def as_dict(self) -> dict[str, bool]:
+        return {name: bool(self >> i & 1) for i, name in enumerate(self.names)}
+
+
+def parse_reply(reply: str, par: str | None = None, count: int | None = None) -> list[CAENValue]:
+    """
+    Parse one reply line in a single pass. Returns the list of values (one per channel when monitoring CH:4, empty
+    for a plain CMD:OK), typed as int, float or str. If par is a status parameter, the values are StatusBits.
+    count is the number of values the command should be answered with, if known; a reply with another number of
+    values, e.g. one that was cut off, is rejected.
+    Raises CAENCommandError if the device reported an error or the line couldn't be interpreted.
+    """
+    match = _REPLY.fullmatch(reply.strip())
+    if match is None:
+        raise CAENCommandError('CMD', reply)
+    _, values, error = match.groups()
+    if error is not None:
+        raise CAENCommandError(error if error in ERROR_FIELDS else 'CMD', reply)
+    if count is not None and (0 if values is None else values.count(';') + 1) != count:
+        raise CAENCommandError('VAL', reply)
+    if values is None:
+        return []
+    names = STATUS_BITS.get(par) if par is not None else None
+    if names is not None:
+        try:
+            return [StatusBits(int(value), names) for value in values.split(';')]
+        except ValueError:
+            raise CAENCommandError('VAL', reply)
+    return [_convert(value) for value in values.split(';')]
+
+
+def _convert(value: str) -> CAENValue:
+    if _INT.fullmatch(value):
+        return int(value)
+    if _FLOAT.fullmatch(value):
+        return float(value)
+    return value
+
+
+@lru_cache(maxsize=512)
+def _template(bd: int, cmd: str, par: str, ch: int | None) -> bytes:
+    if cmd not in COMMANDS:
+        raise ValueError(f'Invalid command: {cmd}')
+    if par not in PARAMETERS:
+        raise ValueError(f'Invalid parameter: {par}')
+    channel = '' if ch is None else f',CH:{ch}'
+    return f'$BD:{bd:02d},CMD:{cmd}{channel},PAR:{par}'.encode()
+
+
+def build_command(bd: int, cmd: str, par: str, val: CAENValue | None = None, ch: int | None = None) -> bytes:
+    """
+    The bytes to send for a command, including the line ending. The fixed part of the message is cached, so
+    building a command is just a concatenation. Raises ValueError if the command or parameter is unknown.
+    """
+    template = _template(bd, cmd, par, ch)
+    if val is None:
+        return template + EOL
+    return template + b',VAL:' + str(val).encode() + EOL
@@ -0,0 +1,360 @@
+from __future__ import annotations
+from typing import Any, Callable
+from dataclasses import dataclass
+import threading
+import logging
+import time
+
+from srcMAX.pythionMAX._connectionsMAX.CAEN_IOMAX import CAENOutput
+from srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX import PARAMETERS, STATUS_BITS
+
+logger = logging.getLogger('pythion')
+
+
+class _Error(Exception):
+    def __init__(self, field: str):
+        self.field = field
+
+
+@dataclass
+class SimulatedChannel:
+    """
+    State of one HV channel. Voltages in V, currents in uA, ramp rates in V/s and trip time in s.
+    The load is a plain resistor of load MOhm, so that IMON = VMON / load.
+    """
+    vset: float = 0
+    iset: float = 30
+    maxv: float = 550
+    rup: float = 50
+    rdw: float = 50
+    trip: float = 10
+    pdwn: str = 'KILL'
+    imrange: str = 'HIGH'
+    pol: str = '+'
+    load: float = 20
+    on: bool = False
+    vmon: float = 0
+    tripped: bool = False
+    overcurrent_time: float = 0
+
+    @property
+    def imon(self) -> float:
+        return self.vmon / self.load
+
+    @property
+    def target(self) -> float:
+        return min(self.vset, self.maxv) if self.on else 0
+
+    @property
+    def stat(self) -> int:
+        bits = {
+            'ON': self.on,
+            'RUP': self.vmon < self.target and not self.overcurrent,
+            'RDW': self.vmon > self.target,
+            'OVC': self.overcurrent,
+            'MAXV': self.on and self.vset > self.maxv,
+            'TRIP': self.tripped,
+            'KILL': self.tripped and self.pdwn == 'KILL',
+        }
+        return sum(1 << i for i, name in enumerate(STATUS_BITS['STAT']) if bits.get(name))
+
+    @property
+    def overcurrent(self) -> bool:
+        # Current limited: held at ISET while the setpoint asks for more
+        return self.on and self.target > self.vmon and self.vmon >= self.iset * self.load * (1 - 1e-9)
+
+    def advance(self, dt: float) -> None:
+        target = self.target
+        if self.vmon < target:
+            self.vmon = min(target, self.vmon + self.rup * dt)
+        elif self.vmon > target:
+            self.vmon = max(target, self.vmon - self.rdw * dt)
+        if self.on:
+            self.vmon = min(self.vmon, self.iset * self.load)
+
+        if self.overcurrent:
+            self.overcurrent_time = self.overcurrent_time + dt
+            if self.overcurrent_time >= self.trip:
+                self.tripped = True
+                self.on = False
+                if self.pdwn == 'KILL':
+                    self.vmon = 0
+        else:
+            self.overcurrent_time = 0
+
+
+class SimulatedR1419:
+    """
+    Stateful model of a CAEN R1419ET, answering the same $BD:..,CMD:.. commands as the real power supply.
+    Channels ramp towards their setpoint at RUP/RDW, are current limited at ISET and trip (turn off, and go to
+    zero right away if PDWN is KILL) after having been current limited for TRIP seconds. Time is taken from clock,
+    which can be replaced to run the model faster or slower than real time.
+    """
+    CHANNELS = 4
+    MAX_VOLTAGE = 550
+    MAX_CURRENT = 200
+    MAX_RAMP = 500
+    MAX_TRIP = 1000
+    SUBSTEP = 0.05  # Longest time step when advancing the model, to get trip times right
+
+    def __init__(self, bd: int = 0, serial_number: int = 12345, clock: Callable[[], float] = time.monotonic):
+        self.bd = bd
+        self.serial_number = serial_number
+        self.clock = clock
+        self.channels = [SimulatedChannel() for _ in range(self.CHANNELS)]
+        self.interlock = False
+        self.interlock_mode = 'OPEN'
+        self.local = False
+        self.alarm = 0
+        self.commands = 0  # Number of commands handled
+        self._time = clock()
+        self._lock = threading.Lock()
+
+    def advance(self) -> None:
+        """
+        Bring the channels up to date with the clock. Called before every command.
+        """
+        now = self.clock()
+        while self._time < now:
+            dt = min(self.SUBSTEP, now - self._time)
+            for channel in self.channels:
+                was_tripped = channel.tripped
+                channel.advance(dt)
+                if channel.tripped and not was_tripped:
+                    self.alarm = self.alarm | 1 << self.channels.index(channel)
+            self._time = self._time + dt
+
+    def handle(self, message: str) -> str:
+        """
+        Answer one command line, as the device would.
+        """
+        with self._lock:
+            self.commands = self.commands + 1
+            self.advance()
+            try:
+                values = self._handle(message.strip())
+            except _Error as e:
+                return f'#BD:{self.bd:02d},{e.field}:ERR'
+            if values is None:
+                return f'#BD:{self.bd:02d},CMD:OK'
+            return f'#BD:{self.bd:02d},CMD:OK,VAL:' + ';'.join(values)
+
+    def _handle(self, message: str) -> list[str] | None:
+        try:
+            fields = dict(field.split(':', 1) for field in message.split(','))
+        except ValueError:
+            raise _Error('CMD')
+        if fields.get('$BD') != f'{self.bd:02d}':
+            raise _Error('CMD')
+        cmd = fields.get('CMD')
+        par = fields.get('PAR')
+        if cmd not in ('MON', 'SET'):
+            raise _Error('CMD')
+        if par not in PARAMETERS:
+            raise _Error('PAR')
+        if 'CH' in fields:
+            try:
+                ch = int(fields['CH'])
+            except ValueError:
+                raise _Error('CH')
+            if not 0 <= ch <= self.CHANNELS:
+                raise _Error('CH')
+            channels = self.channels if ch == self.CHANNELS else [self.channels[ch]]
+        else:
+            channels = None
+
+        if cmd == 'MON':
+            if channels is None:
+                return [self._monitor_board(par)]
+            return [self._monitor_channel(channel, par) for channel in channels]
+        if self.local:
+            raise _Error('LOC')
+        if channels is None:
+            self._set_board(par, fields.get('VAL'))
+        else:
+            for channel in channels:
+                self._set_channel(channel, par, fields.get('VAL'))
+        return None
+
+    def _monitor_board(self, par: str) -> str:
+        values = {
+            'BDNAME': 'R1419ET',
+            'BDNCH': f'{self.CHANNELS}',
+            'BDFREL': '1.05',
+            'BDSNUM': f'{self.serial_number:05d}',
+            'BDILK': 'YES' if self.interlock else 'NO',
+            'BDILKM': self.interlock_mode,
+            'BDCTR': 'LOCAL' if self.local else 'REMOTE',
+            'BDTERM': 'OFF',
+            'BDALARM': f'{self.alarm:05d}',
+        }
+        if par not in values:
+            raise _Error('PAR')
+        return values[par]
+
+    def _monitor_channel(self, channel: SimulatedChannel, par: str) -> str:
+        values: dict[str, str] = {
+            'VSET': f'{channel.vset:06.1f}', 'VMIN': '0000.0', 'VMAX': f'{self.MAX_VOLTAGE:06.1f}', 'VDEC': '1',
+            'VMON': f'{channel.vmon:06.1f}',
+            'ISET': f'{channel.iset:06.2f}', 'IMIN': '000.00', 'IMAX': f'{self.MAX_CURRENT:06.2f}', 'ISDEC': '2',
+            'IMON': f'{channel.imon:06.2f}', 'IMRANGE': channel.imrange, 'IMDEC': '2',
+            'MAXV': f'{channel.maxv:04.0f}', 'MVMIN': '0000', 'MVMAX': f'{self.MAX_VOLTAGE:04d}', 'MVDEC': '0',
+            'RUP': f'{channel.rup:03.0f}', 'RUPMIN': '001', 'RUPMAX': f'{self.MAX_RAMP:03d}', 'RUPDEC': '0',
+            'RDW': f'{channel.rdw:03.0f}', 'RDWMIN': '001', 'RDWMAX': f'{self.MAX_RAMP:03d}', 'RDWDEC': '0',
+            'TRIP': f'{channel.trip:06.1f}', 'TRIPMIN': '0000.0', 'TRIPMAX': f'{self.MAX_TRIP:06.1f}', 'TRIPDEC': '1',
+            'PDWN': channel.pdwn, 'POL': channel.pol, 'STAT': f'{channel.stat:05d}',
+        }
+        if par not in values:
+            raise _Error('PAR')
+        return values[par]
+
+    def _set_board(self, par: str, val: str | None) -> None:
+        if par == 'BDCLR':
+            self.alarm = 0
+            for channel in self.channels:
+                channel.tripped = False
+        elif par == 'BDILKM':
+            if val not in ('OPEN', 'CLOSED'):
+                raise _Error('VAL')
+            self.interlock_mode = val
+        else:
+            raise _Error('PAR')
+
+    def _set_channel(self, channel: SimulatedChannel, par: str, val: str | None) -> None:
+        if par in ('ON', 'OFF'):
+            if par == 'ON' and (self.interlock or channel.tripped):
+                return  # The device acknowledges, but the channel stays off
+            channel.on = par == 'ON'
+            return
+        if par in ('PDWN', 'IMRANGE'):
+            allowed = ('RAMP', 'KILL') if par == 'PDWN' else ('HIGH', 'LOW')
+            if val not in allowed:
+                raise _Error('VAL')
+            setattr(channel, par.lower(), val)
+            return
+        limits = {
+            'VSET': (0, channel.maxv),
+            'ISET': (0, self.MAX_CURRENT),
+            'MAXV': (0, self.MAX_VOLTAGE),
+            'RUP': (1, self.MAX_RAMP),
+            'RDW': (1, self.MAX_RAMP),
+            'TRIP': (0, self.MAX_TRIP),
+        }
+        if par not in limits:
+            raise _Error('PAR')
+        try:
+            value = float(val)  # type: ignore
+        except (TypeError, ValueError):
+            raise _Error('VAL')
+        low, high = limits[par]
+        if not low <= value <= high:
+            raise _Error('VAL')
+        setattr(channel, par.lower(), value)
+
+
+class FakeSerial:
+    """
+    In-process stand-in for serial.Serial, connected to a simulated device. Replies arrive at the pace of a line
+    at baud_rate (10 bits per byte), after the command has been sent, one reply at a time like on a real line.
+    Use baud_rate=None to answer right away.
+
+    Reads behave like pyserial's: read_until returns when it has read the expected terminator or size bytes, or
+    when the timeout expires, with whatever has arrived by then, so a reply can be read in several pieces. The
+    bytes of a reply arrive in pieces of chunk_size bytes (the whole reply by default), and with chunk_size set no
+    read returns more than chunk_size bytes, as if every read timed out after one piece. That way the line framing
+    of the reader is exercised even without realistic latency.
+    """
+    def __init__(self, device: SimulatedR1419, baud_rate: int | None = 9600, timeout: float | None = 5, chunk_size: int | None = None):
+        self.device = device
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.is_open = True
+        self._incoming = b''
+        self._pending: list[tuple[float, bytes]] = []  # Pieces of replies that are still on the way, with their arrival time
+        self._received = bytearray()  # Arrived, but not read yet
+        self._line_free = 0.0  # When the line back to the host is done sending the previous reply
+        self._condition = threading.Condition()
+
+    def _transfer_time(self, size: int) -> float:
+        return 0 if self.baud_rate is None else size * 10 / self.baud_rate
+
+    def write(self, data: bytes) -> int:
+        now = time.monotonic()
+        self._incoming = self._incoming + data
+        while b'\n' in self._incoming:
+            line, self._incoming = self._incoming.split(b'\n', 1)
+            if not line.strip():
+                continue
+            reply = (self.device.handle(line.decode(errors='replace')) + '\r\n').encode()
+            piece_size = self.chunk_size or len(reply)
+            with self._condition:
+                self._line_free = max(now + self._transfer_time(len(line) + 1), self._line_free)
+                for start in range(0, len(reply), piece_size):
+                    piece = reply[start:start + piece_size]
+                    self._line_free = self._line_free + self._transfer_time(len(piece))
+                    self._pending.append((self._line_free, piece))
+                self._condition.notify_all()
+        return len(data)
+
+    def _arrive(self, now: float) -> None:
+        while self._pending and self._pending[0][0] <= now:
+            self._received.extend(self._pending.pop(0)[1])
+
+    @property
+    def in_waiting(self) -> int:
+        with self._condition:
+            self._arrive(time.monotonic())
+            return len(self._received)
+
+    def read_until(self, expected: bytes = b'\n', size: int | None = None) -> bytes:
+        limits = [n for n in (size, self.chunk_size) if n]
+        limit = min(limits) if limits else None
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._arrive(now)
+                found = self._received.find(expected)
+                end = found + len(expected) if found >= 0 else None
+                if limit is not None and len(self._received) >= limit and (end is None or end > limit):
+                    end = limit
+                if end is None and deadline is not None and now >= deadline:
+                    end = len(self._received)  # Timed out, with whatever has arrived
+                if end is not None:
+                    data = bytes(self._received[:end])
+                    del self._received[:end]
+                    return data
+                wake = self._pending[0][0] if self._pending else None
+                if deadline is not None:
+                    wake = deadline if wake is None else min(wake, deadline)
+                self._condition.wait(None if wake is None else max(wake - now, 0))
+
+    def reset_input_buffer(self) -> None:
+        with self._condition:
+            self._pending.clear()
+            self._received.clear()
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.is_open = False
+
+
+class SimulatedCAENOutput(CAENOutput):
+    """
+    CAENOutput connected to a SimulatedR1419 instead of a serial port, for demos, tests and profiling without
+    hardware. With realistic_latency, replies take as long as they would over the 9600 baud link. With chunk_size,
+    replies are read in pieces of at most that many bytes (see FakeSerial).
+    """
+    def __init__(self, *, device: SimulatedR1419 | None = None, realistic_latency: bool = True, chunk_size: int | None = None,
+                 **kwargs: Any):
+        kwargs.setdefault('port', 'SIMULATED')
+        super().__init__(**kwargs)
+        self.device = SimulatedR1419(bd=self.bd) if device is None else device
+        self.realistic_latency = realistic_latency
+        self.chunk_size = chunk_size
+
+    def _open_serial(self) -> FakeSerial:
+        return FakeSerial(self.device, self.baud_rate if self.realistic_latency else None, chunk_size=self.chunk_size)
@@ -34,7 +34,7 @@ class BufferInput(TimerInput):
     _pull_timer: Timer | None
     _pull_wait_time: float
 
-    def __init__(self, *, buffer: bool = False, pull_rate: int | None = None, pull_on_buffer_read: bool = True):
+    def __init__(self, *, buffer: bool = False, pull_rate: float | None = None, pull_on_buffer_read: bool = True):
         self._buffer = [] if buffer else None
         self._latest = 0
         self.pull_on_buffer_read = pull_on_buffer_read
@@ -107,7 +107,7 @@ class MockBufferInput(BufferInput):
     _init_time: float
     _next_index: int
 
-    def __init__(self, *, buffer: bool = False, pull_rate: int | None = None, pull_on_buffer_read: bool = True, rate: float = 1, mod: int = 50):
+    def __init__(self, *, buffer: bool = False, pull_rate: float | None = None, pull_on_buffer_read: bool = True, rate: float = 1, mod: int = 50):
         self._init_time = time.time()
         self._next_int = 0
         self.rate = rate
@@ -121,7 +121,7 @@ class MockBufferInput(BufferInput):
 
 
 class PicoMockBufferInput(BufferInput, USBConnection):
-    def __init__(self, *, port: str, buffer: bool = False, pull_rate: int | None = None, pull_on_buffer_read: bool = True):
+    def __init__(self, *, port: str, buffer: bool = False, pull_rate: float | None = None, pull_on_buffer_read: bool = True):
         BAUD_RATE = 115200
         USBConnection.__init__(
             self,
@@ -137,7 +137,7 @@ class PicoMockBufferInput(BufferInput, USBConnection):
             return [float(str.strip()) for str in lines]
         except ValueError:
             # Bad read from device, throw away data
-            logger.warning(f'Discarding a corrupted batch of {len(lines)} points')
+            logger.warning('Discarding a corrupted batch of %d points', len(lines))
             return []
 
 
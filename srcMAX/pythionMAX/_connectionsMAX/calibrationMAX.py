@@ -1,9 +1,13 @@
 from __future__ import annotations
 # from typing import Callable
-from typing import Self
+from typing import Self, Sequence
 from abc import ABC, abstractmethod
-import matplotlib.pyplot as plt  # type: ignore
+from bisect import bisect_left, bisect_right
 import numpy as np
+import numpy.typing as npt
+
+
+OUT_OF_BOUNDS_MESSAGE = 'Set value is out of bounds for the calibration domain. Set extrapolate to True if you wish to continue.'
 
 
 class Calibration(ABC):
@@ -15,6 +19,7 @@ class Calibration(ABC):
         self.target_unit = target_unit    # Units for target signal
 
     def plot(self, min_target: float, max_target: float, samples: int) -> None:
+        import matplotlib.pyplot as plt  # type: ignore  # Not at the top: importing pyplot takes longer than the whole package
         xx = np.linspace(min_target, max_target, samples)
         yy = [self.to_control(x) for x in xx]
         plt.plot(xx, yy)
@@ -43,6 +48,13 @@ class Calibration(ABC):
         """
         return LinearCalibration(1, unit, unit)
 
+    def compile(self, min_target: float, max_target: float, samples: int = 4096, extrapolate: bool = False) -> LookupCalibration:
+        """
+        Tabulate this calibration on [min_target, max_target] and return a LookupCalibration,
+        which evaluates in constant time regardless of how expensive the original relation is.
+        """
+        return LookupCalibration.from_calibration(self, min_target, max_target, samples, extrapolate)
+
 
 class LinearCalibration(Calibration):
     """
@@ -78,21 +90,7 @@ class InterpolCalibration(Calibration):
         """
         # Sort on first index
         self.points = sorted(points)
-
-        # Check that list is valid:
-        if len(points) < 2:
-            raise ValueError("Calibration requires at least 2 points")
-
-        last_target: float | None = None
-        last_control: float | None = None
-
-        for target, control in self.points:
-            if last_target is not None:
-                assert last_control is not None
-                if last_control >= control or last_target == target:
-                    raise ValueError('Invalid calibration. Points must form a strictly increasing function.')
-            last_target, last_control = target, control
-
+        _check_increasing(self.points)
         self.extrapolate = extrapolate
         super().__init__(control_unit, target_unit)
 
@@ -105,6 +103,9 @@ class InterpolCalibration(Calibration):
     def auto_plot(self) -> None:
         super().plot(self.points[0][0], self.points[-1][0], 1000)
 
+    def auto_compile(self, samples: int = 4096) -> LookupCalibration:
+        return self.compile(self.points[0][0], self.points[-1][0], samples, self.extrapolate)
+
     def _linear_interpolation(self, x_value: float, flip_xy: bool = False) -> float:
         def get_xy(i: int) -> tuple[float, float]:
             x, y = self.points[i]
@@ -122,14 +123,14 @@ class InterpolCalibration(Calibration):
                     return (x_value-prev_x) / (x-prev_x) * (y-prev_y) + prev_y
                 else:
                     if not self.extrapolate:
-                        raise ValueError('Set value is out of bounds for the calibration domain. Set extrapolate to True if you wish to continue.')
+                        raise ValueError(OUT_OF_BOUNDS_MESSAGE)
                     next_x, next_y = get_xy(i+1)
                     return (x_value-x) / (next_x-x) * (next_y-y) + y
         # Apparently, x_value >= x[-1]
         x1, y1 = get_xy(-2)  # Next to last
         x2, y2 = get_xy(-1)  # Last
         if not self.extrapolate and x_value != x2:
-            raise ValueError('Set value is out of bounds for the calibration domain. Set extrapolate to True if you wish to continue.')
+            raise ValueError(OUT_OF_BOUNDS_MESSAGE)
         return (x_value-x1) / (x2-x1) * (y2-y1) + y1
 
     @classmethod
@@ -144,9 +145,326 @@ class InterpolCalibration(Calibration):
         Assuming csv-like file with comma-separated values and decimal point.
         Ordered like (target, control), with one point per row.
         """
-        with open(filename) as file:
-            points = [(float(s1), float(s2)) for s1, s2 in map(lambda s: s.strip().split(','), file.readlines())]
-            return cls(points, extrapolate, target_unit, control_unit)
+        return cls(_read_points(filename), extrapolate, target_unit, control_unit)
+
+
+class FittedCalibration(Calibration):
+    """
+    Base class for calibrations where the control signal is a smooth function of the target signal,
+    fitted to a set of (target, control) points. Subclasses implement _evaluate and _derivative.
+    The inverse relation (control -> target) is tabulated once on construction, and each lookup
+    in the table is refined with a couple of Newton steps.
+    """
+    NEWTON_ITERATIONS = 3
+
+    def __init__(
+        self,
+        domain: tuple[float, float],
+        extrapolate: bool = False,
+        target_unit: str | None = None,
+        control_unit: str | None = None,
+        inverse_samples: int = 1000
+    ):
+        self.domain = domain
+        self.extrapolate = extrapolate
+        super().__init__(control_unit, target_unit)
+
+        self._table_targets: list[float] = np.linspace(domain[0], domain[1], inverse_samples).tolist()
+        self._table_controls = [self._evaluate(x) for x in self._table_targets]
+        if any(c2 <= c1 for c1, c2 in zip(self._table_controls, self._table_controls[1:])):
+            raise ValueError('Invalid calibration. The fitted function must be strictly increasing on the calibration domain.')
+
+    @abstractmethod
+    def _evaluate(self, target_value: float) -> float:
+        pass
+
+    @abstractmethod
+    def _derivative(self, target_value: float) -> float:
+        pass
+
+    def to_control(self, target_value: float) -> float:
+        if not self.extrapolate and not (self.domain[0] <= target_value <= self.domain[1]):
+            raise ValueError(OUT_OF_BOUNDS_MESSAGE)
+        return self._evaluate(target_value)
+
+    def to_target(self, control_value: float) -> float:
+        controls = self._table_controls
+        if not self.extrapolate and not (controls[0] <= control_value <= controls[-1]):
+            raise ValueError(OUT_OF_BOUNDS_MESSAGE)
+
+        # Initial guess by linear interpolation in the table
+        i = min(max(bisect_left(controls, control_value), 1), len(controls) - 1)
+        c1, c2 = controls[i-1], controls[i]
+        t1, t2 = self._table_targets[i-1], self._table_targets[i]
+        target = t1 + (control_value - c1) / (c2 - c1) * (t2 - t1)
+
+        # Polish with Newton's method
+        for _ in range(self.NEWTON_ITERATIONS):
+            slope = self._derivative(target)
+            if slope <= 0:
+                break
+            step = (self._evaluate(target) - control_value) / slope
+            target = target - step
+            if abs(step) <= 1e-12 * max(1.0, abs(target)):
+                break
+        return target
+
+    def auto_plot(self) -> None:
+        super().plot(self.domain[0], self.domain[1], 1000)
+
+    def auto_compile(self, samples: int = 4096) -> LookupCalibration:
+        return self.compile(self.domain[0], self.domain[1], samples, self.extrapolate)
+
+
+class PolynomialCalibration(FittedCalibration):
+    """
+    Least-squares polynomial fit of the control signal as a function of the target signal.
+    """
+    def __init__(
+        self,
+        points: list[tuple[float, float]],
+        degree: int = 3,
+        extrapolate: bool = False,
+        target_unit: str | None = None,
+        control_unit: str | None = None
+    ):
+        """
+        points is a list of (target_value, control_value) tuples, with at least degree+1 points.
+        The fitted polynomial must be strictly increasing over the range spanned by the points.
+        """
+        points = sorted(points)
+        if len(points) <= degree:
+            raise ValueError(f'A polynomial of degree {degree} requires at least {degree + 1} calibration points')
+        targets, controls = zip(*points)
+        # Coefficients are ordered from the constant term and upwards
+        self.coefficients: list[float] = np.polynomial.polynomial.polyfit(targets, controls, degree).tolist()
+        self._derivative_coefficients = [i * c for i, c in enumerate(self.coefficients)][1:]
+        super().__init__((targets[0], targets[-1]), extrapolate, target_unit, control_unit)
+
+    def _evaluate(self, target_value: float) -> float:
+        return _horner(self.coefficients, target_value)
+
+    def _derivative(self, target_value: float) -> float:
+        return _horner(self._derivative_coefficients, target_value)
+
+    @classmethod
+    def from_file(
+            cls,
+            filename: str,
+            degree: int = 3,
+            extrapolate: bool = False,
+            target_unit: str | None = None,
+            control_unit: str | None = None
+    ) -> Self:
+        """
+        Same file format as InterpolCalibration.from_file.
+        """
+        return cls(_read_points(filename), degree, extrapolate, target_unit, control_unit)
+
+
+class SplineCalibration(FittedCalibration):
+    """
+    Monotone piecewise cubic interpolation (Fritsch-Carlson) through the calibration points.
+    Unlike an ordinary cubic spline, it never overshoots between points, so the relation stays invertible.
+    If extrapolate is set to true, the slopes at the ends of the domain are continued linearly.
+    """
+    def __init__(
+        self,
+        points: list[tuple[float, float]],
+        extrapolate: bool = False,
+        target_unit: str | None = None,
+        control_unit: str | None = None
+    ):
+        """
+        points is a list of (target_value, control_value) tuples forming a strictly increasing function.
+        """
+        self.points = sorted(points)
+        _check_increasing(self.points)
+        self._x = [float(x) for x, _ in self.points]
+        self._y = [float(y) for _, y in self.points]
+        self._slopes = _monotone_slopes(self._x, self._y)
+        super().__init__((self._x[0], self._x[-1]), extrapolate, target_unit, control_unit)
+
+    def _segment(self, x: float) -> tuple[int, float, float]:
+        """
+        Returns (index, segment width, relative position within segment) for the segment containing x.
+        """
+        i = min(max(bisect_right(self._x, x) - 1, 0), len(self._x) - 2)
+        h = self._x[i+1] - self._x[i]
+        return i, h, (x - self._x[i]) / h
+
+    def _evaluate(self, target_value: float) -> float:
+        if target_value < self._x[0]:
+            return self._y[0] + (target_value - self._x[0]) * self._slopes[0]
+        if target_value > self._x[-1]:
+            return self._y[-1] + (target_value - self._x[-1]) * self._slopes[-1]
+        i, h, t = self._segment(target_value)
+        t2 = t * t
+        t3 = t2 * t
+        return ((2*t3 - 3*t2 + 1) * self._y[i] + (t3 - 2*t2 + t) * h * self._slopes[i]
+                + (3*t2 - 2*t3) * self._y[i+1] + (t3 - t2) * h * self._slopes[i+1])
+
+    def _derivative(self, target_value: float) -> float:
+        if target_value < self._x[0]:
+            return self._slopes[0]
+        if target_value > self._x[-1]:
+            return self._slopes[-1]
+        i, h, t = self._segment(target_value)
+        t2 = t * t
+        return ((6*t2 - 6*t) * (self._y[i] - self._y[i+1]) / h
+                + (3*t2 - 4*t + 1) * self._slopes[i] + (3*t2 - 2*t) * self._slopes[i+1])
+
+    @classmethod
+    def from_file(
+            cls,
+            filename: str,
+            extrapolate: bool = False,
+            target_unit: str | None = None,
+            control_unit: str | None = None
+    ) -> Self:
+        """
+        Same file format as InterpolCalibration.from_file.
+        """
+        return cls(_read_points(filename), extrapolate, target_unit, control_unit)
+
+
+class LookupCalibration(Calibration):
+    """
+    A calibration resampled on uniformly spaced grids in both directions. Evaluating it is a single
+    index computation followed by a linear interpolation, i.e. O(1) no matter how expensive the original
+    relation is, which makes it suitable for hot paths such as setting OutputInterface.target.
+
+    Usually created through Calibration.compile or auto_compile.
+    """
+    def __init__(
+        self,
+        targets: npt.ArrayLike,
+        controls: npt.ArrayLike,
+        samples: int = 4096,
+        extrapolate: bool = False,
+        target_unit: str | None = None,
+        control_unit: str | None = None
+    ):
+        """
+        targets and controls are matching, strictly increasing sequences describing the relation.
+        They are resampled onto two uniform tables (one per direction) of the given size.
+        """
+        target_array = np.asarray(targets, dtype=float)
+        control_array = np.asarray(controls, dtype=float)
+        if target_array.shape != control_array.shape or target_array.size < 2 or samples < 2:
+            raise ValueError('Calibration requires at least 2 points')
+        if np.any(np.diff(target_array) <= 0) or np.any(np.diff(control_array) <= 0):
+            raise ValueError('Invalid calibration. Points must form a strictly increasing function.')
+
+        self._control_table = _UniformTable(target_array, control_array, samples)
+        self._target_table = _UniformTable(control_array, target_array, samples)
+        self.extrapolate = extrapolate
+        super().__init__(control_unit, target_unit)
+
+    def to_control(self, target_value: float) -> float:
+        return self._control_table.lookup(target_value, self.extrapolate)
+
+    def to_target(self, control_value: float) -> float:
+        return self._target_table.lookup(control_value, self.extrapolate)
+
+    @classmethod
+    def from_calibration(
+            cls,
+            calibration: Calibration,
+            min_target: float,
+            max_target: float,
+            samples: int = 4096,
+            extrapolate: bool = False
+    ) -> Self:
+        targets = np.linspace(min_target, max_target, samples)
+        controls = [calibration.to_control(x) for x in targets]
+        return cls(targets, controls, samples, extrapolate, calibration.target_unit, calibration.control_unit)
+
+
+class _UniformTable:
+    """
+    The function y(x) resampled on a uniform x grid, so that lookups need no search.
+    """
+    __slots__ = ('start', 'end', 'inverse_step', 'last', 'values')
+
+    def __init__(self, x: npt.NDArray[np.float64], y: npt.NDArray[np.float64], samples: int):
+        self.start = float(x[0])
+        self.end = float(x[-1])
+        self.inverse_step = (samples - 1) / (self.end - self.start)
+        self.last = samples - 1
+        # Python floats in a list are faster to index one at a time than a numpy array
+        self.values: list[float] = np.interp(np.linspace(self.start, self.end, samples), x, y).tolist()
+
+    def lookup(self, x: float, extrapolate: bool) -> float:
+        if not extrapolate and not (self.start <= x <= self.end):
+            raise ValueError(OUT_OF_BOUNDS_MESSAGE)
+        position = (x - self.start) * self.inverse_step
+        # Clamping the index makes positions outside the table extrapolate along the outmost segment
+        index = min(max(int(position), 0), self.last - 1)
+        fraction = position - index
+        values = self.values
+        return values[index] + fraction * (values[index+1] - values[index])
+
+
+def _check_increasing(points: Sequence[tuple[float, float]]) -> None:
+    """
+    Raise ValueError unless the (sorted) points form a strictly increasing function.
+    """
+    if len(points) < 2:
+        raise ValueError("Calibration requires at least 2 points")
+
+    last_target: float | None = None
+    last_control: float | None = None
+
+    for target, control in points:
+        if last_target is not None:
+            assert last_control is not None
+            if last_control >= control or last_target == target:
+                raise ValueError('Invalid calibration. Points must form a strictly increasing function.')
+        last_target, last_control = target, control
+
+
+def _read_points(filename: str) -> list[tuple[float, float]]:
+    with open(filename) as file:
+        return [(float(s1), float(s2)) for s1, s2 in map(lambda s: s.strip().split(','), file.readlines())]
+
+
+def _horner(coefficients: list[float], x: float) -> float:
+    result = 0.0
+    for coefficient in reversed(coefficients):
+        result = result * x + coefficient
+    return result
+
+
+def _monotone_slopes(x: list[float], y: list[float]) -> list[float]:
+    """
+    Tangents for a shape-preserving cubic Hermite interpolant (the same choice as PCHIP):
+    weighted harmonic means of the neighbouring secants, and a one-sided three-point
+    estimate at the ends, limited so that the interpolant stays monotone.
+    """
+    h = [x2 - x1 for x1, x2 in zip(x, x[1:])]
+    delta = [(y2 - y1) / dx for y1, y2, dx in zip(y, y[1:], h)]
+    if len(x) == 2:
+        return [delta[0], delta[0]]
+
+    slopes = [0.0] * len(x)
+    for i in range(1, len(x) - 1):
+        if delta[i-1] * delta[i] > 0:
+            w1 = 2 * h[i] + h[i-1]
+            w2 = h[i] + 2 * h[i-1]
+            slopes[i] = (w1 + w2) / (w1 / delta[i-1] + w2 / delta[i])
+
+    def end_slope(h0: float, h1: float, d0: float, d1: float) -> float:
+        slope = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+        if slope * d0 <= 0:
+            return 0.0
+        if d0 * d1 <= 0 and abs(slope) > 3 * abs(d0):
+            return 3 * d0
+        return slope
+
+    slopes[0] = end_slope(h[0], h[1], delta[0], delta[1])
+    slopes[-1] = end_slope(h[-1], h[-2], delta[-1], delta[-2])
+    return slopes
 
 
 def main() -> None:
@@ -0,0 +1,356 @@
+from __future__ import annotations
+from typing import Any, Callable, Self
+from dataclasses import dataclass
+import argparse
+import logging
+import math
+import os
+import random
+import select
+import subprocess
+import sys
+import threading
+import time
+
+from srcMAX.pythionMAX._connectionsMAX.CAEN_simulatorMAX import SimulatedR1419
+
+logger = logging.getLogger('pythion')
+
+
+class DeviceEmulator:
+    """
+    Base class for the emulated serial devices. The emulator gets every complete line written to the device through
+    handle_line and returns the bytes to answer with (if any). Devices that stream data on their own implement tick,
+    which is called regularly with the current time.
+    """
+    baud_rate: int = 9600
+    terminator: bytes = b'\n'  # What ends a command written to the device
+
+    def handle_line(self, line: str) -> bytes | None:
+        return None
+
+    def tick(self, now: float) -> bytes | None:
+        return None
+
+
+class RBDEmulator(DeviceEmulator):
+    """
+    RBD 9103 picoammeter. '&I####' sets the streaming interval in ms (0 stops streaming), and frames of shape
+    '&S=,Range=200nA,+012.34,nA' are streamed at that interval. current(t) gives the current (in nA) at time t.
+    """
+    baud_rate = 57600
+
+    def __init__(self, current: Callable[[float], float] | None = None, noise: float = 0.05):
+        self.current = current if current is not None else lambda t: 10 + 5 * math.sin(t)
+        self.noise = noise
+        self.interval: float | None = None
+        self._next = 0.0
+
+    def handle_line(self, line: str) -> bytes | None:
+        line = line.strip()
+        if line.startswith('&I') and line[2:].isdigit():
+            interval = int(line[2:])
+            self.interval = interval / 1000 if interval else None
+            self._next = time.monotonic()
+        return None
+
+    def tick(self, now: float) -> bytes | None:
+        if self.interval is None or now < self._next:
+            return None
+        frames = []
+        while self._next <= now:
+            value = self.current(self._next) + random.gauss(0, self.noise)
+            frames.append(self.frame(value))
+            self._next = self._next + self.interval
+        return b''.join(frames)
+
+    @staticmethod
+    def frame(value: float, stability: str = '=') -> bytes:
+        return f'&S{stability},Range=200nA,{value:+07.2f},nA\r\n'.encode()
+
+
+class RS3005PEmulator(DeviceEmulator):
+    """
+    RS3005P power supply with a resistive load of load Ohm. Understands VSET1:/ISET1: and the VSET1?/ISET1?/VOUT1?/IOUT1?
+    queries, which are answered with 5 characters and no line ending, like the real device. Commands aren't line
+    terminated either, so a command is taken to be complete when nothing more has arrived for a few milliseconds.
+    """
+    terminator = b''
+
+    def __init__(self, load: float = 10):
+        self.load = load
+        self.vset = 0.0
+        self.iset = 5.0
+
+    @property
+    def vout(self) -> float:
+        return min(self.vset, self.iset * self.load)
+
+    @property
+    def iout(self) -> float:
+        return self.vout / self.load
+
+    def handle_line(self, line: str) -> bytes | None:
+        line = line.strip()
+        try:
+            if line.startswith('VSET1:'):
+                self.vset = float(line[6:])
+            elif line.startswith('ISET1:'):
+                self.iset = float(line[6:])
+            elif line == 'VSET1?':
+                return f'{self.vset:05.2f}'.encode()
+            elif line == 'ISET1?':
+                return f'{self.iset:.3f}'.encode()
+            elif line == 'VOUT1?':
+                return f'{self.vout:05.2f}'.encode()
+            elif line == 'IOUT1?':
+                return f'{self.iout:.3f}'.encode()
+            elif line == '*IDN?':
+                return b'RS-3005P V2.0'
+        except ValueError:
+            pass
+        return None
+
+
+class PicoDACEmulator(DeviceEmulator):
+    """
+    The DAC firmware from Pico/main.py: every line is an integer 0-4095 that's written to the DAC. Never answers.
+    """
+    baud_rate = 115200
+
+    def __init__(self, bits: int = 12):
+        self.bits = bits
+        self.value = 0
+
+    def handle_line(self, line: str) -> bytes | None:
+        try:
+            value = int(line.strip())
+        except ValueError:
+            return None
+        if 0 <= value < 2**self.bits:
+            self.value = value
+        return None
+
+
+class CAENEmulator(DeviceEmulator):
+    """
+    CAEN R1419ET, backed by the SimulatedR1419 model.
+    """
+    def __init__(self, device: SimulatedR1419 | None = None):
+        self.device = SimulatedR1419() if device is None else device
+
+    def handle_line(self, line: str) -> bytes | None:
+        if not line.strip():
+            return None
+        return (self.device.handle(line) + '\r\n').encode()
+
+
+@dataclass
+class Faults:
+    """
+    Fault injection for an emulated device. Rates are probabilities per command/reply.
+        drop_rate       - Commands that are silently ignored.
+        corrupt_rate    - Replies where one character is garbled.
+        delay           - Extra seconds before every reply.
+        disconnect_after - Seconds after which the device stops answering altogether.
+    """
+    drop_rate: float = 0
+    corrupt_rate: float = 0
+    delay: float = 0
+    disconnect_after: float | None = None
+
+
+class PtyDevice:
+    """
+    Runs a DeviceEmulator behind a pseudo-terminal, so that it can be opened like any serial port (the path is in
+    'port'). Output is throttled to the emulator's baud rate (10 bits per byte) unless throttle is False: it's
+    written a few bytes at a time, each when it would have arrived over the line, so the reader sees replies in
+    fragments like on a real port. Only available on POSIX systems.
+    """
+    IDLE_TIMEOUT = 0.005  # s - An unterminated command is complete after this long without new input
+    TICK = 0.001
+    CHUNK_SIZE = 2  # Bytes per write when throttled
+
+    port: str | None
+    _thread: threading.Thread | None
+
+    def __init__(self, name: str, emulator: DeviceEmulator, throttle: bool = True, faults: Faults | None = None):
+        self.name = name
+        self.emulator = emulator
+        self.throttle = throttle
+        self.faults = Faults() if faults is None else faults
+        self.port = None
+        self._master: int | None = None
+        self._slave: int | None = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._started = 0.0
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        import tty
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._started = time.monotonic()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f'PtyDevice {self.name}', daemon=True)
+        self._thread.start()
+        logger.info(f'PtyDevice:      Emulating {self.name} on {self.port}')
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    @property
+    def disconnected(self) -> bool:
+        limit = self.faults.disconnect_after
+        return limit is not None and time.monotonic() - self._started > limit
+
+    def _run(self) -> None:
+        assert self._master is not None
+        incoming = b''
+        last_input = 0.0
+        terminator = self.emulator.terminator
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([self._master], [], [], self.TICK)
+            now = time.monotonic()
+            if readable:
+                try:
+                    incoming = incoming + os.read(self._master, 1024)
+                except OSError:
+                    return
+                last_input = now
+            lines = []
+            if terminator:
+                while terminator in incoming:
+                    line, incoming = incoming.split(terminator, 1)
+                    lines.append(line)
+            elif incoming and now - last_input > self.IDLE_TIMEOUT:
+                lines.append(incoming)
+                incoming = b''
+            for line in lines:
+                if self.disconnected or random.random() < self.faults.drop_rate:
+                    continue
+                reply = self.emulator.handle_line(line.decode(errors='replace'))
+                if reply:
+                    self._send(reply)
+            streamed = self.emulator.tick(now)
+            if streamed and not self.disconnected:
+                self._send(streamed)
+
+    def _send(self, data: bytes) -> None:
+        if random.random() < self.faults.corrupt_rate:
+            index = random.randrange(len(data))
+            data = data[:index] + b'?' + data[index + 1:]
+        if self.faults.delay:
+            time.sleep(self.faults.delay)
+        if not self.throttle:
+            self._write(data)
+            return
+        start = time.monotonic()
+        byte_time = 10 / self.emulator.baud_rate
+        for offset in range(0, len(data), self.CHUNK_SIZE):
+            chunk = data[offset:offset + self.CHUNK_SIZE]
+            # Paced from the start of the reply, so that the time spent writing doesn't add up
+            remaining = start + (offset + len(chunk)) * byte_time - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            self._write(chunk)
+
+    def _write(self, data: bytes) -> None:
+        assert self._master is not None
+        try:
+            os.write(self._master, data)
+        except OSError:
+            pass
+
+
+class EmulatorFarm:
+    """
+    A set of PtyDevices started and stopped together, e.g. one emulator per device in the SIMBA config.
+    """
+    # Config key of the port -> emulator factory
+    DEVICES: dict[str, Callable[[], DeviceEmulator]] = {
+        'PORT_CAEN': CAENEmulator,
+        'PORT_RBD_a': RBDEmulator,
+        'PORT_RBD_s': RBDEmulator,
+        'PORT_RBD_fc': RBDEmulator,
+        'PORT_VELOCITY': RS3005PEmulator,
+        'PORT_MAGNET': RS3005PEmulator,
+    }
+
+    def __init__(self, devices: dict[str, DeviceEmulator] | None = None, throttle: bool = True, faults: Faults | None = None):
+        if devices is None:
+            devices = {key: factory() for key, factory in self.DEVICES.items()}
+        self.devices = {key: PtyDevice(key, emulator, throttle, faults) for key, emulator in devices.items()}
+
+    @property
+    def ports(self) -> dict[str, str]:
+        return {key: device.port for key, device in self.devices.items() if device.port is not None}
+
+    def __enter__(self) -> Self:
+        for device in self.devices.values():
+            device.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        for device in self.devices.values():
+            device.stop()
+
+    def write_config(self, source: str, destination: str) -> None:
+        """
+        Copy a SIMBA config file, pointing every emulated port to its pseudo-terminal.
+        """
+        ports = self.ports
+        with open(source, 'r') as file:
+            lines = file.readlines()
+        with open(destination, 'w') as file:
+            for line in lines:
+                key = line.split(':', 1)[0].strip()
+                if key in ports:
+                    line = f"{key}: '{ports[key]}'\n"
+                file.write(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run emulated SIMBA devices on pseudo-terminals.')
+    parser.add_argument('--config', default='configMAX.txt', help='SIMBA config file to base the emulated config on')
+    parser.add_argument('--output', default='configMAX_emulated.txt', help='Where to write the config with the emulated ports')
+    parser.add_argument('--no-throttle', action='store_true', help="Don't limit the output to the devices' baud rates")
+    parser.add_argument('--drop-rate', type=float, default=0, help='Fraction of commands that are ignored')
+    parser.add_argument('--corrupt-rate', type=float, default=0, help='Fraction of replies with a garbled character')
+    parser.add_argument('--delay', type=float, default=0, help='Extra delay (s) before every reply')
+    parser.add_argument('--run', metavar='SCRIPT', help='Run this script (e.g. simbaMAX.py) against the emulated devices, then exit')
+    parser.add_argument('--pico', action='store_true', help='Also emulate the Pico DAC (it has no key in the SIMBA config, so its port is only printed)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    faults = Faults(drop_rate=args.drop_rate, corrupt_rate=args.corrupt_rate, delay=args.delay)
+    devices = {key: factory() for key, factory in EmulatorFarm.DEVICES.items()}
+    if args.pico:
+        devices['PORT_PICO'] = PicoDACEmulator()
+    with EmulatorFarm(devices, throttle=not args.no_throttle, faults=faults) as farm:
+        farm.write_config(args.config, args.output)
+        for key, port in farm.ports.items():
+            print(f'{key}: {port}')
+        if args.run:
+            env = dict(os.environ, PYTHION_CONFIG=args.output, PYTHION_DEMO='0')
+            sys.exit(subprocess.call([sys.executable, args.run], env=env))
+        input(f'Emulated config written to {args.output}. Press enter to stop the emulators.\n')
+
+
+if __name__ == '__main__':
+    main()
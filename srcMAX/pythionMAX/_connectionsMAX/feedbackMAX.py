@@ -0,0 +1,85 @@
+from __future__ import annotations
+from typing import Callable
+import threading
+import time
+import logging
+
+from srcMAX.pythionMAX._connectionsMAX.input_interfaceMAX import InputInterface
+from srcMAX.pythionMAX._connectionsMAX.schedulerMAX import AcquisitionScheduler, ScheduledJob
+
+logger = logging.getLogger('pythion')
+
+
+class OutputFeedback(InputInterface):
+    """
+    Read-back of the actual value of an output device, exposed as an input stream so that it can be
+    shown by Input widgets and plots like any other input. While sampling, the device is polled on the
+    shared AcquisitionScheduler. The latest reading is cached together with its time (time.monotonic()),
+    so that callers can tell how fresh it is.
+    """
+    value: float | None
+    timestamp: float | None
+    _job: ScheduledJob | None
+
+    def __init__(self, read_device: Callable[[], float], max_age: float | None = None, name: str = 'OutputFeedback'):
+        """
+        read_device queries the device and returns the measured value (in target units).
+        max_age is the default age (in seconds) after which the cached value is no longer trusted by 'latest'.
+        """
+        super().__init__()
+        self._read_device = read_device
+        self.max_age = max_age
+        self.name = name
+        self.value = None
+        self.timestamp = None
+        self._job = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._job is not None
+
+    @property
+    def age(self) -> float | None:
+        """
+        Seconds since the cached value was read, or None if nothing has been read yet.
+        """
+        return None if self.timestamp is None else time.monotonic() - self.timestamp
+
+    def latest(self, max_age: float | None = None) -> float | None:
+        """
+        Return the cached value without touching the device, or None if it's older than max_age
+        (defaults to the max_age given on construction).
+        """
+        max_age = self.max_age if max_age is None else max_age
+        age = self.age
+        if age is None or (max_age is not None and age > max_age):
+            return None
+        return self.value
+
+    def read(self) -> float:
+        """
+        Query the device right away and update the cache.
+        """
+        with self._lock:
+            value = self._read_device()
+            self.value = value
+            self.timestamp = time.monotonic()
+        return value
+
+    def start_sampling(self, sample_rate: float) -> None:
+        self.stop_sampling()
+        self._job = AcquisitionScheduler.shared().schedule(self._poll, 1 / sample_rate, self.name)
+
+    def stop_sampling(self) -> None:
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def _poll(self) -> None:
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f'OutputFeedback: Could not read back {self.name}: {e}')
+            return
+        self._invoke_handlers(value)
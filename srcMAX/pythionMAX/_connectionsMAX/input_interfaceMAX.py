@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Callable, Self, Any
+from typing import Callable, Self, Any, Iterable
 from threading import Timer
+from concurrent.futures import Future
 import logging
 
 logger = logging.getLogger('pythion')
@@ -26,7 +27,7 @@ class InputInterface(ABC):
         self._input_handlers.append(onValueChanged)
 
     @abstractmethod
-    def start_sampling(self, sample_rate: int) -> None:
+    def start_sampling(self, sample_rate: float) -> None:
         pass
 
     @abstractmethod
@@ -93,7 +94,7 @@ class TimerInput(InputInterface):
     def read(self) -> float:
         return self._read()
 
-    def start_sampling(self, sample_rate: int) -> None:
+    def start_sampling(self, sample_rate: float) -> None:
         if not self._in_context_manager:
             logger.warning('TimerInput:     Attempted to start a timer without context manager!')
         else:
@@ -131,9 +132,22 @@ class MockCAEN(TimerInput):
 
     def _write(self, cmd: str, par: str, val: int|str|None = None, ch: int|None = None, bd = 0) -> None:
         msg = f"{bd} {cmd} {ch} {par} {val}"
-        logger.debug(f"MockCAEN:        message: {msg}.")
+        logger.debug("MockCAEN:        message: %s.", msg)
         #print(msg)
 
+    def command(self, cmd: str, par: str, val: int | str | None = None, ch: int | None = None) -> Future[list[Any]]:
+        self._write(cmd, par, val, ch)
+        future: Future[list[Any]] = Future()
+        future.set_result([])
+        return future
+
+    def monitor(self, pars: Iterable[str], ch: int | None = None, timeout: float | None = None) -> dict[str, list[Any]]:
+        return {}
+
+    def set_setpoint(self, par: str, val: int | str, ch: int | None = None) -> bool:
+        self._write('SET', par, val, ch)
+        return True
+
  
     def _read(self) -> None:
         self._val = self._val + (rd.random()-0.5)*2
@@ -1,9 +1,15 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass
+from math import copysign
 from typing import Any, Callable, Self, Tuple
+import threading
+import time
 import logging
 
 from srcMAX.pythionMAX._connectionsMAX.calibrationMAX import Calibration
+from srcMAX.pythionMAX._connectionsMAX.write_queueMAX import CoalescingWriter
 
 
 logger = logging.getLogger('pythion')
@@ -29,6 +35,27 @@ class Limits:
         return True, value
 
 
+@dataclass
+class _Ramp:
+    target: float
+    rate: float
+    interval: float
+    future: Future[float]
+
+
+def _resolve(future: Future[Any], result: Any = None, exception: BaseException | None = None) -> None:
+    """
+    Complete a future, unless it has already been cancelled by its owner.
+    """
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
 class OutputInterface(ABC):
     """
     Abstract base class for an output device. A derived class is to be made for every type of output,
@@ -36,12 +63,21 @@ class OutputInterface(ABC):
     Writing values should be internally implemented in the '_write' method, and invoked using the
     'target' property. By default, reading the 'target' property returns the last set target value. Change this
     behaviour to implement feedback by editing the 'target' getter and changing 'has_feedback' to return true.
+
+    Instead of jumping straight to a new value, the output can also be ramped there at a limited rate
+    using the 'ramp_to' method, which streams intermediate values from a background thread.
+
+    With coalesce_writes=True, setting 'target' returns immediately and the value is handed to a background
+    writer that only sends the most recent setpoint once the link is free (see CoalescingWriter). Use
+    'flush_writes' to wait until the latest value has actually been written.
     """
 
     _last_set_target: float | None
     _last_set_control: float | None
     _calibration: Calibration
     _on_invalid_output: list[Callable[[], None]]
+    _ramp: _Ramp | None
+    _ramp_thread: threading.Thread | None
 
     def __init__(self,
                  *,
@@ -49,13 +85,20 @@ class OutputInterface(ABC):
                  target_limit: float | None = None,
                  control_limit: float | None = None,
                  target_minimum: float | None = None,
-                 control_minimum: float | None = None):
+                 control_minimum: float | None = None,
+                 coalesce_writes: bool = False):
         self._last_set_target = None
         self._last_set_control = None
         self._calibration = Calibration.standard() if calibration is None else calibration
         self.target_limits = Limits(target_minimum, target_limit)
         self.control_limits = Limits(control_minimum, control_limit)
         self._on_invalid_output = []
+        self._write_lock = threading.Lock()
+        self._writer = CoalescingWriter(lambda _, value: self._write(value), type(self).__name__) if coalesce_writes else None
+        self._ramp = None
+        self._ramp_thread = None
+        self._ramp_lock = threading.Lock()
+        self._ramp_wakeup = threading.Event()
 
     # __enter__ and __exit__ are defined since most Outputs require IO handling, and it's
     # nice if all Outputs then accept the use of context managers. However, to avoid masking
@@ -68,6 +111,10 @@ class OutputInterface(ABC):
         return self
 
     def __exit__(self, *args: Any) -> None:
+        # Stop ramping and send the last setpoint before the connection is closed
+        self.cancel_ramp(wait=True)
+        if self._writer is not None:
+            self._writer.close()
         try:
             super().__exit__(*args)  # type: ignore
         except AttributeError:
@@ -75,21 +122,45 @@ class OutputInterface(ABC):
 
     @property
     def target(self) -> float | None:
+        """
+        The measured target value if the output has feedback (and a fresh reading is available),
+        otherwise the last set target value.
+        """
+        if self.has_feedback:
+            measured = self.measured_target
+            if measured is not None:
+                return measured
         return self._last_set_target
 
     @target.setter
     def target(self, target_value: float) -> None:
         """
-        Set a target value for the signal.
+        Set a target value for the signal. Note that this does not stop a running ramp - call cancel_ramp first.
+        """
+        self.set_resolved(*self.resolve(target_value))
+
+    def resolve(self, target_value: float) -> Tuple[bool, float, float]:
+        """
+        What setting target_value would actually write, without writing anything: (is_valid, target, control), with
+        target and control corrected to the limits if the value isn't valid. Used to compute values ahead of time.
         """
         control_value = self._calibration.to_control(target_value)
-        is_valid, new_target, new_control = self._validate(target_value, control_value)
+        return self._validate(target_value, control_value)
+
+    def set_resolved(self, is_valid: bool, target_value: float, control_value: float) -> None:
+        """
+        Write values that have already been computed by resolve.
+        """
         if not is_valid:
             for handler in self._on_invalid_output:
                 handler()
-        self._last_set_control = new_control
-        self._last_set_target = new_target
-        self._write(new_control)
+        with self._write_lock:
+            self._last_set_control = control_value
+            self._last_set_target = target_value
+            if self._writer is not None:
+                self._writer.put(None, control_value)
+            else:
+                self._write(control_value)
 
     @property
     def control(self) -> float | None:
@@ -99,6 +170,10 @@ class OutputInterface(ABC):
         """
         return self._last_set_control
 
+    @property
+    def last_set_target(self) -> float | None:
+        return self._last_set_target
+
     @property
     def has_feedback(self) -> bool:
         """
@@ -107,9 +182,127 @@ class OutputInterface(ABC):
         """
         return False
 
+    @property
+    def measured_target(self) -> float | None:
+        """
+        The latest measured target value, or None if there is no (fresh) measurement. Must not block,
+        so implementations should return a cached reading. Only meaningful if has_feedback is True.
+        """
+        return None
+
+    def wait_until_settled(self, tolerance: float, timeout: float, poll_interval: float = 0.05,
+                           cancel_event: threading.Event | None = None) -> bool:
+        """
+        Block until the measured target value is within tolerance of the last set target value.
+        Returns False if that doesn't happen within timeout seconds, or if the output has no feedback.
+        If cancel_event is given, the wait is also given up (returning False) as soon as it's set.
+        """
+        if not self.has_feedback:
+            return False
+        deadline = time.monotonic() + timeout
+        while True:
+            measured = self.measured_target
+            set_value = self._last_set_target
+            if measured is not None and set_value is not None and abs(measured - set_value) <= tolerance:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if cancel_event is None:
+                time.sleep(min(poll_interval, remaining))
+            elif cancel_event.wait(min(poll_interval, remaining)):
+                return False
+
     def add_invalid_output_handler(self, handler: Callable[[], None]) -> None:
         self._on_invalid_output.append(handler)
 
+    def flush_writes(self, timeout: float | None = None) -> bool:
+        """
+        Wait until the last set value has been written to the device. Returns False on timeout.
+        Returns immediately if writes aren't coalesced, since every write is then synchronous.
+        """
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    @property
+    def is_ramping(self) -> bool:
+        return self._ramp is not None
+
+    def ramp_to(self, target_value: float, rate: float, interval: float = 0.1) -> Future[float]:
+        """
+        Move the output towards target_value by at most rate (target units per second), writing a new
+        intermediate value every interval seconds from a background thread. Returns a future that's
+        resolved with the final target value once it has been written.
+
+        If a ramp is already running, it's retargeted from wherever it currently is, and the future of
+        the previous ramp is cancelled. If no value has been set on the output yet, there's nothing to ramp
+        from, so the target is written directly.
+        """
+        if rate <= 0 or interval <= 0:
+            raise ValueError('Ramp rate and update interval must be positive')
+        # Ramp towards the value that will actually be set, or the ramp could never finish
+        _, final_target, _ = self._validate(target_value, self._calibration.to_control(target_value))
+        future: Future[float] = Future()
+        with self._ramp_lock:
+            if self._ramp is not None:
+                self._ramp.future.cancel()
+            self._ramp = _Ramp(final_target, rate, interval, future)
+            self._ramp_wakeup.clear()
+            if self._ramp_thread is None:
+                self._ramp_thread = threading.Thread(target=self._ramp_loop, daemon=True)
+                self._ramp_thread.start()
+        return future
+
+    def cancel_ramp(self, wait: bool = False) -> None:
+        """
+        Stop a running ramp at its current value. The future of the ramp is cancelled.
+        Cancelling the future returned by ramp_to has the same effect.
+        """
+        with self._ramp_lock:
+            if self._ramp is not None:
+                self._ramp.future.cancel()
+                self._ramp = None
+            thread = self._ramp_thread
+            self._ramp_wakeup.set()
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _ramp_loop(self) -> None:
+        while True:
+            with self._ramp_lock:
+                ramp = self._ramp
+                if ramp is not None and ramp.future.cancelled():
+                    ramp = self._ramp = None
+                if ramp is None:
+                    self._ramp_thread = None
+                    return
+                current = self._last_set_target
+                step = ramp.rate * ramp.interval
+                # Small tolerance, so that rounding errors don't add an extra tiny step at the end
+                finished = current is None or abs(ramp.target - current) <= step * (1 + 1e-9)
+                next_value = ramp.target if finished or current is None else current + copysign(step, ramp.target - current)
+
+            try:
+                self.target = next_value
+            except Exception as e:
+                logger.exception('OutputInterface: Ramp aborted due to an error while writing.')
+                with self._ramp_lock:
+                    if self._ramp is ramp:
+                        self._ramp = None
+                        _resolve(ramp.future, exception=e)
+                continue
+
+            if finished:
+                self.flush_writes()
+                with self._ramp_lock:
+                    if self._ramp is ramp:
+                        self._ramp = None
+                        _resolve(ramp.future, result=next_value)
+                continue
+            if self._ramp_wakeup.wait(ramp.interval):
+                self._ramp_wakeup.clear()
+
     @abstractmethod
     def _write(self, control_signal: float) -> None:
         """
@@ -147,7 +340,7 @@ class OutputInterface(ABC):
 class MockOutput(OutputInterface):
     def _write(self, control_value: float) -> None:
         # print(f'Writing control signal value {control_value}')
-        logger.debug(f'MockOutput:     Setting control_signal to {control_value}')
+        logger.debug('MockOutput:     Setting control_signal to %s', control_value)
     
     def _read_from_device(self) -> None:
         pass
@@ -15,8 +15,11 @@ class PicoOutput(OutputInterface, USBConnection):
     Setting voltage_limit allows for a safety-check if a higher voltage is set.
     Setting a value that's out of bounds for the DAC will result in a maximum/minimum
     signal being sent (provided that the target voltage is safe)
+
+    Setting coalesce_writes sends values from a background writer that drops superseded setpoints.
     """
-    def __init__(self, *, port: str | None, calibration: Calibration, voltage_limit: float | None = None, bits: int = 12):
+    def __init__(self, *, port: str | None, calibration: Calibration, voltage_limit: float | None = None, bits: int = 12,
+                 coalesce_writes: bool = False):
         self.bits = bits
         BAUD_RATE = 115200
         # Initialize USB Connection
@@ -30,7 +33,8 @@ class PicoOutput(OutputInterface, USBConnection):
         OutputInterface.__init__(
             self,
             calibration=calibration,
-            target_limit=voltage_limit
+            target_limit=voltage_limit,
+            coalesce_writes=coalesce_writes
         )
 
     def _write(self, control_value: float) -> None:
@@ -61,3 +65,7 @@ class PicoOutput(OutputInterface, USBConnection):
             if not control_validation:
                 raise ValueError('No valid output could be set with the current configuration')
         return parent_valid and not changed, target_value, control_value
+
+    def _read_from_device(self) -> list[float]:
+        # The DAC firmware (see Pico/main.py) never answers, so there's nothing to read back
+        return []
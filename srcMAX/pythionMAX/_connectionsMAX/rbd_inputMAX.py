@@ -17,9 +17,20 @@ class RBDInput(BufferInput, USBConnection):
         MICRO = 1
         MILLI = 2
 
+    MAX_RESPONSE_SIZE = 25  # Bytes
+    BUFFER_CAPACITY = 1020  # Bytes, of the USB driver's receive buffer
+    MAX_SAMPLE_RATE = 1000  # Hz, the shortest sampling interval is 1 ms
+
     exp: int
 
-    def __init__(self, *, port: str, rbd_sample_rate: int, pull_rate: int, unit: RBDInput.CurrentUnit, discard_unstable: bool = True):
+    @classmethod
+    def min_pull_rate(cls, rbd_sample_rate: float) -> float:
+        """
+        The lowest pull rate (Hz) at which the samples sent between two reads always fit in the USB buffer.
+        """
+        return cls.MAX_RESPONSE_SIZE * rbd_sample_rate / cls.BUFFER_CAPACITY
+
+    def __init__(self, *, port: str, rbd_sample_rate: float, pull_rate: float, unit: RBDInput.CurrentUnit, discard_unstable: bool = True):
         self.rbd_sample_rate = rbd_sample_rate
         self.discard_unstable = discard_unstable
         self.exp = 3  # In case of milliamps; change below if needed
@@ -29,10 +40,10 @@ class RBDInput(BufferInput, USBConnection):
             self.exp = 6
 
         BAUD_RATE = 57600
-        MAX_RESPONSE_SIZE = 25  # Bytes
-        BUFFER_CAPACITY = 1020
-        if MAX_RESPONSE_SIZE * rbd_sample_rate / pull_rate > BUFFER_CAPACITY:
-            print('USB buffer risk overflowing. Increase pull rate or edit USB drivers to increase buffer size')
+        if pull_rate < self.min_pull_rate(rbd_sample_rate):
+            logger.warning('RBDInput:       USB buffer risks overflowing at %s Hz sampling and %s Hz pull rate. Increase the pull rate '
+                           'to at least %.3g Hz or edit the USB drivers to increase the buffer size', rbd_sample_rate, pull_rate,
+                           self.min_pull_rate(rbd_sample_rate))
 
         BufferInput.__init__(self, pull_rate=pull_rate)
         USBConnection.__init__(self, port=port, baud_rate=BAUD_RATE, eol_char='\r\n')
@@ -63,17 +74,17 @@ class RBDInput(BufferInput, USBConnection):
         try:
             original_message = message.strip()
             if not bool(re.match(r'^&S[=<>*],Range=\d{3}[num]A,[+-][\d.]{6},[mun]A$', original_message)):
-                logging.warning(f"RBDInput:       Cannot interpret the line '{original_message}' as it doesn't fit pattern.")
+                logger.warning("RBDInput:       Cannot interpret the line '%s' as it doesn't fit pattern.", original_message)
                 return None
             if self.discard_unstable:
                 if original_message[2] == '*':
                     return None
                 match original_message[2]:
                     case '*':
-                        logging.warning('RBDInput:       Recieved unstable measurement, discarding...')
+                        logger.warning('RBDInput:       Recieved unstable measurement, discarding...')
                         return None
                     case '>' | '<':
-                        logging.warning('RBDInput:       Measurement outside of range, discarding...')
+                        logger.warning('RBDInput:       Measurement outside of range, discarding...')
                         return None
 
             _, _, value_str, unit_str = original_message.split(',')
@@ -88,11 +99,11 @@ class RBDInput(BufferInput, USBConnection):
                 case 'm':
                     exp = exp-3
             res: float = num * 10 ** exp
-            logger.debug(f'RBDInput:       Interpreted {original_message} as {res}')
+            logger.debug('RBDInput:       Interpreted %s as %s', original_message, res)
             return res
 
         except (ValueError, AssertionError, IndexError):
-            logging.warning(f"RBDInput:       Unexpected error when the line '{message.strip()}' was parsed.")
+            logger.warning("RBDInput:       Unexpected error when the line '%s' was parsed.", message.strip())
             return None
 
 
@@ -1,7 +1,8 @@
 from __future__ import annotations
 from enum import Enum
-from typing import Self
+from typing import Self, Any
 
+from srcMAX.pythionMAX._connectionsMAX.feedbackMAX import OutputFeedback
 from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import OutputInterface
 from srcMAX.pythionMAX._connectionsMAX.usbMAX import USBConnection
 from srcMAX.pythionMAX._connectionsMAX.calibrationMAX import Calibration, LinearCalibration
@@ -24,7 +25,14 @@ class RS3000Output(OutputInterface, USBConnection):
                                                       Given by a pythion.connections.Calibration object.
         mode            : RS3000Output.PowerOption  - Determines whether voltage [V] or current [mA] will
                                                       be used as target signal.
+        coalesce_writes : bool                      - Send setpoints from a background writer, dropping
+                                                      values that are superseded before the link is free.
+        feedback_rate   : float | None              - If given, the actual output is read back (VOUT1?/IOUT1?)
+                                                      this many times per second while connected. The readings
+                                                      are available as an input stream through 'feedback'.
     """
+    COMMAND_INTERVAL = 0.05  # s - The RS3005P drops commands that arrive too close together
+    RESPONSE_SIZE = 5  # Bytes - Read-back values are formatted like 12.34 (V) or 1.234 (A)
 
     def __init__(self,
                  *,
@@ -32,7 +40,9 @@ class RS3000Output(OutputInterface, USBConnection):
                  control_limit: float | None = None,
                  target_limit: float | None,
                  calibration: Calibration | None = None,
-                 mode: PowerOptions = PowerOptions.VOLTAGE
+                 mode: PowerOptions = PowerOptions.VOLTAGE,
+                 coalesce_writes: bool = False,
+                 feedback_rate: float | None = None
                  ):
 
         unit = 'V' if mode == PowerOptions.VOLTAGE else 'mA'
@@ -47,24 +57,46 @@ class RS3000Output(OutputInterface, USBConnection):
             control_limit = 5000
 
         self._mode = mode
+        self._feedback_rate = feedback_rate
+        self.feedback = OutputFeedback(
+            self._read_measured_target,
+            max_age=None if feedback_rate is None else 2 / feedback_rate,
+            name=f'RS3000Output ({port})'
+        )
 
         BAUD_RATE = 9600
         USBConnection.__init__(
             self,
             port=port,
-            baud_rate=BAUD_RATE
+            baud_rate=BAUD_RATE,
+            command_interval=self.COMMAND_INTERVAL
         )
         OutputInterface.__init__(
             self,
             calibration=calibration,
             control_limit=control_limit,
-            target_limit=target_limit
+            target_limit=target_limit,
+            coalesce_writes=coalesce_writes
         )
 
     def __enter__(self) -> Self:
         super().__enter__()
+        if self._feedback_rate is not None:
+            self.feedback.start_sampling(self._feedback_rate)
         return self
 
+    def __exit__(self, *args: Any) -> None:
+        self.feedback.stop_sampling()
+        super().__exit__(*args)
+
+    @property
+    def has_feedback(self) -> bool:
+        return self._feedback_rate is not None
+
+    @property
+    def measured_target(self) -> float | None:
+        return self.feedback.latest()
+
     @staticmethod
     def _to_voltage_string(voltage: float) -> str:
         return f'{voltage:.2f}'.rjust(5, '0')
@@ -80,3 +112,15 @@ class RS3000Output(OutputInterface, USBConnection):
         else:
             str = self._to_current_string(control_value)
         self.write(f'{"V" if is_voltage else "I"}SET1:{str}')
+
+    def _read_from_device(self) -> list[float]:
+        """
+        Query the actual output voltage [V] or current [mA], i.e. the control signal.
+        """
+        if self._mode == PowerOptions.VOLTAGE:
+            return [float(self.query('VOUT1?', self.RESPONSE_SIZE))]
+        return [float(self.query('IOUT1?', self.RESPONSE_SIZE)) * 1000]
+
+    def _read_measured_target(self) -> float:
+        control_value, = self._read_from_device()
+        return self._calibration.to_target(control_value)
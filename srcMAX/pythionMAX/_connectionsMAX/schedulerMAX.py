@@ -0,0 +1,90 @@
+from __future__ import annotations
+from typing import Callable, ClassVar
+import heapq
+import itertools
+import threading
+import time
+import logging
+
+logger = logging.getLogger('pythion')
+
+
+class ScheduledJob:
+    def __init__(self, callback: Callable[[], None], interval: float, name: str):
+        self.callback = callback
+        self.interval = interval
+        self.name = name
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class AcquisitionScheduler:
+    """
+    A single background thread that runs periodic acquisition jobs, such as polling a device for read-back
+    values. Sharing one thread between all devices avoids starting a new threading.Timer for every sample.
+    Jobs run one at a time, so each job should be short (a single query or so). A job that falls behind is
+    rescheduled relative to the current time rather than run several times in a row to catch up.
+
+    Use AcquisitionScheduler.shared() to get the instance that's shared across the program.
+    """
+    _shared: ClassVar[AcquisitionScheduler | None] = None
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    _queue: list[tuple[float, int, ScheduledJob]]
+    _thread: threading.Thread | None
+
+    def __init__(self) -> None:
+        self._queue = []
+        self._counter = itertools.count()  # Tie breaker, so that jobs themselves are never compared
+        self._thread = None
+        self._condition = threading.Condition()
+
+    @classmethod
+    def shared(cls) -> AcquisitionScheduler:
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def schedule(self, callback: Callable[[], None], interval: float, name: str = '') -> ScheduledJob:
+        """
+        Run callback every interval seconds, starting one interval from now, until the returned job is cancelled.
+        """
+        if interval <= 0:
+            raise ValueError('Interval must be positive')
+        job = ScheduledJob(callback, interval, name)
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + interval, next(self._counter), job))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='AcquisitionScheduler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return job
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    # Drop cancelled jobs, and stop the thread if nothing is left to do
+                    while self._queue and self._queue[0][2].cancelled:
+                        heapq.heappop(self._queue)
+                    if not self._queue:
+                        self._thread = None
+                        return
+                    due, _, job = self._queue[0]
+                    delay = due - time.monotonic()
+                    if delay <= 0:
+                        heapq.heappop(self._queue)
+                        break
+                    self._condition.wait(delay)
+
+            try:
+                job.callback()
+            except Exception:
+                logger.exception(f'AcquisitionScheduler: Job {job.name} failed.')
+
+            if not job.cancelled:
+                with self._condition:
+                    heapq.heappush(self._queue, (max(due + job.interval, time.monotonic()), next(self._counter), job))
@@ -1,5 +1,7 @@
 from __future__ import annotations
 import logging
+import threading
+import time
 from typing import Iterable, Any, Self
 from enum import Enum
 from serial.tools import list_ports  # type: ignore
@@ -151,16 +153,22 @@ class USBConnection:
     add_line_break: bool
     ser: Serial | None
 
-    def __init__(self, port: str, baud_rate: int, eol_char: str | None = None, xon_xoff: bool | None = False):
+    def __init__(self, port: str, baud_rate: int, eol_char: str | None = None, xon_xoff: bool | None = False, command_interval: float = 0):
         """
         The port need not be set at the time of initialization, but it must have a value by the time
         __enter__ is called!
+        command_interval is the minimum time (in seconds) between two commands, for devices that can't
+        keep up with back-to-back messages.
         """
         self.port = port
         self.baud_rate = baud_rate
         self.eol_char = eol_char
         self.ser = None
         self.xon_xoff = xon_xoff
+        self.command_interval = command_interval
+        self._last_command_time = 0.0
+        # Serializes access to the port, so that writes and queries from different threads never interleave
+        self._io_lock = threading.RLock()
 
     def __enter__(self) -> Self:
         # Serial default configuration:
@@ -173,7 +181,7 @@ class USBConnection:
         if self.port is None:
             return
 
-        self.ser = Serial(self.port, self.baud_rate, timeout=5, xonxoff=self.xon_xoff)
+        self.ser = self._open_serial()
         self.ser.flush()
         try:
             super().__enter__()  # type: ignore
@@ -191,14 +199,45 @@ class USBConnection:
             pass
         logger.info(f'USBConnection:  Successfully closed connection on port {self.port}')
 
+    def _open_serial(self) -> Serial:
+        """
+        Open the port. Override to connect to something else than a real serial port, such as a simulator.
+        """
+        return Serial(self.port, self.baud_rate, timeout=5, xonxoff=self.xon_xoff)
+
     def write(self, message: str) -> None:
-        self._check_port_open()
-        assert self.ser is not None
         if self.eol_char:
             message = message + self.eol_char
-        s = str.encode(message)
-        self.ser.write(s)
-        logger.debug(f'USBConnection:  Written {s!r} on port {self.port}')
+        self.write_bytes(str.encode(message))
+
+    def write_bytes(self, s: bytes) -> None:
+        """
+        Write an already encoded message as is (no line ending is added).
+        """
+        self._check_port_open()
+        assert self.ser is not None
+        with self._io_lock:
+            if self.command_interval:
+                remaining = self._last_command_time + self.command_interval - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+            self.ser.write(s)
+            self._last_command_time = time.monotonic()
+        logger.debug('USBConnection:  Written %r on port %s', s, self.port)
+
+    def query(self, message: str, response_size: int | None = None) -> str:
+        """
+        Write a message and return the device's response: exactly response_size bytes if given,
+        otherwise a single line. Nothing else can be written to the port in between.
+        """
+        with self._io_lock:
+            self.write(message)
+            assert self.ser is not None
+            data: bytes = self.ser.read(response_size) if response_size is not None else self.ser.read_until()
+        if not data or (response_size is not None and len(data) < response_size):
+            raise USBConnectionException(f'No complete response to {message!r} on port {self.port}')
+        logger.debug('USBConnection:  Response %r on port %s', data, self.port)
+        return data.decode()
 
     def read_newlines(self, max_lines: int | None = None) -> list[str]:
         """
@@ -216,16 +255,20 @@ class USBConnection:
         self._check_port_open()
         assert self.ser is not None
         data: list[bytes] = []
-        logger.debug(f'USBConnection:  Start reading on port {self.port}')
-        while self.ser.in_waiting > 0:
-            # Could it happen that this while loop never exit if the stream writes fast enough?
-            # Only one way to find out!
-            # For that reason, a max_lines argument is also passed
-            line = self.ser.read_until()
-            logger.debug(f'USBConnection:  Read line: {line!r}')
-            data.append(line)
-            if max_lines is not None and len(data) > max_lines:
-                break
+        debug = logger.isEnabledFor(logging.DEBUG)  # Checked once rather than for every line
+        if debug:
+            logger.debug('USBConnection:  Start reading on port %s', self.port)
+        with self._io_lock:
+            while self.ser.in_waiting > 0:
+                # Could it happen that this while loop never exit if the stream writes fast enough?
+                # Only one way to find out!
+                # For that reason, a max_lines argument is also passed
+                line = self.ser.read_until()
+                if debug:
+                    logger.debug('USBConnection:  Read line: %r', line)
+                data.append(line)
+                if max_lines is not None and len(data) > max_lines:
+                    break
         # Decode after looping is finished, to reduce risk of getting stuck in loop
         return [b.decode() for b in data]
 
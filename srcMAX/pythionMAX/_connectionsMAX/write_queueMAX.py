@@ -0,0 +1,91 @@
+from __future__ import annotations
+from typing import Any, Callable, Hashable
+import threading
+import logging
+
+logger = logging.getLogger('pythion')
+
+
+class CoalescingWriter:
+    """
+    A latest-value-wins write queue. Values are put under a key, and a background thread writes them one
+    at a time as soon as the previous write has finished. If a new value is put under a key that's still
+    waiting to be written, the old value is simply dropped. That way, a slow link (such as a 9600 baud
+    serial connection) never builds up a backlog of stale setpoints, and put never blocks the caller.
+
+    Pending keys are written in the order they first became pending. A single output only needs a single
+    key, while a multi-channel device can use for example (channel, parameter) tuples.
+    """
+    _pending: dict[Hashable, Any]
+    _thread: threading.Thread | None
+
+    def __init__(self, write: Callable[[Any, Any], None], name: str = 'CoalescingWriter'):
+        """
+        write is called from the writer thread as write(key, value) for every value that's actually sent.
+        """
+        self._write = write
+        self.name = name
+        self._pending = {}
+        self._busy = False
+        self._stopping = False
+        self._thread = None
+        self._condition = threading.Condition()
+        self.dropped = 0  # Number of values that were superseded before being written
+
+    @property
+    def idle(self) -> bool:
+        with self._condition:
+            return not self._pending and not self._busy
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._condition:
+            if key in self._pending:
+                self.dropped = self.dropped + 1
+            self._pending[key] = value
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Block until every pending value has been written. Returns False if the timeout ran out first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, flush: bool = True, timeout: float | None = None) -> None:
+        """
+        Stop the writer thread, after writing all pending values if flush is True (otherwise they are discarded).
+        The writer can still be used afterwards, in which case a new thread is started.
+        """
+        if flush:
+            self.flush(timeout)
+        with self._condition:
+            if not flush:
+                self._pending.clear()
+            self._stopping = True
+            thread = self._thread
+            self._condition.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: bool(self._pending) or self._stopping)
+                if not self._pending:
+                    self._thread = None
+                    return
+                key = next(iter(self._pending))
+                value = self._pending.pop(key)
+                self._busy = True
+            try:
+                self._write(key, value)
+            except Exception:
+                logger.exception(f'CoalescingWriter: {self.name} failed to write {value!r} ({key!r}).')
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
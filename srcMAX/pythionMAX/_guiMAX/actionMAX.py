@@ -1,10 +1,12 @@
 from __future__ import annotations
 from datetime import datetime
-from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import QRect, QSize
+from PyQt5.QtWidgets import QWidget, QLabel
 
 from srcMAX.pythionMAX._layoutMAX.ui_actionMAX import Ui_Action
 from srcMAX.pythionMAX._routinesMAX.routine_handlerMAX import RoutineHandler
 from srcMAX.pythionMAX._routinesMAX.routineMAX import Routine
+from srcMAX.pythionMAX._routinesMAX.metricsMAX import MetricsSnapshot
 
 
 class Action(RoutineHandler, Ui_Action):
@@ -35,6 +37,7 @@ class Action(RoutineHandler, Ui_Action):
 
     def on_reset(self) -> None:
         self.button.setText(self.text)
+        self.button.setEnabled(True)
         self._finished_time = datetime.now()
         self.finishedLabel.setText(f'Finished at {self._finished_time.strftime("%H:%M:%S")}')
 
@@ -43,8 +46,22 @@ class Action(RoutineHandler, Ui_Action):
         self._starttime = datetime.now()
         self.initiatedLabel.setText(f'Started at {self._starttime.strftime("%H:%M:%S")}')
         self.finishedLabel.setText('')
+        self.metricsLabel.setText('')
+
+    def on_cancel(self) -> None:
+        self.button.setText('Cancelling...')
+        self.button.setEnabled(False)
+
+    def on_metrics(self, metrics: MetricsSnapshot) -> None:
+        self.metricsLabel.setText(str(metrics))
+        self.metricsLabel.setToolTip(f'Seconds per point: {metrics.phase_summary()}')
 
     def configure(self) -> None:
+        # Live metrics of the running routine, below the start/finish labels
+        self.metricsLabel = QLabel(self)
+        self.metricsLabel.setGeometry(QRect(10, 80, 181, 32))
+        self.metricsLabel.setWordWrap(True)
+        self.setMinimumSize(QSize(204, 115))
         # Set name label
         if self.text:
             self.button.setText(self.text)
@@ -1,24 +1,33 @@
 from __future__ import annotations
+from typing import Any
 import logging
 import copy
 
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, pyqtSignal
 from PyQt5.QtGui import QColor, QBrush
 from PyQt5.QtWidgets import QWidget
 from srcMAX.pythionMAX._layoutMAX.CAEN.ui_main_caen_2 import Ui_CAEN
 from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import OutputInterface #TODO Try to see if the output interface can be modified for this purpouse
 from srcMAX.pythionMAX._guiMAX.connect_buttonMAX import ConnectButton
 from srcMAX.pythionMAX._connectionsMAX.CAEN_IOMAX import CAENOutput
+from srcMAX.pythionMAX._connectionsMAX.CAEN_monitorMAX import CAENKey, CAENMonitor
+from srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX import STATUS_BITS, StatusBits
 
 ###INTERFACE FILE
 
 logger = logging.getLogger('pythion')
 
+COMMAND_TIMEOUT = 5  # Seconds to wait for the reply to a user command
+SLIDER_DEBOUNCE = 200  # Milliseconds a slider has to stay still before its value is sent
+BOARD_FLAGS_SET = {'YES', 'OPEN', 'LOCAL', 'ON'}  # Board parameter replies that are shown as True
+
+
 class CAEN(QWidget, Ui_CAEN, ConnectButton):
-    
+    monitorChanged: pyqtSignal = pyqtSignal(dict)
+
     def __init__(self, *, 
                  interface = OutputInterface | CAENOutput,
-                 rate: int,
+                 rate: float,
                  parent: QWidget | None = None,
                  unit: int | None = 0
                  ):
@@ -31,8 +40,13 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
         self.interface = interface
         self.rate = rate
         self.unit = unit
-        self.timer = QTimer(self) ###WILL TRY THIS FIRST. IF TOO SLOW: TRY Qtrhead
-        self.timer.setInterval(1000)
+        # Slider moves restart this timer, so the setpoints are only sent once the slider has been still for a while
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(SLIDER_DEBOUNCE)
+        # Polling runs on the monitor's own thread, and changes come back to the GUI thread through monitorChanged
+        self.monitor = CAENMonitor(interface, rate)
+        self.monitor.add_change_handler(self.monitorChanged.emit)
         self.configure()
 
         self.CH0 = CEANChannel(chno=0)
@@ -52,7 +66,7 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
             'BDTERM': False,
             'BDALARM': '0'
         }
-        self.BPparams = copy.deepcopy(self.defultBPparams) #this is the one that should be modified
+        self.BPparams: dict[str, Any] = copy.deepcopy(self.defultBPparams)  # this is the one that should be modified
 
         self.defultBPstatus = { #should not be modified
             'CH 00': False,
@@ -65,10 +79,10 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
         }
         self.BPstatus = copy.deepcopy(self.defultBPstatus) #this is the one that should be modified
 
-        self.editableCP: list[str] = ['VSET', 'ISET', 'MAXV', 'RUP', 'RDW', 'TRIP', 'DPWN', 'IMRANGE']
+        self.editableCP: list[str] = ['VSET', 'ISET', 'MAXV', 'RUP', 'RDW', 'TRIP', 'PDWN', 'IMRANGE']
         self.intCP: list[str] = ['MAXV', 'RUP', 'RDW']
         self.floatCP: list[str] = ['VSET', 'ISET', 'TRIP'] 
-        self.strCP: list[str] = ['DPWN', 'IMRANGE']
+        self.strCP: list[str] = ['PDWN', 'IMRANGE']
 
     def configure(self) -> None:
         self.ON_BTN.clicked.connect(self.AllCHON)
@@ -83,25 +97,36 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
         self.channel_number_box.valueChanged.connect(self.SCC)
         self.vset_slide.valueChanged.connect(self.VSlideEvent)
         self.vset_slide_2.valueChanged.connect(self.ISlideEvent)
-        self.timer.timeout.connect(self.AutoUpdate)
+        self.vset_slide.sliderReleased.connect(self.setSliders)
+        self.vset_slide_2.sliderReleased.connect(self.setSliders)
+        self.timer.timeout.connect(self.setSliders)
+        self.monitorChanged.connect(self._apply_monitor_changes)
 
     def AllCHON(self) -> None:
         #self.allChannelsIsOn = True
-        self.interface._write(bd = self.unit, cmd='SET', ch=4, par='ON')
-        for i, ch in enumerate(self.CHlist):
-            if self.interface._read_from_device()[i] == 'OK':
+        if self._command('SET', 'ON', ch=CAENOutput.ALL_CHANNELS) is not None:
+            for ch in self.CHlist:
                 ch.status['ON'] = True
                 self.updateCStable(ch=ch)
         self.updateSCC()
 
     def AllCHOFF(self) -> None:
         #self.allChannelsIsOn = False
-        self.interface._write(bd= self.unit, cmd='SET', ch=4, par='OFF')
-        for i, ch in enumerate(self.CHlist):
-            if self.interface._read_from_device()[i] == 'OK':
+        if self._command('SET', 'OFF', ch=CAENOutput.ALL_CHANNELS) is not None:
+            for ch in self.CHlist:
                 ch.status['ON'] = False
                 self.updateCStable(ch=ch)
         self.updateSCC()
+
+    def _command(self, cmd: str, par: str, val: int | float | str | None = None, ch: int | None = None) -> list[Any] | None:
+        """
+        Send a command and wait for the reply. Returns the reply values, or None if the command failed.
+        """
+        try:
+            return self.interface.command(cmd, par, val=val, ch=ch).result(COMMAND_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"CAEN:           {cmd} {par} failed: {e}")
+            return None
     
     def OneCHONOFF(self) -> None:
         def changeLook(self) -> None:
@@ -139,7 +164,7 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
         val: str = self.lineEdit_4.text().upper()
         ch: int = self.spinBox.value()
         par: str = self.comboBox_2.currentText()
-        self.interface._write(bd= self.unit, cmd='SET', ch=ch, par=par, val=val)
+        self.interface.set_setpoint(par, val, ch=ch)
         match par:
             case par if par in self.strCP:
                 self.CHlist[ch].params[par] = val
@@ -158,17 +183,17 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
     def VSlideEvent(self) -> None:
         ch: int = self.channel_number_box.value()
         newVal: float = self.vset_slide.sliderPosition()
-        self.interface._write(bd=self.unit, cmd='SET', ch=ch, par='VSET', val=newVal)
         self.CHlist[ch].params['VSET'] = newVal
         self.updateSCC()
+        self.timer.start()
         #self.updateCPtable(ch=self.CHlist[ch])
 
     def ISlideEvent(self) -> None:
         ch: int = self.channel_number_box.value()
         newVal: float = self.vset_slide_2.sliderPosition()
-        self.interface._write(bd=self.unit, cmd='SET', ch=ch, par='ISET', val=newVal)
         self.CHlist[ch].params['ISET'] = newVal
         self.updateSCC()
+        self.timer.start()
         #self.updateCPtable(ch=self.CHlist[ch])
 
     def _activate(self) -> None:
@@ -210,13 +235,14 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
         self.tableWidget_2.setEnabled(True)
 
         self._update_all_graphics()
-        self.interface.start_sampling(self.rate)
-        self.timer.start(1000) ###REMOMVE NUMBER AFTER TEST
+        self.monitor.clear()
+        self.monitor.start()
 
     def _deactivate(self) -> None:
         """
         Called just after CAEN connection has been destroyed.
         """
+        self.monitor.stop()
         for ch in self.CHlist:
             ch.set_defult()
             ch.clear_status()
@@ -261,7 +287,7 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
     def updateCPtable(self, ch: CEANChannel) -> None:
         keyList: list = list(ch.params.keys())
         for i, key in enumerate(keyList):
-            logger.debug(f"updateCPtable: ({ch.get_ch()},{i})")
+            logger.debug("updateCPtable: (%s,%s)", ch.get_ch(), i)
             self.CP_table.item(i, ch.get_ch()).setText(str(ch.params[key]))
             
     def updateCStable(self, ch: CEANChannel) -> None:
@@ -269,7 +295,7 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
         err_col: str = "yellowgreen"
         chIndex: int = ch.get_ch()
         for i, key in enumerate(keyList):
-            logger.debug(f"updateCPtable: ({chIndex},{i})")
+            logger.debug("updateCPtable: (%s,%s)", chIndex, i)
             self.tableWidget_2.item(i, chIndex).setText(' ')
             color = QBrush(QColor(err_col)) if ch.status[key] else QBrush(QColor("white"))
             self.tableWidget_2.item(i, chIndex).setBackground(color)
@@ -334,8 +360,13 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
             self.pushButton_7.setStyleSheet("background-color : lightblue") if self.CHlist[ch].status['ON'] else self.pushButton_7.setStyleSheet("background-color : white")
         self.lineEdit.setText("{:.2f}".format(self.CHlist[ch].params['VMON']))
         self.lineEdit_2.setText("{:.2f}".format(self.CHlist[ch].params['IMON']))
-        self.vset_slide.setSliderPosition(int(self.CHlist[ch].params['VSET']))
-        self.vset_slide_2.setSliderPosition(int(self.CHlist[ch].params['ISET']))
+        # Showing a value isn't the same as the user moving the slider, so that shouldn't send anything
+        for slider, par in [(self.vset_slide, 'VSET'), (self.vset_slide_2, 'ISET')]:
+            if slider.isSliderDown():
+                continue
+            slider.blockSignals(True)
+            slider.setSliderPosition(int(self.CHlist[ch].params[par]))
+            slider.blockSignals(False)
         changeLook(self, ch=ch)
 
     def _update_all_graphics(self) -> None:
@@ -360,6 +391,7 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
         return self
 
     def __exit__(self, *args) -> None: ###Likley compleate
+        self.monitor.stop()
         try:
             super().__exit__(self, *args)   
         except AttributeError:
@@ -368,53 +400,44 @@ class CAEN(QWidget, Ui_CAEN, ConnectButton):
     def setSliders(self):
         """
         Do this here because otherwise the sliders emits a signal for ever frame where the value is different from what it was on the last frame,
-        which would make SIMBA try to write to CAEN many times a second.
+        which would make SIMBA try to write to CAEN many times a second. Called once the sliders have been still for SLIDER_DEBOUNCE ms,
+        or released. Values that the device has already acknowledged aren't sent again.
         """
+        if self.vset_slide.isSliderDown() or self.vset_slide_2.isSliderDown():
+            return  # Still dragging, sent on release
         ch: int = self.channel_number_box.value()
+        newVVal: float = self.vset_slide.sliderPosition()
         newIVal: float = self.vset_slide_2.sliderPosition()
-        newVVal: float = self.vset_slide_2.sliderPosition()
-        self.interface._write(bd=self.unit, cmd='SET', ch=ch, par='VSET', val=newVVal)
-        self.interface._write(bd=self.unit, cmd='SET', ch=ch, par='ISET', val=newIVal)
-        pass
-
-    def MonitorContinuous(self) -> None:
-        def GASCHparams(self) -> None:
-            for parKey in self.CH0.params.keys():
-                self.interface._write(bd = self.unit, cmd='MON', ch=4, par=parKey)
-                tempParam: list = self.interface._read_from_device()
-                self.CH0.params[parKey] = tempParam[0]
-                self.CH1.params[parKey] = tempParam[1]
-                self.CH2.params[parKey] = tempParam[2]
-                self.CH3.params[parKey] = tempParam[3]
-
-        def setCHSTAT(self, ch: CEANChannel) -> None:
-            statStr: str = ch.params['STAT']
-            statBitStr = "{:0>16b}".format(int(statStr))
-            for i, key in enumerate(ch.status.keys()):
-                ch.status[key] = False if statBitStr[i] == '0' else True
-
-        def GASBDparams(self) -> None:
-            for parKey in self.BDparams.keys():
-                self.interface._write(bd = self.unit, cmd='MON', par=parKey)
-                tempParam: str = self.interface._read_from_device()
-                self.BDparams[parKey] = tempParam
-
-        def setBDSTAT(self) -> None:
-            statStr: str = self.BPparams['BDALARM']
-            statBitStr = "{:0>16b}".format(int(statStr))
-            for i, key in enumerate(self.BDstatus.keys()):
-                self.BDstatus[key] = statBitStr[i]
-
-        GASCHparams(self)
-        for ch in self.CHlist:
-            setCHSTAT(self, ch)
-        GASBDparams(self)
-        setBDSTAT(self)
+        self.interface.set_setpoint('VSET', newVVal, ch=ch)
+        self.interface.set_setpoint('ISET', newIVal, ch=ch)
 
-    def AutoUpdate(self):
-        self.setSliders()
-        #self.MonitorContinuous()
-        self._update_all_graphics()
+    def _apply_monitor_changes(self, changes: dict[CAENKey, Any]) -> None:
+        """
+        Receives the values that changed since the last monitoring pass, on the GUI thread.
+        Only the tables showing a changed value are redrawn.
+        """
+        if not self.monitor.active:
+            return  # Late result from a pass that finished after disconnecting
+        channels: set[int] = set()
+        board = False
+        for (ch, par), value in changes.items():
+            if ch is None:
+                board = True
+                self.BPparams[par] = value if par == 'BDALARM' else value in BOARD_FLAGS_SET
+            elif ch < len(self.CHlist):
+                channels.add(ch)
+                self.CHlist[ch].params[par] = value
+                if par == 'STAT':
+                    self.CHlist[ch].set_status(value)
+        for ch in channels:
+            self.updateCPtable(self.CHlist[ch])
+            self.updateCStable(self.CHlist[ch])
+        if board:
+            self.BPstatus = StatusBits(int(self.BPparams['BDALARM']), STATUS_BITS['BDALARM']).as_dict()
+            self.updateBPlist()
+            self.updateBAlist()
+        if self.channel_number_box.value() in channels:
+            self.updateSCC()
 
 class CEANChannel():
     def __init__(
@@ -499,5 +522,8 @@ class CEANChannel():
     def clear_status(self) -> None:
         self.status = copy.deepcopy(self.defult_status)
 
+    def set_status(self, stat: int | str) -> None:
+        self.status = StatusBits(int(stat), STATUS_BITS['STAT']).as_dict()
+
 if __name__ == '__main__':
     pass
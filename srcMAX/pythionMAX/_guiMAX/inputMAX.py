@@ -10,7 +10,7 @@ class Input(QWidget, Ui_Input, ConnectButton):
     def __init__(
         self, *,
         interface: InputInterface,
-        rate: int,
+        rate: float,
         parent: QWidget | None = None,
         name: str | None = None,
         unit: str | None = None
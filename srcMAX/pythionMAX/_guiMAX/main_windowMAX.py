@@ -2,15 +2,19 @@ from __future__ import annotations
 
 from typing import ClassVar, Any
 import sys
+import time
 import traceback
-import matplotlib.pyplot as plt
 
 import logging
 
 from PyQt5 import QtCore
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QCloseEvent
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QDesktopWidget, QVBoxLayout, QSpacerItem, QSizePolicy, QBoxLayout)
 
 from srcMAX.pythionMAX._layoutMAX.ui_main_windowMAX import Ui_MainWindow
+from srcMAX.pythionMAX._routinesMAX.executorMAX import RoutineExecutor
+from srcMAX.pythionMAX._guiMAX.outputMAX import Output
 
 
 logger = logging.getLogger('pythion')
@@ -19,6 +23,8 @@ logger = logging.getLogger('pythion')
 class MainWindow(QMainWindow, Ui_MainWindow):
     _instance: ClassVar[MainWindow | None] = None
     _app: ClassVar[QApplication]
+    CLOSE_TIMEOUT: ClassVar[float] = 5  # Seconds to wait for cancelled routines before closing anyway
+    CLOSE_CHECK_INTERVAL: ClassVar[int] = 50  # Milliseconds between checks whether the routines have finished
 
     def __new__(cls, *args: Any, **kwargs: Any) -> MainWindow:
         # This __new__ method serves two purposes: enforcing a singleton pattern (i.e. only one MainWindowComponent may ever
@@ -49,6 +55,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         # Custom initialization
         self.setupUi(self)  # type: ignore
         self.resize(QDesktopWidget().availableGeometry(self).size() * 0.8)
+        self._close_deadline: float | None = None
+        self._close_timer = QTimer(self)
+        self._close_timer.setSingleShot(True)
+        self._close_timer.timeout.connect(self._retry_close)
 
     def main_widget(self) -> QWidget:
         return self.horizontalLayoutWidget
@@ -81,12 +91,34 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             logger.info('                Successfully exited program after exception')
         return exit_code
 
-    def closeEvent(self, _: Any):
+    def closeEvent(self, event: QCloseEvent | None) -> None:
         """
-        Close all open plots (must be called before Qt Application exits).
+        Cancel running routines and close all open plots (must be called before Qt Application exits).
         closeEvent will automatically be called when widget is destoyed, and is not explicitly called here.
+        The window stays open until the cancelled routines have finished, since they may need the GUI thread to reset
+        their widgets. The event loop keeps running meanwhile, and the close is retried every CLOSE_CHECK_INTERVAL ms.
         """
-        plt.close('all')
+        executor = RoutineExecutor.default()
+        if executor.running:
+            if self._close_deadline is None:
+                logger.info('MainWindow:     cancelling routines before closing.')
+                executor.cancel_all()
+                self._close_deadline = time.monotonic() + self.CLOSE_TIMEOUT
+            if time.monotonic() < self._close_deadline and event is not None:
+                event.ignore()
+                self._close_timer.start(self.CLOSE_CHECK_INTERVAL)
+                return
+            logger.warning(f'MainWindow:     routines still running after {self.CLOSE_TIMEOUT} s, closing anyway.')
+        # Ramps that aren't waited for by any routine (anymore) would keep writing until the devices are closed
+        for output in self.findChildren(Output):
+            output.interface.cancel_ramp()
+        if 'matplotlib.pyplot' in sys.modules:  # Otherwise no plots have been opened
+            sys.modules['matplotlib.pyplot'].close('all')
+        if event is not None:
+            event.accept()
+
+    def _retry_close(self) -> None:
+        self.close()
 
     def excepthook(self, exc_type, exc_value, exc_tb):
         """
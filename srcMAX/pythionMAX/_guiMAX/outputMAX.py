@@ -13,6 +13,7 @@ logger = logging.getLogger('pythion')
 class Output(QWidget, Ui_Output, ConnectButton):
     valueChanged: pyqtSignal = pyqtSignal(float)
     label: str
+    interface: OutputInterface
 
     def __init__(
         self, *,
@@ -39,7 +40,7 @@ class Output(QWidget, Ui_Output, ConnectButton):
 
     def configure(self) -> None:
         if self.interface.has_feedback:
-            logger.warning('Output:         Live feedback has not been implemented!')
+            logger.info(f'Output:         {self.label} has live feedback. Hook up an Input to its feedback stream to display it.')
 
         # Set name label
         self.nameLabel.setText(self.label)
@@ -87,11 +88,11 @@ class Output(QWidget, Ui_Output, ConnectButton):
         be used by external callers. Beware, however, that there will be no
         visual indication that the output value has changed!
         """
-        logger.debug(f'Output:         Setting {self.label} to {val}.')
+        logger.debug('Output:         Setting %s to %s.', self.label, val)
         self.interface.target = val  # Try to set value on the underlying interface
 
     def _update_graphics(self):
-        val = self.interface.target  # Outgoing value might have changed due to illegal output, so get back the set value
+        val = self.interface.last_set_target  # Outgoing value might have changed due to illegal output, so get back the set value
         if not self._value_set:
             # If this is the first value that's been set, "activate" LCD
             self._value_set = True
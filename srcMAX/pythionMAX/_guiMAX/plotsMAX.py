@@ -70,11 +70,11 @@ class PlotStream(LinePlot):
     init_time: float | None  # Standard time
     time_list: npt.NDArray[np.float64]  # Time relative to init_time
     data_list: npt.NDArray[np.float64]
-    timespan: int
+    timespan: float
     fix_scale: bool  # If set to true, then x values will be fixed between 0 and timespan.
     _cutting: bool  # Internal state variable that keeps track of whether data has overflown the timespan
 
-    def __init__(self, *, parent: QWidget | None = None, input: InputInterface, timespan: int = 60, fix_scale: bool = False):
+    def __init__(self, *, parent: QWidget | None = None, input: InputInterface, timespan: float = 60, fix_scale: bool = False):
         super().__init__(parent=parent)
         self.init_time = None
         self.time_list = np.empty((0,))
@@ -0,0 +1,29 @@
+from __future__ import annotations
+from typing import Any, Callable, Mapping, Sequence
+import importlib
+import sys
+
+
+def lazy_exports(package: str, modules: Mapping[str, Sequence[str]]) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """
+    Module __getattr__ and __dir__ functions (PEP 562) for an interface package, which import every exported name
+    from its module the first time it's used, instead of when the package is imported. modules maps the full module
+    names to the names exported from them. Usage, in the package's __init__:
+        __getattr__, __dir__ = lazy_exports(__name__, {'srcMAX.pythionMAX._routinesMAX.scan_planMAX': ['ScanPlan']})
+    """
+    origins = {name: module for module, names in modules.items() for name in names}
+    namespace = sys.modules[package].__dict__
+
+    def __getattr__(name: str) -> Any:
+        try:
+            module = origins[name]
+        except KeyError:
+            raise AttributeError(f'module {package!r} has no attribute {name!r}') from None
+        value = getattr(importlib.import_module(module), name)
+        namespace[name] = value  # Found directly from now on, without calling __getattr__
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(namespace) | set(origins))
+
+    return __getattr__, __dir__
@@ -0,0 +1,82 @@
+from __future__ import annotations
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import queue
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most burst records with the same logger, level and message template every interval seconds.
+    When a message is let through again, it tells how many similar ones were dropped in between.
+    The message template is the unformatted message, so call sites that should be rate limited as one must use
+    lazy %-style arguments (logger.warning('Bad line %r', line)) rather than f-strings.
+    Windows that have run out are forgotten at most every interval seconds, when a new message comes in, so that
+    messages that are only logged once don't pile up. Messages that were suppressed in a forgotten window are
+    then never counted.
+    """
+    def __init__(self, burst: int = 10, interval: float = 10):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows: dict[tuple[str, int, str], list[float | int]] = {}  # key -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None and now - self._last_prune >= self.interval:
+                self._prune(now)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = int(window[2]) if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] = window[1] + 1
+                suppressed = 0
+            else:
+                window[2] = window[2] + 1
+                return False
+        if suppressed:
+            record.msg = f'{record.getMessage()} ({suppressed} similar messages suppressed)'
+            record.args = None
+        return True
+
+    def _prune(self, now: float) -> None:
+        self._windows = {key: window for key, window in self._windows.items() if now - window[0] < self.interval}
+        self._last_prune = now
+
+
+class _LogListener(QueueListener):
+    """
+    A QueueListener that can be stopped more than once, e.g. explicitly and then again at exit.
+    """
+    def stop(self) -> None:
+        if self._thread is not None:
+            super().stop()
+
+
+def configure_logging(filename: str, level: int = logging.INFO, burst: int = 10, interval: float = 10) -> QueueListener:
+    """
+    Send all log records to filename from a background thread. Logging calls only put the record on a queue, so
+    e.g. a burst of warnings on an acquisition thread never waits for the disk. Repeated messages are rate limited
+    (see RateLimitFilter). The listener is stopped, and the queue written out, when the program exits.
+    """
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    file_handler = logging.FileHandler(filename, mode='a')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    listener = _LogListener(log_queue, file_handler, respect_handler_level=True)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(burst, interval))
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    logging.getLogger('pythion').setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import ClassVar, TYPE_CHECKING
+import threading
+import logging
+
+from PyQt5.QtCore import QThreadPool
+
+if TYPE_CHECKING:
+    from srcMAX.pythionMAX._routinesMAX.routineMAX import Routine
+
+logger = logging.getLogger('pythion')
+
+
+class RoutineExecutor:
+    """
+    Runs routines on a thread pool of its own, so that routines never wait for (or are waited for together with)
+    unrelated work on Qt's global pool. Up to max_routines routines run at the same time, e.g. a time series while
+    a grid search is running.
+
+    Cancelling is cooperative: cancel sets the routine's cancel token and returns right away. The routine stops at
+    its next check, and sleeps and measurement waits wake up as soon as the token is set.
+    """
+    _default: ClassVar[RoutineExecutor | None] = None
+
+    _running: set[Routine]
+
+    def __init__(self, max_routines: int = 4):
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_routines)
+        self._running = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls) -> RoutineExecutor:
+        """
+        The executor shared by all RoutineHandlers.
+        """
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    @property
+    def running(self) -> list[Routine]:
+        with self._lock:
+            return list(self._running)
+
+    def is_running(self, routine: Routine) -> bool:
+        with self._lock:
+            return routine in self._running
+
+    def start(self, routine: Routine) -> bool:
+        """
+        Start a routine on the pool, with a fresh cancel token. Returns False if the routine is already running.
+        """
+        with self._lock:
+            if routine in self._running:
+                return False
+            self._running.add(routine)
+        routine.cancel_event.clear()
+        routine.executor = self
+        self.pool.start(routine)
+        return True
+
+    def cancel(self, routine: Routine) -> None:
+        routine.cancel()
+
+    def cancel_all(self) -> None:
+        for routine in self.running:
+            routine.cancel()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Block until all routines have finished, or until timeout seconds have passed. Returns False on timeout.
+        Don't call this on the GUI thread while routines may be waiting for it.
+        """
+        return self.pool.waitForDone(-1 if timeout is None else round(timeout * 1000))
+
+    def _finished(self, routine: Routine) -> None:
+        with self._lock:
+            self._running.discard(routine)
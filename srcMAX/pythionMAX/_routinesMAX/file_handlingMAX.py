@@ -1,6 +1,7 @@
-from datetime import datetime
 from dataclasses import dataclass
-import os
+from typing import Any
+
+from srcMAX.pythionMAX._routinesMAX.results_storeMAX import ResultsStore
 
 
 @dataclass
@@ -11,22 +12,9 @@ class FileSettings:
     timestamp: bool = True
 
 
-def generate_filename(settings: FileSettings) -> str:
-    if settings.timestamp:
-        now = datetime.now()
-        filename = f'{now:%y%m%d}T{now:%H%M}_' + settings.name
-
-    uniqueifier = ''
-    complete_path = settings.path + '/' + filename + uniqueifier + '.' + settings.extension
-
-    # If directory exists, make sure file name is unique. Else, create directory(-ies)
-    if os.path.exists(settings.path):
-        counter = 1
-        while os.path.exists(complete_path):
-            uniqueifier = f'({counter})'
-            counter = counter + 1
-            complete_path = settings.path + '/' + filename + uniqueifier + '.' + settings.extension
-    else:
-        os.makedirs(settings.path)
-    print(complete_path)
-    return complete_path
+def generate_filename(settings: FileSettings, parameters: dict[str, Any] | None = None, shape: tuple[int, ...] | None = None) -> str:
+    """
+    Create a new, uniquely named result file as described by settings, and return its path. The file is added to
+    the index of its directory (see ResultsStore), together with the run's parameters and shape if given.
+    """
+    return ResultsStore(settings.path).create(settings.name, settings.extension, settings.timestamp, parameters, shape)
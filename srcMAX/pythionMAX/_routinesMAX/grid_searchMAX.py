@@ -1,18 +1,18 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from time import sleep
 import numpy.typing as npt
 import numpy as np
 import logging
-from typing import Self, Generator
-from contextlib import nullcontext
-from io import TextIOWrapper
+from typing import Self
 
 from srcMAX.pythionMAX._routinesMAX.heatmapMAX import Heatmap
 from srcMAX.pythionMAX._guiMAX.outputMAX import Output
 from srcMAX.pythionMAX._guiMAX.inputMAX import Input
 from srcMAX.pythionMAX._routinesMAX.measurement_routineMAX import MeasurementRoutine, ValueUpdateSettings
-from srcMAX.pythionMAX._routinesMAX.file_handlingMAX import generate_filename, FileSettings
+from srcMAX.pythionMAX._routinesMAX.file_handlingMAX import FileSettings
+from srcMAX.pythionMAX._routinesMAX.headlessMAX import HeadlessGridSearch
+from srcMAX.pythionMAX._routinesMAX.run_archiveMAX import read_gridsearch_csv
+from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput
 
 logger = logging.getLogger('pythion')
 
@@ -26,6 +26,7 @@ class GridSearch(MeasurementRoutine):
         update_graphics: bool
         plot_every: int | None = None  # Setting plot_every to 0 or None will disable live plots.
         reset_to_zero: bool = False
+        measure_timeout: float | None = 10  # Points where the input doesn't deliver measure_samples within this time (s) are recorded as nan
 
     @dataclass
     class Device:
@@ -33,11 +34,14 @@ class GridSearch(MeasurementRoutine):
         values: list[int]
         wait_time: float
         bidirectional: bool = True
+        ramp_rate: float | None = None  # If set, the output is ramped between values at this rate (units/s) before waiting wait_time
+        settle_tolerance: float | None = None  # If set and the output has feedback, wait_time is only a timeout for the measured value to settle
 
         @classmethod
-        def from_stepsize(cls, output: Output, wait_time: float, start_value: int, end_value: int, step_size: int, bidirectional: bool = True) -> Self:
+        def from_stepsize(cls, output: Output, wait_time: float, start_value: int, end_value: int, step_size: int, bidirectional: bool = True,
+                          ramp_rate: float | None = None, settle_tolerance: float | None = None) -> Self:
             values = [round(i) for i in range(start_value, end_value+step_size, step_size)]
-            return cls(output, values, wait_time, bidirectional)
+            return cls(output, values, wait_time, bidirectional, ramp_rate, settle_tolerance)
 
     devices: tuple[Device, ...]
     input: Input
@@ -45,8 +49,8 @@ class GridSearch(MeasurementRoutine):
     results: npt.NDArray[np.float64]
     heatmap: Heatmap | None
     file_settings: FileSettings | None
+    search: HeadlessGridSearch | None
 
-    _indices: list[int]
     _counter: int
 
     def __init__(self,
@@ -61,6 +65,7 @@ class GridSearch(MeasurementRoutine):
         self.input = input
         self.settings = settings
         self.file_settings = file_settings
+        self.search = None
         self.set_output_mode = ValueUpdateSettings.MOVE_KNOBS if settings.update_graphics else ValueUpdateSettings.NO_GRAPHICS
 
         if len(self.devices) == 2 and plot_settings is not None:  # Initiate heatmap plot (don't show yet!)
@@ -71,9 +76,27 @@ class GridSearch(MeasurementRoutine):
         self.add_task(self.execute)
 
     def execute(self) -> None:
-        # Initialize results matrix
-        shape = [len(dev.values) for dev in self.devices]
-        self.results = np.zeros(shape)
+        if not isinstance(self.input.interface, BufferInput):
+            logger.error('GridSearch:     Measuring from other InputInterfaces than BufferInput is not implemented!')
+            return
+
+        # The search itself runs on the interfaces directly, this routine only adds the GUI updates and plots
+        self.search = HeadlessGridSearch(
+            *[HeadlessGridSearch.Device(dev.output.interface, dev.values, dev.wait_time, dev.bidirectional, dev.ramp_rate,
+                                        dev.settle_tolerance, dev.output.label) for dev in self.devices],
+            input=self.input.interface,
+            settings=HeadlessGridSearch.Settings(self.settings.measure_samples, self.settings.measure_checktime, self.settings.reset_to_zero,
+                                                 self.settings.measure_timeout),
+            file_settings=self.file_settings,
+            input_label=self.input.label,
+            on_set=self._on_set,
+            on_point=self._on_point,
+            on_progress=lambda done, total: self.publish_metrics(),
+            metrics=self.metrics,
+            cancel_event=self.cancel_event
+        )
+        self.results = self.search.results
+        self._counter = 1
 
         # Initialize plot
         live_plot = self.heatmap and self.settings.plot_every
@@ -82,98 +105,32 @@ class GridSearch(MeasurementRoutine):
             # Show plot to prepare live update
             self.run_on_main_thread(self.heatmap.plot, self.results)
 
-        # Initialize outputs
-        max_wait = max(dev.wait_time for dev in self.devices)
-        for dev in self.devices:
-            assert len(dev.values) > 0  # Must be at least one value per Output
-            self.set_output(dev.output, dev.values[0], self.set_output_mode, False)
-        sleep(max_wait)
-
-        # Start recursive grid search
-        self._indices = [0 for _ in self.devices]
-        self._counter = 1
-
-        # Configure file writing if required
-        filename = generate_filename(self.file_settings) if self.file_settings is not None else None
-        with (open(filename, mode='x') if filename is not None else nullcontext()) as file:
-            f = None
-            if filename is not None:
-                f = file
-                # Write header row
-                f.write(','.join([dev.output.label for dev in self.devices]) + f',{self.input.label}')
-
-            # Measure the very first value manually
-            self._measure(f)
-            # The rest are measured by recursion
-            self._grid_search(0, f)
-
-        # Reset all devices to 0 upon completed grid search
-        if self.settings.reset_to_zero:
-            for dev in self.devices:
-                self.set_output(dev.output, 0, self.set_output_mode, False)
+        self.search.run()
 
         # Final plot
         if self.heatmap:
             if live_plot:
-                self.run_on_main_thread(self.heatmap.update, self.results)
+                self.run_on_main_thread(self._update_heatmap, self.results, key='heatmap')
             else:
                 self.run_on_main_thread(self.heatmap.plot, self.results)
 
-    def _grid_search(self, depth: int, file: TextIOWrapper | None) -> bool:
-        """
-        Iterate the device at the given "depth", and recursively conduct a full grid search for all devices of greater "depths"
-        If an open file stream is provided (TextIOWrapper is the return type of open(filename, 'x')), results will be written continuously.
-
-        It's assumed that all devices are initialized in the correct starting position, *and that a measurement has already been conducted
-        in this position*. Therefore, measurements will only be conducted after a devices settings have changed!
-        """
-        dev = self.devices[depth]  # Device to iterate
-        is_inverted = self._indices[depth] > 0  # Is the devices initial position at the end of its range? Then search backwards
-        iter_list = list(enumerate(dev.values))  # List indices and values of devices settings
-        if is_inverted:
-            iter_list = list(reversed(iter_list))  # Reverse iteration list if backwards search is required
-
-        if depth+1 < len(self.devices):
-            # Do an initial grid search
-            if not self._grid_search(depth + 1, file):
-                return False
-        for i, val in iter_list[1:]:  # Iterate over all settings, skip first as that measurement is assumed to be complete
-            if self.handler._cancelled:
-                return False
-            self._indices[depth] = i
-            logger.debug('GridSearch:     setting value')
-            self.set_output(dev.output, val, self.set_output_mode, False)
-            sleep(dev.wait_time)
-            self._measure(file)
-            if depth+1 < len(self.devices):
-                if not self._grid_search(depth + 1, file):
-                    return False
-
-        if not dev.bidirectional:
-            # Reset device
-            self._indices[depth] = 0
-            logger.debug('GridSearch:     setting value')
-            self.set_output(dev.output, dev.values[0], self.set_output_mode, False)
-            # Return device to initial state before proceeding
-            sleep(dev.wait_time)
-        return True
-        # Return True to its caller if run to completion. Return False (early) if
-        # cancel flag is set to true, or child routine discover cancel flag set to true
-
-    def _measure(self, file: TextIOWrapper | None) -> None:
-        value = self.measure(self.input, self.settings.measure_samples, self.settings.measure_checktime)
-        self.results[tuple(self._indices)] = value
+    def _on_set(self, device_index: int, value: float) -> None:
+        if self.set_output_mode != ValueUpdateSettings.NO_GRAPHICS:
+            move_knobs = self.set_output_mode == ValueUpdateSettings.MOVE_KNOBS
+            self.update_widget(self.devices[device_index].output, "delayed_set_value", value, move_knobs, block=False)
+
+    def _on_point(self, indices: tuple[int, ...], value: float) -> None:
         if self.heatmap and self.settings.plot_every:
             if self._counter % self.settings.plot_every == 0:
-                self.run_on_main_thread(self.heatmap.update, self.results)
+                # Only the latest frame is drawn if the main thread falls behind
+                self.run_on_main_thread(self._update_heatmap, self.results, key='heatmap')
             self._counter = self._counter + 1
-        if file is not None:
-            assert isinstance(file, TextIOWrapper)
-            device_settings_string = ','.join(str(val) for val in self._get_set_values())
-            file.write(f'\n{device_settings_string},{value}')
 
-    def _get_set_values(self) -> Generator[float, None, None]:
-        yield from (device.values[current_index] for device, current_index in zip(self.devices, self._indices))
+    def _update_heatmap(self, results: npt.NDArray[np.float64]) -> None:
+        # Runs on the main thread, so the plot phase is the time spent drawing, not the time spent queuing the call
+        assert self.heatmap is not None
+        with self.metrics.phase('plot'):
+            self.heatmap.update(results)
 
     def heatmap_from_devices(self, settings: Heatmap.Settings, devices: tuple[GridSearch.Device, GridSearch.Device]):
         labels = [dev.output.label for dev in devices]
@@ -182,28 +139,8 @@ class GridSearch(MeasurementRoutine):
 
 
 def load_gridsearch_result(filepath: str, plot_settings: Heatmap.Settings | None = Heatmap.Settings(1, 1000, 1, 21)) -> Self:
-    # The file is read in two passes
-    # First determining which combinations of values have been examined, and second, getting the values.
-
-    with open(filepath, 'rt') as file:
-        header = file.readline()
-        device_names = header.split(',')
-        cbar_title = device_names.pop()  # Todo: add title to plot
-        device_values = [set() for _ in device_names]
-        for line in file.readlines():
-            vals = line.split(',')[0:-1]
-            for val, dev_vals in zip(vals, device_values):
-                dev_vals.add(int(val))
-        dims, sorted_device_values = zip(*[(len(dev_vals), sorted(dev_vals)) for dev_vals in device_values])
-        results = np.empty(dims)
-        results[:] = 0
-        file.seek(0)  # Set read pointer at beginning again
-        file.readline()
-        for line in file.readlines():
-            vals = line.split(',')
-            measurement_val = vals.pop()
-            indices = tuple(dev_vals.index(int(val)) for dev_vals, val in zip(sorted_device_values, vals))
-            results[indices] = measurement_val
+    device_names, sorted_device_values, cbar_title, results = read_gridsearch_csv(filepath)
+    dims = results.shape
 
     if len(dims) == 2 and plot_settings is not None:
         # Flip y axis so that 0 is in bottom left corner
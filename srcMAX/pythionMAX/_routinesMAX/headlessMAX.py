@@ -0,0 +1,308 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from contextlib import nullcontext
+from statistics import mean
+from typing import Any, Callable, Self, Sequence
+from concurrent.futures import CancelledError
+import threading
+import logging
+import time
+
+import numpy as np
+import numpy.typing as npt
+
+from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import OutputInterface
+from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput
+from srcMAX.pythionMAX._routinesMAX.file_handlingMAX import generate_filename, FileSettings
+from srcMAX.pythionMAX._routinesMAX.scan_planMAX import ScanPlan
+from srcMAX.pythionMAX._routinesMAX.metricsMAX import RoutineMetrics
+from srcMAX.pythionMAX._routinesMAX.results_sinkMAX import ResultsSink
+from srcMAX.pythionMAX._routinesMAX.results_storeMAX import ResultsStore
+
+# Nothing in this module may depend on Qt: it's used both by the GUI routines and for scans on machines without a display.
+
+logger = logging.getLogger('pythion')
+
+
+RAMP_CHECK_INTERVAL = 0.05  # How often a ramp that's being waited for checks the cancel event (s)
+
+
+def set_interface_value(interface: OutputInterface, value: float, ramp_rate: float | None = None,
+                        cancel_event: threading.Event | None = None) -> bool:
+    """
+    Set an output and return once the value has reached the device. If ramp_rate is given, the output is ramped
+    to the value at that rate (units per second) and the function returns when the ramp is finished.
+    If cancel_event is set during the ramp, the ramp is stopped where it is. Returns False if the ramp didn't
+    finish, because it was cancelled or retargeted by someone else.
+    """
+    if ramp_rate is None:
+        interface.target = value
+        interface.flush_writes()  # Settling times are counted from when the value has reached the device
+        return True
+    future = interface.ramp_to(value, ramp_rate)
+    if cancel_event is not None:
+        while not future.done():
+            if cancel_event.wait(RAMP_CHECK_INTERVAL):
+                interface.cancel_ramp()
+                return False
+    try:
+        future.result()
+    except CancelledError:
+        return False
+    return True
+
+
+class MeasurementTimeout(TimeoutError):
+    """
+    Raised when an input doesn't deliver enough samples for a measurement within the measurement timeout.
+    """
+
+
+def interruptible_sleep(seconds: float, cancel_event: threading.Event | None = None, metrics: RoutineMetrics | None = None) -> bool:
+    """
+    Sleep for the given time, or until cancel_event is set. Returns False if the sleep was cut short by cancel_event.
+    If metrics is given, the time actually slept is recorded there.
+    """
+    start = time.monotonic()
+    if cancel_event is None:
+        time.sleep(seconds)
+        cancelled = False
+    else:
+        cancelled = cancel_event.wait(seconds)
+    if metrics is not None:
+        metrics.waited(time.monotonic() - start)
+    return not cancelled
+
+
+def measure_buffer(interface: BufferInput, n_samples: int, check_time: float, cancel_event: threading.Event | None = None,
+                   timeout: float | None = None, metrics: RoutineMetrics | None = None) -> float:
+    """
+    Average of at least n_samples fresh samples. The buffer is checked every check_time seconds until enough
+    samples have arrived. If cancel_event is set while waiting, the average of the samples so far is returned
+    (nan if there are none). Raises MeasurementTimeout if there still aren't enough samples after timeout seconds.
+    """
+    interface.restart_buffer()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    vals = []
+    i = 1
+    try:
+        while True:
+            logger.debug('MeasurementRoutine: measuring (%d)...', i)
+            i = i + 1
+            cancelled = not interruptible_sleep(check_time, cancel_event, metrics)
+            vals = interface.get_buffer()
+            if len(vals) >= n_samples or cancelled:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise MeasurementTimeout(f'Got {len(vals)} of {n_samples} samples in {timeout} s')
+    finally:
+        interface.stop_buffer()
+    average = float(mean(vals)) if vals else float('nan')
+    logger.debug('MeasurementRoutine: measured (%s), average %s.', vals, average)
+    return average
+
+
+class HeadlessGridSearch:
+    """
+    The grid search of GridSearch, run directly on the hardware interfaces without any GUI. Can be used from a
+    script (see simba_headlessMAX.py), and is what GridSearch runs on its worker thread.
+    The search is first compiled into a ScanPlan, which is then executed step by step. The time spent setting,
+    settling, measuring and writing to file is recorded in metrics, which can be read while the search runs.
+
+    All callbacks are called from the thread that runs the search:
+        on_set(device_index, value)     - after an output has been set (before settling).
+        on_point(indices, value)        - after every measurement, with the grid indices of the point.
+        on_progress(done, total)        - after every measurement, with the number of points measured so far.
+    """
+    @dataclass
+    class Settings:
+        measure_samples: int
+        measure_checktime: float
+        reset_to_zero: bool = False
+        measure_timeout: float | None = 10  # Points where the input doesn't deliver measure_samples within this time (s) are recorded as nan
+
+    @dataclass
+    class Device:
+        interface: OutputInterface
+        values: Sequence[float]
+        wait_time: float
+        bidirectional: bool = True
+        ramp_rate: float | None = None  # If set, the output is ramped between values at this rate (units/s) before waiting wait_time
+        settle_tolerance: float | None = None  # If set and the output has feedback, wait_time is only a timeout for the measured value to settle
+        label: str = 'Output'
+
+        @classmethod
+        def from_stepsize(cls, interface: OutputInterface, wait_time: float, start_value: int, end_value: int, step_size: int,
+                          bidirectional: bool = True, ramp_rate: float | None = None, settle_tolerance: float | None = None,
+                          label: str = 'Output') -> Self:
+            values = [round(i) for i in range(start_value, end_value+step_size, step_size)]
+            return cls(interface, values, wait_time, bidirectional, ramp_rate, settle_tolerance, label)
+
+    devices: tuple[Device, ...]
+    input: BufferInput
+    settings: HeadlessGridSearch.Settings
+    file_settings: FileSettings | None
+    results: npt.NDArray[np.float64]
+    plan: ScanPlan | None
+    metrics: RoutineMetrics
+    filename: str | None
+
+    _done: int
+
+    def __init__(self,
+                 *devices: Device,
+                 input: BufferInput,
+                 settings: HeadlessGridSearch.Settings,
+                 file_settings: FileSettings | None = None,
+                 input_label: str = 'Input',
+                 on_set: Callable[[int, float], None] | None = None,
+                 on_point: Callable[[tuple[int, ...], float], None] | None = None,
+                 on_progress: Callable[[int, int], None] | None = None,
+                 metrics: RoutineMetrics | None = None,
+                 cancel_event: threading.Event | None = None):
+        assert all(len(dev.values) > 0 for dev in devices)  # Must be at least one value per device
+        self.devices = devices
+        self.input = input
+        self.input_label = input_label
+        self.settings = settings
+        self.file_settings = file_settings
+        self.on_set = on_set
+        self.on_point = on_point
+        self.on_progress = on_progress
+        self.filename = None
+        self.plan = None
+        self.metrics = RoutineMetrics() if metrics is None else metrics
+        self.results = np.zeros(self.shape)
+        # A cancel event that's passed in belongs to the caller, who is also responsible for clearing it
+        self._owns_cancel_event = cancel_event is None
+        self._cancel_event = threading.Event() if cancel_event is None else cancel_event
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(len(dev.values) for dev in self.devices)
+
+    @property
+    def total_points(self) -> int:
+        return int(np.prod(self.shape))
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """
+        Stop the search. Waits and measurements in progress are cut short. Can be called from any thread.
+        """
+        self._cancel_event.set()
+
+    def compile(self) -> ScanPlan:
+        """
+        Compute the scan plan without running anything. The plan can be inspected (ETA, validation errors) before
+        calling run, which executes the latest compiled plan.
+        """
+        self.plan = ScanPlan.compile(self.devices, self.settings.measure_checktime, self.settings.reset_to_zero)
+        return self.plan
+
+    def run(self) -> npt.NDArray[np.float64]:
+        """
+        Run the complete search and return the results, indexed like the devices' values. If the search is
+        cancelled, the points that weren't measured are left at 0.
+        """
+        plan = self.plan if self.plan is not None else self.compile()
+        for error in plan.errors:
+            logger.warning(f'GridSearch:     {error}')
+        if self._owns_cancel_event:
+            self._cancel_event.clear()
+        self.results.fill(0)
+        self._done = 0
+        metrics = self.metrics
+        metrics.reset(plan.n_points, plan.estimated_duration)
+
+        # Everything the loop needs is computed up front, so that each step is only IO and waiting
+        devices = [dev.interface for dev in self.devices]
+        ramp_rates = [dev.ramp_rate for dev in self.devices]
+        steps = list(zip(plan.device.tolist(), plan.targets.tolist(), plan.controls.tolist(), plan.valid.tolist(), plan.waits.tolist(),
+                         plan.settle.tolist(), plan.measure.tolist(), map(tuple, plan.indices.tolist())))
+        rows = [tuple(dev.values[i] for dev, i in zip(self.devices, indices)) for *_, indices in steps]
+
+        # Configure file writing if required. The file is written on a thread of its own, so that the disk never delays the scan
+        self.filename = generate_filename(self.file_settings, self.parameters(), self.shape) if self.file_settings is not None else None
+        columns = [dev.label for dev in self.devices] + [self.input_label]
+        with (ResultsSink(self.filename, columns, exclusive=False) if self.filename is not None else nullcontext()) as sink:
+            step = 0
+            while step < len(steps):
+                if step < plan.reset_start and self.cancelled:
+                    step = plan.reset_start  # Skip to resetting the devices
+                    continue
+                device, target, control, is_valid, wait, settle, measure, indices = steps[step]
+                logger.debug('GridSearch:     setting value')
+                with metrics.phase('set'):
+                    if ramp_rates[device] is None:
+                        devices[device].set_resolved(is_valid, target, control)
+                        devices[device].flush_writes()  # Settling times are counted from when the value has reached the device
+                    # Ramps back to zero are never cut short by cancelling, since they're what makes cancelling safe
+                    elif not set_interface_value(devices[device], target, ramp_rates[device],
+                                                 self._cancel_event if step < plan.reset_start else None):
+                        if self.cancelled:
+                            continue  # Skip to resetting the devices
+                        logger.warning(f'GridSearch:     ramp of {self.devices[device].label} was interrupted before reaching {target}')
+                if self.on_set is not None:
+                    self.on_set(device, target)
+                with metrics.phase('settle'):
+                    if settle:
+                        self._settle(self.devices[device], wait)
+                    elif wait:
+                        interruptible_sleep(wait, self._cancel_event, metrics)
+                if measure:
+                    self._measure(sink, indices, rows[step])
+                step = step + 1
+        if self.file_settings is not None and self.filename is not None:
+            ResultsStore(self.file_settings.path).update(self.filename, points=self._done, cancelled=self.cancelled)
+        return self.results
+
+    def parameters(self) -> dict[str, Any]:
+        """
+        The settings of the search, as they are recorded in the results index.
+        """
+        return {'devices': [dev.label for dev in self.devices],
+                'ranges': [[dev.values[0], dev.values[-1], len(dev.values)] for dev in self.devices],
+                'wait_times': [dev.wait_time for dev in self.devices],
+                'input': self.input_label,
+                'measure_samples': self.settings.measure_samples,
+                'measure_checktime': self.settings.measure_checktime}
+
+    def _settle(self, dev: HeadlessGridSearch.Device, wait_time: float) -> None:
+        """
+        Wait for a device to settle after setting a new value. Outputs with feedback are done as soon as the measured
+        value is within settle_tolerance of the set value (or after wait_time at the latest), others always wait wait_time.
+        """
+        interface = dev.interface
+        if dev.settle_tolerance is not None and interface.has_feedback:
+            start = time.monotonic()
+            settled = interface.wait_until_settled(dev.settle_tolerance, wait_time, cancel_event=self._cancel_event)
+            self.metrics.waited(time.monotonic() - start)
+            if not settled and not self.cancelled:
+                logger.warning(f'GridSearch:     {dev.label} did not settle within {wait_time} s')
+        else:
+            interruptible_sleep(wait_time, self._cancel_event, self.metrics)
+
+    def _measure(self, sink: ResultsSink | None, indices: tuple[int, ...], row: tuple[float, ...]) -> None:
+        with self.metrics.phase('measure'):
+            try:
+                value = measure_buffer(self.input, self.settings.measure_samples, self.settings.measure_checktime, self._cancel_event,
+                                       self.settings.measure_timeout, self.metrics)
+            except MeasurementTimeout as e:
+                logger.warning(f'GridSearch:     no measurement at {row}: {e}')
+                value = float('nan')
+        if self.cancelled:
+            return  # The measurement was cut short
+        self.results[indices] = value
+        self._done = self._done + 1
+        if sink is not None:
+            with self.metrics.phase('file'):
+                sink.write(*row, value)
+        self.metrics.point_done()
+        if self.on_point is not None:
+            self.on_point(indices, value)
+        if self.on_progress is not None:
+            self.on_progress(self._done, self.total_points)
@@ -1,11 +1,12 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from matplotlib.colors import SymLogNorm, Normalize
-import seaborn as sns  # type: ignore
-import matplotlib.pyplot as plt  # type: ignore
+from typing import Any
 import numpy as np
 import numpy.typing as npt
 
+# seaborn and pyplot are imported when the heatmap is first drawn rather than here. Together they take most of a
+# second to import, which every program importing the routines would otherwise pay, whether it plots or not.
+
 
 class Heatmap:
     @dataclass
@@ -20,13 +21,25 @@ class Heatmap:
         self.labels = labels
         self.yticks = self.filter_ticklabels(ticks[0], settings.max_label_count)
         self.xticks = self.filter_ticklabels(ticks[1], settings.max_label_count)
-        self.palette = palette if palette is not None else sns.color_palette('crest', as_cmap=True)
+        self._palette = palette
         self.ax = None
         self.fig = None
         self.cbar_ax = None
         self.cbar_label = cbar_label
 
+    @property
+    def palette(self) -> Any:
+        if self._palette is None:
+            import seaborn as sns  # type: ignore
+            self._palette = sns.color_palette('crest', as_cmap=True)
+        return self._palette
+
+    @palette.setter
+    def palette(self, palette: Any) -> None:
+        self._palette = palette
+
     def plot(self, data: npt.NDArray[np.float64]):
+        import matplotlib.pyplot as plt  # type: ignore
         self.fig, (self.ax, self.cbar_ax) = plt.subplots(1, 2, gridspec_kw={'width_ratios': (0.9, 0.05), 'wspace': 0.2}, figsize=(10, 8))
         self.update(data)
         plt.show(block=False)
@@ -49,6 +62,9 @@ class Heatmap:
         if self.ax is None:
             self.plot(data)
             return  # plot calls update on its own, so we can return from here
+        import matplotlib.pyplot as plt  # type: ignore
+        from matplotlib.colors import SymLogNorm, Normalize
+        import seaborn as sns  # type: ignore
         assert self.ax is not None, self.cbar_ax is not None
         ylabel, xlabel = self.labels
         self.ax.cla()
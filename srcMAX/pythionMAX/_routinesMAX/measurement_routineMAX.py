@@ -1,12 +1,11 @@
 from enum import Enum
-from statistics import mean
-from time import sleep
 import logging
 
 from srcMAX.pythionMAX._routinesMAX.routineMAX import Routine
 from srcMAX.pythionMAX._guiMAX.outputMAX import Output
 from srcMAX.pythionMAX._guiMAX.inputMAX import Input
 from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput
+from srcMAX.pythionMAX._routinesMAX.headlessMAX import set_interface_value, measure_buffer
 
 
 logger = logging.getLogger('pythion')
@@ -19,7 +18,8 @@ class ValueUpdateSettings(Enum):
 
 
 class MeasurementRoutine(Routine):
-    def set_output(self, output: Output, value: float, update_settings: ValueUpdateSettings = ValueUpdateSettings.MOVE_KNOBS, block: bool = True) -> None:
+    def set_output(self, output: Output, value: float, update_settings: ValueUpdateSettings = ValueUpdateSettings.MOVE_KNOBS, block: bool = True,
+                   ramp_rate: float | None = None) -> None:
         """
         Set the output of a component.
         Parameters:
@@ -37,35 +37,28 @@ class MeasurementRoutine(Routine):
                           GUI has been updated, while block=False allows for the program to continue
                           immediately. This might lead to an unexpected delay in setting the output
                           value if the main thread is being blocked by other things, such as plotting.
+        ramp_rate       - if given, the output is ramped to the new value at this rate (units per second)
+                          instead of being set in one step. The function returns when the ramp is finished,
+                          or stops the ramp where it is if the routine is cancelled.
         """
 
         # Bypass the output component and set the value to the hardware interface directly
-        interface = output.interface
-        interface.target = value
+        set_interface_value(output.interface, value, ramp_rate, self.cancel_event)
 
         # Then, send a request to update the graphics
         if update_settings != ValueUpdateSettings.NO_GRAPHICS:
             move_knobs = update_settings == ValueUpdateSettings.MOVE_KNOBS
             self.update_widget(output, "delayed_set_value", value, move_knobs, block=block)
 
-    def measure(self, input: Input, n_samples: int, check_time: float) -> float:
+    def measure(self, input: Input, n_samples: int, check_time: float, timeout: float | None = None) -> float:
+        """
+        Average of at least n_samples fresh samples from input, checking every check_time seconds.
+        Cancelling the routine cuts the measurement short. Raises MeasurementTimeout if the input hasn't delivered
+        n_samples after timeout seconds.
+        """
         interface = input.interface
         if not isinstance(interface, BufferInput):
             logger.error('MearurementRoutine: Measuring from other InputInterfaces than BufferInput is not implemented!')
             return 0
 
-        # Wait for measure_time seconds as many times as needed to recieve at least one measurement
-        interface.restart_buffer()
-        vals = []
-        i = 1
-        while True:
-            logger.debug(f'MeasurementRoutine: measuring ({i})...')
-            i = i + 1
-            sleep(check_time)
-            vals = interface.get_buffer()
-            if len(vals) >= n_samples:
-                break
-        interface.stop_buffer()
-        average = float(mean(vals))
-        logger.debug(f'MeasurementRoutine: measured ({vals}), average {average}.')
-        return average
+        return measure_buffer(interface, n_samples, check_time, self.cancel_event, timeout, self.metrics)
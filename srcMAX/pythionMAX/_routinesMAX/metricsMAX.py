@@ -0,0 +1,119 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator
+import threading
+import time
+
+
+@dataclass(frozen=True)
+class MetricsSnapshot:
+    """
+    The state of a running routine at one moment. phase_times are the average seconds per point spent in each phase.
+    idle is the total time spent in waits (see waited), and waits their number.
+    """
+    done: int
+    total: int
+    elapsed: float
+    phase_times: dict[str, float]
+    finish: datetime | None
+    idle: float = 0
+    waits: int = 0
+
+    @property
+    def time_per_point(self) -> float | None:
+        return self.elapsed / self.done if self.done else None
+
+    def __str__(self) -> str:
+        s = f'{self.done}/{self.total} points'
+        if self.time_per_point is not None:
+            s = s + f', {self.time_per_point:.2f} s/point'
+        if self.finish is not None:
+            s = s + f', done ~{self.finish:%H:%M:%S}'
+        return s
+
+    def phase_summary(self) -> str:
+        return ' '.join(f'{phase} {seconds:.3f}' for phase, seconds in self.phase_times.items())
+
+
+class RoutineMetrics:
+    """
+    Live throughput figures of a routine: how many points have been taken, and how the time per point is split
+    between the phases of the routine. Time is recorded with the phase context manager, e.g.
+        with metrics.phase('settle'):
+            sleep(wait_time)
+    Sleeps and polling waits are also recorded one by one with waited, which gives the total idle time of the routine.
+    The metrics are updated from the routine's thread and can be read from any other thread with snapshot. Phases
+    can also be recorded from other threads, e.g. 'plot' is recorded on the main thread where the plot is drawn,
+    so it can overlap with the phases of the routine's thread.
+    """
+    PHASES = ('set', 'settle', 'measure', 'plot', 'file')
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, total: int = 0, estimated_duration: float | None = None) -> None:
+        """
+        Start counting again, for a routine that takes total points. estimated_duration (seconds) is used to project
+        the finish time until the first point is done.
+        """
+        with self._lock:
+            self._total = total
+            self._done = 0
+            self._estimate = estimated_duration
+            self._started = time.monotonic()
+            self._phases = {phase: 0.0 for phase in self.PHASES}
+            self._idle = 0.0
+            self._waits = 0
+
+    @property
+    def started(self) -> bool:
+        return self._total > 0
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self._phases[phase] = self._phases.get(phase, 0) + seconds
+
+    def waited(self, seconds: float) -> None:
+        """
+        Record one wait that took seconds (the time actually waited, which is shorter if the wait was cut short).
+        """
+        with self._lock:
+            self._idle = self._idle + seconds
+            self._waits = self._waits + 1
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, time.monotonic() - start)
+
+    def point_done(self) -> None:
+        with self._lock:
+            self._done = self._done + 1
+
+    def snapshot(self) -> MetricsSnapshot:
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            done = self._done
+            phase_times = {phase: seconds / done if done else 0 for phase, seconds in self._phases.items()}
+            if done:
+                remaining: float | None = elapsed / done * (self._total - done)
+            elif self._estimate is not None:
+                remaining = self._estimate - elapsed
+            else:
+                remaining = None
+            finish = datetime.now() + timedelta(seconds=max(0, remaining)) if remaining is not None else None
+            return MetricsSnapshot(done, self._total, elapsed, phase_times, finish, self._idle, self._waits)
+
+    def summary(self) -> str:
+        """
+        One line for the log when the routine has finished.
+        """
+        snapshot = self.snapshot()
+        return (f'{snapshot.done}/{snapshot.total} points in {snapshot.elapsed:.1f} s ({snapshot.idle:.1f} s idle in {snapshot.waits} waits). '
+                f'Seconds per point: {snapshot.phase_summary()}')
@@ -0,0 +1,233 @@
+from __future__ import annotations
+from typing import Any, IO, Sequence, Self, cast
+import gzip
+import queue
+import struct
+import threading
+import logging
+import time
+import os
+import zlib
+
+import numpy as np
+import numpy.typing as npt
+
+# Nothing in this module may depend on Qt: it's used both by the GUI routines and by headless scans.
+
+logger = logging.getLogger('pythion')
+
+FORMATS = ('csv', 'csv.gz', 'npy', 'npy.gz')
+
+
+def results_format(filename: str) -> str:
+    """
+    The format of a results file, from its extension: one of FORMATS.
+    """
+    for format in sorted(FORMATS, key=len, reverse=True):
+        if filename.endswith('.' + format):
+            return format
+    raise ValueError(f'Unknown results format: {filename}. Supported extensions are {", ".join(FORMATS)}')
+
+
+def open_results(filename: str, mode: str = 'rt') -> IO[Any]:
+    """
+    Open a results file, decompressing it if it's gzipped.
+    """
+    if filename.endswith('.gz'):
+        return cast(IO[Any], gzip.open(filename, mode))  # GzipFile (binary mode) isn't typed as an IO, but works as one
+    return open(filename, mode)
+
+
+def load_results(filename: str) -> npt.NDArray[np.float64]:
+    """
+    Read a numeric results file written by a ResultsSink, with one row per record. Also works on files that are
+    still being written, up to their last fsync.
+    """
+    if results_format(filename).startswith('npy'):
+        with open_results(filename, 'rb') as file:
+            data: npt.NDArray[np.float64] = np.load(file)
+            return data
+    with open_results(filename, 'rt') as file:
+        header, *lines = [line for line in file if not line.startswith('#') and line.endswith('\n')]
+    if not lines:
+        return np.empty((0, len(header.split(','))))
+    return np.loadtxt(lines, delimiter=',', ndmin=2)
+
+
+class ResultsSink:
+    """
+    Writes result records to a file on a background thread, so that the routine producing them never waits for
+    the disk. Records are put on a queue by write and written in batches. The file is flushed every flush_interval
+    seconds, and synced to disk (fsync) every fsync_interval seconds, so at most that much data is lost if the
+    program or the computer crashes. Errors on the writer thread are raised by the next write, or by close.
+
+    The format follows from the file extension:
+        csv      - a header row with the column names, then one comma separated row per record. comments are
+                   written as # lines before the header.
+        csv.gz   - the same, gzip compressed. Every flush ends a compressed block, so the file can be read up to
+                   the last flush.
+        npy      - a float64 array with one row per record. The header is updated on every fsync, so the file
+                   can always be loaded with np.load.
+        npy.gz   - written as npy while running, and compressed when the sink is closed.
+    With exclusive (the default) the file is created exclusively, so ResultsSink never overwrites an existing file.
+    Pass exclusive=False for a file that has already been created for the sink, e.g. by ResultsStore.create.
+    """
+    _STOP = object()
+    _NPY_HEADER_LENGTH = 128
+
+    def __init__(self,
+                 filename: str,
+                 columns: Sequence[str],
+                 comments: Sequence[str] = (),
+                 batch_size: int = 256,
+                 flush_interval: float = 0.5,
+                 fsync_interval: float = 5,
+                 exclusive: bool = True):
+        self.filename = filename
+        self.format = results_format(filename)
+        self.columns = list(columns)
+        self.comments = list(comments)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.exclusive = exclusive
+        self.rows_written = 0
+        self._queue: queue.Queue[Any] = queue.Queue()
+        self._error: BaseException | None = None
+        self._thread: threading.Thread | None = None
+        self._raw: IO[bytes]
+        self._file: IO[bytes] | gzip.GzipFile
+
+    def __enter__(self) -> Self:
+        self.open()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """
+        Create the file, write the header and start the writer thread.
+        """
+        if self.format.startswith('npy'):
+            path = self.filename.removesuffix('.gz')
+            if self.format == 'npy.gz' and self.exclusive and os.path.exists(self.filename):
+                raise FileExistsError(f'File exists: {self.filename!r}')
+            self._raw = self._file = open(path, self._mode)
+            self._write_npy_header()
+        else:
+            # gzip doesn't support exclusive creation, so the file is created before handing it to gzip
+            self._raw = open(self.filename, self._mode)
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='wb') if self.format == 'csv.gz' else self._raw
+            lines = [f'# {comment}\n' for comment in self.comments] + [','.join(self.columns) + '\n']
+            self._file.write(''.join(lines).encode())
+        self._flush()  # The file is valid from the start, also to readers
+        self._thread = threading.Thread(target=self._run, name=f'ResultsSink {self.filename}', daemon=True)
+        self._thread.start()
+
+    @property
+    def _mode(self) -> str:
+        return 'xb' if self.exclusive else 'wb'
+
+    def write(self, *values: Any) -> None:
+        """
+        Queue one record, with one value per column. Returns immediately.
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put(values)
+
+    def close(self) -> None:
+        """
+        Write all queued records, sync the file to disk and close it. Blocks until done.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+        if self.format == 'npy.gz':
+            self._compress()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        last_flush = last_fsync = time.monotonic()
+        stopping = False
+        unflushed = False
+        unsynced = True  # The header
+        try:
+            while not stopping:
+                batch = []
+                try:
+                    record = self._queue.get(timeout=min(self.flush_interval, self.fsync_interval))
+                    while True:
+                        if record is self._STOP:
+                            stopping = True
+                            break
+                        batch.append(record)
+                        if len(batch) >= self.batch_size:
+                            break
+                        record = self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                if batch:
+                    self._write_batch(batch)
+                    unflushed = unsynced = True
+                now = time.monotonic()
+                if unsynced and (stopping or now - last_fsync >= self.fsync_interval):
+                    self._sync()
+                    last_flush = last_fsync = now
+                    unflushed = unsynced = False
+                elif unflushed and now - last_flush >= self.flush_interval:
+                    self._flush()
+                    last_flush = now
+                    unflushed = False
+        except BaseException as e:
+            logger.exception(f'ResultsSink:    writing to {self.filename} failed.')
+            self._error = e
+        finally:
+            self._file.close()
+            self._raw.close()  # GzipFile doesn't close the file it writes to
+
+    def _write_batch(self, batch: list[tuple[Any, ...]]) -> None:
+        if self.format.startswith('npy'):
+            self._file.write(np.array(batch, dtype=np.float64).reshape(len(batch), len(self.columns)).tobytes())
+        else:
+            self._file.write(''.join(','.join(map(str, record)) + '\n' for record in batch).encode())
+        self.rows_written = self.rows_written + len(batch)
+
+    def _flush(self) -> None:
+        if isinstance(self._file, gzip.GzipFile):
+            self._file.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            self._file.flush()
+
+    def _sync(self) -> None:
+        if self.format.startswith('npy'):
+            self._write_npy_header()
+        self._flush()
+        os.fsync(self._raw.fileno())
+
+    def _write_npy_header(self) -> None:
+        """
+        Write (or rewrite) the npy header for the rows written so far. The header always has the same length, so it
+        can be updated in place.
+        """
+        header = repr({'descr': '<f8', 'fortran_order': False, 'shape': (self.rows_written, len(self.columns))})
+        magic = np.lib.format.magic(1, 0)
+        header_length = self._NPY_HEADER_LENGTH - len(magic) - 2
+        header = header.ljust(header_length - 1) + '\n'
+        assert len(header) == header_length
+        position = self._raw.tell()
+        self._raw.seek(0)
+        self._raw.write(magic + struct.pack('<H', header_length) + header.encode('latin1'))
+        if position:
+            self._raw.seek(position)
+
+    def _compress(self) -> None:
+        path = self.filename.removesuffix('.gz')
+        with open(path, 'rb') as source, open(self.filename, self._mode) as raw, gzip.GzipFile(fileobj=raw, mode='wb') as target:
+            while chunk := source.read(1 << 20):
+                target.write(chunk)
+        os.remove(path)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Any
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger('pythion')
+
+# Timestamped names look like 261019T1437_res(2).csv
+_TIMESTAMPED = re.compile(r'^(?P<date>\d{6})T(?P<time>\d{4})_(?P<name>.*?)(\(\d+\))?\.(?P<extension>[\w.]+)$')
+_PLAIN = re.compile(r'^(?P<name>.*?)(\(\d+\))?\.(?P<extension>[\w.]+)$')
+
+
+@dataclass
+class RunRecord:
+    """
+    One entry of a results directory's index: a result file and what's known about the run that wrote it.
+    """
+    file: str  # Relative to the results directory
+    name: str
+    created: str  # ISO format
+    parameters: dict[str, Any] = field(default_factory=dict)
+    shape: list[int] | None = None
+    info: dict[str, Any] = field(default_factory=dict)  # Anything added after the run started, e.g. how many points were measured
+
+    @property
+    def created_time(self) -> datetime:
+        return datetime.fromisoformat(self.created)
+
+
+class ResultsStore:
+    """
+    A directory of result files with an index of the runs in it, so that past runs can be listed and looked up
+    (by name, time and parameters) without going through the files. The index is a JSON lines file in the directory,
+    which is only ever appended to: a line about a file that's already indexed updates its entry.
+
+    New files are created with create, which picks the first free name among name, name(1), name(2), ... Names that
+    are known from the index are skipped without touching the file system, and the file itself is created
+    atomically (O_EXCL), so two runs can never get the same file even if they start at the same time.
+    """
+    INDEX = 'index.jsonl'
+
+    def __init__(self, path: str = '.'):
+        self.path = path
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, self.INDEX)
+
+    def create(self, name: str, extension: str = 'csv', timestamp: bool = True, parameters: dict[str, Any] | None = None,
+               shape: tuple[int, ...] | list[int] | None = None) -> str:
+        """
+        Create a new, empty result file, add it to the index and return its path.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        now = datetime.now()
+        base = f'{now:%y%m%d}T{now:%H%M}_{name}' if timestamp else name
+        taken = set(self._read_index())
+        counter = 0
+        while True:
+            filename = base + (f'({counter})' if counter else '') + '.' + extension
+            counter = counter + 1
+            if filename in taken:
+                continue
+            try:
+                os.close(os.open(os.path.join(self.path, filename), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                continue  # Not in the index, e.g. written before the directory had one
+        record = RunRecord(filename, name, now.isoformat(timespec='seconds'), dict(parameters or {}), list(shape) if shape is not None else None)
+        self._append(asdict(record))
+        complete_path = os.path.join(self.path, filename)
+        logger.info(f'ResultsStore:   created {complete_path}')
+        return complete_path
+
+    def update(self, filename: str, **info: Any) -> None:
+        """
+        Add information about a run to its index entry, e.g. update(filename, points=100, finished=True).
+        """
+        self._append({'file': os.path.basename(filename), 'info': info})
+
+    def runs(self) -> list[RunRecord]:
+        """
+        All indexed runs, oldest first.
+        """
+        return sorted(self._read_index().values(), key=lambda run: run.created)
+
+    def find(self, name: str | None = None, since: datetime | None = None, until: datetime | None = None, **parameters: Any) -> list[RunRecord]:
+        """
+        The indexed runs with the given name, started in the given time range, and run with the given parameter values.
+        """
+        return [run for run in self.runs()
+                if (name is None or run.name == name)
+                and (since is None or run.created_time >= since)
+                and (until is None or run.created_time <= until)
+                and all(run.parameters.get(key) == value for key, value in parameters.items())]
+
+    def latest(self, **query: Any) -> RunRecord | None:
+        """
+        The most recent run that matches the query (see find), or None.
+        """
+        runs = self.find(**query)
+        return runs[-1] if runs else None
+
+    def full_path(self, run: RunRecord) -> str:
+        return os.path.join(self.path, run.file)
+
+    def reindex(self) -> int:
+        """
+        Add result files that aren't in the index yet, e.g. from before the directory had an index. Their name and
+        time are taken from the file name (or its modification time). Returns the number of files added.
+        """
+        indexed = self._read_index()
+        added = 0
+        for filename in sorted(os.listdir(self.path)):
+            if filename == self.INDEX or filename in indexed or not os.path.isfile(os.path.join(self.path, filename)):
+                continue
+            match = _TIMESTAMPED.match(filename)
+            if match is not None:
+                created = datetime.strptime(match['date'] + match['time'], '%y%m%d%H%M')
+            else:
+                match = _PLAIN.match(filename)
+                if match is None:
+                    continue
+                created = datetime.fromtimestamp(os.path.getmtime(os.path.join(self.path, filename)))
+            self._append(asdict(RunRecord(filename, match['name'], created.isoformat(timespec='seconds'))))
+            added = added + 1
+        return added
+
+    def _append(self, entry: dict[str, Any]) -> None:
+        # One write per line in append mode, so entries from different processes don't get mixed up
+        with open(self.index_path, 'a') as file:
+            file.write(json.dumps(entry) + '\n')
+
+    def _read_index(self) -> dict[str, RunRecord]:
+        runs: dict[str, RunRecord] = {}
+        if not os.path.exists(self.index_path):
+            return runs
+        with open(self.index_path, 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f'ResultsStore:   skipping a corrupt line in {self.index_path}')
+                    continue
+                if entry['file'] in runs:
+                    runs[entry['file']].info.update(entry.get('info', {}))
+                elif 'created' in entry:
+                    runs[entry['file']] = RunRecord(**entry)
+        return runs
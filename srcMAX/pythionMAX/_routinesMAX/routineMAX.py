@@ -1,25 +1,40 @@
 from __future__ import annotations
-from typing import Any, Callable, TYPE_CHECKING
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, TYPE_CHECKING
+import threading
 import logging
 
 from PyQt5.QtWidgets import QWidget
 from PyQt5.QtCore import Qt, Q_ARG, QMetaObject, QRunnable
 
+from srcMAX.pythionMAX._routinesMAX.metricsMAX import RoutineMetrics
+from srcMAX.pythionMAX._routinesMAX.headlessMAX import interruptible_sleep
+
 # import pythion._routines.routine_handler as rth
 if TYPE_CHECKING:
     from srcMAX.pythionMAX._routinesMAX.routine_handlerMAX import RoutineHandler
+    from srcMAX.pythionMAX._routinesMAX.executorMAX import RoutineExecutor
 
 logger = logging.getLogger('pythion')
 
 
 class Routine(QRunnable):
+    """
+    A sequence of tasks that's run on a background thread by a RoutineExecutor. Tasks should check cancelled
+    regularly, and wait with sleep rather than time.sleep, so that cancelling takes effect right away.
+    """
     tasks: list[tuple[Callable[..., None], list[Any], dict[str, Any]]]
+    handler: RoutineHandler | None
+    executor: RoutineExecutor | None
 
     def __init__(self):
         super().__init__()
         self.setAutoDelete(False)
         self.handler = None
         self.tasks = []
+        self.metrics = RoutineMetrics()
+        self.executor = None
+        self.cancel_event = threading.Event()  # The cancel token, cleared when the routine is started
 
     @staticmethod
     def update_widget(widget: QWidget, slot: str, *args: Any, block: bool = False) -> None:
@@ -28,9 +43,37 @@ class Routine(QRunnable):
 
     def run(self) -> None:
         assert self.handler is not None
-        for task, args, kwargs in self.tasks:
-            task(*args, **kwargs)
-        self.update_widget(self.handler, 'reset')
+        try:
+            self.metrics.reset()
+            for task, args, kwargs in self.tasks:
+                if self.cancelled:
+                    break
+                task(*args, **kwargs)
+            if self.metrics.started:
+                logger.info(f'Routine:        {type(self).__name__} finished, {self.metrics.summary()}')
+        except Exception:
+            logger.exception(f'Routine:        {type(self).__name__} failed.')
+        finally:
+            if self.executor is not None:
+                self.executor._finished(self)
+            self.update_widget(self.handler, 'reset')
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        """
+        Ask the routine to stop. Returns immediately, the routine stops at its next check or wait.
+        """
+        self.cancel_event.set()
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        Wait for the given time, or until the routine is cancelled. Returns False if it was cancelled.
+        The time actually waited is recorded in metrics.
+        """
+        return interruptible_sleep(seconds, self.cancel_event, self.metrics)
 
     def add_task(self, task, *args, **kwargs):
         self.tasks.append((task, args, kwargs))
@@ -38,8 +81,24 @@ class Routine(QRunnable):
     def set_handler(self, handler: RoutineHandler):
         self.handler = handler
 
-    def run_on_main_thread(self, function: Callable[..., None], *args, block: bool = False, **kwargs):
+    def publish_metrics(self) -> None:
+        """
+        Send the current metrics to the handler, which shows them on the main thread.
+        """
+        if self.handler is not None:
+            self.handler.metricsUpdated.emit(self.metrics.snapshot())
+
+    def run_on_main_thread(self, function: Callable[..., Any], *args: Any, block: bool = False, key: Hashable | None = None,
+                           **kwargs: Any) -> Future[Any] | None:
+        """
+        Run function(*args, **kwargs) on the main thread. If block is True, wait for it to finish (exceptions are
+        raised here). A call with a key replaces an earlier call with the same key that hasn't run yet, so that e.g.
+        only the latest plot update is drawn. Returns a future for the result.
+        """
         if self.handler is None:
             logger.error('Routine:        Cannot execute on main thread: no RoutineHandler context available')
-        self.handler.set_function(function, *args, **kwargs)
-        self.update_widget(self.handler, 'main_thread_execute', block=block)
+            return None
+        future = self.handler.submit(function, *args, key=key, **kwargs)
+        if block:
+            future.result()
+        return future
@@ -1,77 +1,126 @@
 from __future__ import annotations
-from typing import Any, Callable, TYPE_CHECKING
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, TYPE_CHECKING
+import threading
 import logging
 
-from PyQt5.QtCore import pyqtSlot, QThreadPool
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, Qt, QMetaObject
 from PyQt5.QtWidgets import QWidget
 
+from srcMAX.pythionMAX._routinesMAX.executorMAX import RoutineExecutor
+
 if TYPE_CHECKING:
     from srcMAX.pythionMAX._routinesMAX.routineMAX import Routine
+    from srcMAX.pythionMAX._routinesMAX.metricsMAX import MetricsSnapshot
 
 logger = logging.getLogger('pythion')
 
 
+@dataclass
+class _MainThreadJob:
+    function: Callable[..., Any]
+    args: tuple[Any, ...]
+    kwargs: dict[str, Any]
+    future: Future[Any]
+
+
 class RoutineHandler(QWidget):
     """
     The intention of this class is to provide a way for asynchronously running routines to
     run small chunks of code on the main thread, that are not related to other widgets
     (such as setting the value of an output)
 
-    To do this, this class
+    To do this, this class keeps a thread-safe queue of jobs, which routines add to with submit (usually through
+    Routine.run_on_main_thread) from their own thread. The queue is emptied on the main thread, in order. A job
+    submitted with a key replaces any job with the same key that hasn't run yet, so e.g. only the latest frame of
+    a live plot is drawn if the main thread can't keep up.
     """
+    # Emitted (from the routine's thread) with a MetricsSnapshot when the routine publishes its progress
+    metricsUpdated: pyqtSignal = pyqtSignal(object)
     routine: Routine
     ready: bool
-    function: Callable[..., None] | None
-    args: list[Any]
-    kwargs: dict[str, Any]
-    _cancelled: bool
+    executor: RoutineExecutor
+    _jobs: OrderedDict[Hashable, _MainThreadJob]
 
-    def __init__(self, routine: Routine, parent: QWidget):
+    def __init__(self, routine: Routine, parent: QWidget | None, executor: RoutineExecutor | None = None):
         super().__init__(parent)
         routine.set_handler(self)
         self.routine = routine
-        self.function = None
-        self.args = []
-        self.kwargs = {}
+        self.executor = RoutineExecutor.default() if executor is None else executor
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._drain_posted = False
         self.ready = True
-        self._cancelled = False
+        self.metricsUpdated.connect(self.on_metrics)  # type: ignore
 
-    def set_function(self, function: Callable[..., None], *args, **kwargs):
-        self.function = function
-        self.args = args
-        self.kwargs = kwargs
+    def submit(self, function: Callable[..., Any], *args: Any, key: Hashable | None = None, **kwargs: Any) -> Future[Any]:
+        """
+        Queue function(*args, **kwargs) to run on the main thread. Returns a future for its result. If a job with the
+        same key is still waiting, it's replaced (and its future cancelled). Can be called from any thread.
+        """
+        job = _MainThreadJob(function, args, kwargs, Future())
+        with self._jobs_lock:
+            if key is None:
+                key = object()  # Unique, never coalesced
+            previous = self._jobs.pop(key, None)
+            self._jobs[key] = job
+            post = not self._drain_posted
+            self._drain_posted = True
+        if previous is not None:
+            previous.future.cancel()
+        if post:
+            QMetaObject.invokeMethod(self, 'main_thread_execute', Qt.QueuedConnection)  # type: ignore
+        return job.future
 
     def start(self):
         if self.ready:
             # Let's go!
             self.ready = False
             self.on_start()
-            QThreadPool.globalInstance().start(self.routine)
+            self.executor.start(self.routine)
 
     def cancel(self):
         """
-        Set cancel flag and wait for routine to exit
+        Ask the routine to stop, without waiting for it. reset is called when it has stopped.
         """
         if not self.ready:
-            self._cancelled = True
-            if QThreadPool.globalInstance().activeThreadCount():
-                QThreadPool.globalInstance().waitForDone()
-        self.reset()
+            self.routine.cancel()
+            self.on_cancel()
 
     @pyqtSlot()
     def reset(self):
         self.ready = True
-        self._cancelled = False
         self.on_reset()
 
     @pyqtSlot()
     def main_thread_execute(self):
-        if self.function is None:
-            logger.exception('RoutineHandler: cannot run function - no function has been provided')
-        self.function(*self.args, **self.kwargs)
+        """
+        Run all queued jobs. Jobs submitted while this runs are run too.
+        """
+        while True:
+            with self._jobs_lock:
+                if not self._jobs:
+                    self._drain_posted = False
+                    return
+                _, job = self._jobs.popitem(last=False)
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                job.future.set_result(job.function(*job.args, **job.kwargs))
+            except Exception as e:
+                logger.exception('RoutineHandler: A job on the main thread failed.')
+                job.future.set_exception(e)
 
     def on_start(self):
         pass
 
+    def on_cancel(self) -> None:
+        pass
+
     def on_reset(self):
         pass
+
+    def on_metrics(self, metrics: MetricsSnapshot) -> None:
+        pass
@@ -0,0 +1,203 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Any, Callable, Iterator
+import json
+import logging
+import os
+
+import numpy as np
+import numpy.typing as npt
+
+from srcMAX.pythionMAX._routinesMAX.results_sinkMAX import open_results
+from srcMAX.pythionMAX._routinesMAX.results_storeMAX import ResultsStore
+
+# Nothing in this module may depend on Qt, so that archives can be analysed from scripts and notebooks.
+
+logger = logging.getLogger('pythion')
+
+
+def _number(text: str) -> float:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def read_gridsearch_csv(filepath: str) -> tuple[list[str], list[list[float]], str, npt.NDArray[np.float64]]:
+    """
+    Read a grid search result file. Returns the device labels, the sorted values of every device, the label of
+    the measured value, and the results indexed like the device values. Points that weren't measured are 0.
+    """
+    with open_results(filepath, 'rt') as file:
+        *labels, value_label = file.readline().rstrip('\n').split(',')
+        rows = [line.rstrip('\n').split(',') for line in file if line.strip()]
+    axes = [sorted({_number(row[i]) for row in rows}) for i in range(len(labels))]
+    positions = [{value: index for index, value in enumerate(axis)} for axis in axes]
+    results = np.zeros([len(axis) for axis in axes])
+    for *values, measured in rows:
+        results[tuple(position[_number(value)] for position, value in zip(positions, values))] = float(measured)
+    return labels, axes, value_label, results
+
+
+@dataclass
+class ArchivedRun:
+    """
+    The catalogue entry of one run in a RunArchive. The results themselves are only read when data is used, and
+    then only the pages that are actually needed, since data is a memory-mapped array.
+    """
+    id: str
+    name: str
+    created: str
+    labels: list[str]
+    axes: list[list[float]]
+    value_label: str
+    shape: list[int]
+    parameters: dict[str, Any] = field(default_factory=dict)
+    source: str | None = None
+    archive_path: str = field(default='', repr=False, compare=False)
+
+    @property
+    def filename(self) -> str:
+        return os.path.join(self.archive_path, f'{self.id}.npy')
+
+    @property
+    def data(self) -> np.memmap:
+        data: np.memmap = np.load(self.filename, mmap_mode='r')
+        return data
+
+    def peak(self, rows_per_chunk: int = 256) -> tuple[float, tuple[float, ...]]:
+        """
+        The highest value of the run (ignoring nan), and the device values where it was measured. The data is
+        read in chunks of rows, so memory use doesn't depend on the size of the run.
+        """
+        data = self.data
+        best_value = -np.inf
+        best_index: tuple[int, ...] = (0,) * len(self.shape)
+        for start in range(0, max(len(data), 1), rows_per_chunk):
+            chunk = np.asarray(data[start:start + rows_per_chunk])
+            if chunk.size == 0 or np.all(np.isnan(chunk)):
+                continue
+            flat = int(np.nanargmax(chunk))
+            if chunk.flat[flat] > best_value:
+                best_value = float(chunk.flat[flat])
+                index = np.unravel_index(flat, chunk.shape)
+                best_index = (start + int(index[0]),) + tuple(int(i) for i in index[1:])
+        return best_value, tuple(axis[i] for axis, i in zip(self.axes, best_index))
+
+
+class RunArchive:
+    """
+    A campaign's worth of scans in one directory: every run's results as an .npy file, and a catalogue (JSON) with
+    what was scanned. Opening the archive only reads the catalogue. The results are memory-mapped when used, so
+    slicing one axis of a run, or computing statistics over many runs (see peaks and reduce), only reads the pages
+    that are needed instead of loading every run in full.
+    """
+    CATALOGUE = 'catalogue.json'
+
+    path: str
+    _runs: dict[str, ArchivedRun]
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._runs = {}
+        if os.path.exists(self.catalogue_path):
+            with open(self.catalogue_path, 'r') as file:
+                for entry in json.load(file):
+                    self._runs[entry['id']] = ArchivedRun(**entry, archive_path=path)
+
+    @property
+    def catalogue_path(self) -> str:
+        return os.path.join(self.path, self.CATALOGUE)
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def __iter__(self) -> Iterator[ArchivedRun]:
+        return iter(self.runs())
+
+    def __getitem__(self, id: str) -> ArchivedRun:
+        return self._runs[id]
+
+    def runs(self) -> list[ArchivedRun]:
+        """
+        All archived runs, oldest first.
+        """
+        return sorted(self._runs.values(), key=lambda run: run.created)
+
+    def find(self, name: str | None = None, since: datetime | None = None, until: datetime | None = None, **parameters: Any) -> list[ArchivedRun]:
+        """
+        The runs with the given name, started in the given time range, and run with the given parameter values.
+        """
+        return [run for run in self.runs()
+                if (name is None or run.name == name)
+                and (since is None or datetime.fromisoformat(run.created) >= since)
+                and (until is None or datetime.fromisoformat(run.created) <= until)
+                and all(run.parameters.get(key) == value for key, value in parameters.items())]
+
+    def add(self, results: npt.ArrayLike, labels: list[str], axes: list[list[float]], value_label: str, name: str,
+            created: str | None = None, parameters: dict[str, Any] | None = None, source: str | None = None) -> ArchivedRun:
+        """
+        Store the results of one run. The array is written once, and then only ever opened read-only.
+        """
+        results = np.asarray(results, dtype=np.float64)
+        created = created if created is not None else datetime.now().isoformat(timespec='seconds')
+        id = f'{created.replace(":", "").replace("-", "")}_{name}'
+        suffix = 1
+        while id + (f'_{suffix}' if suffix > 1 else '') in self._runs:
+            suffix = suffix + 1
+        id = id + (f'_{suffix}' if suffix > 1 else '')
+        run = ArchivedRun(id, name, created, list(labels), [list(axis) for axis in axes], value_label, list(results.shape),
+                          dict(parameters or {}), source, self.path)
+        np.save(run.filename, results)
+        self._runs[id] = run
+        self._save_catalogue()
+        return run
+
+    def import_gridsearch(self, filepath: str, name: str | None = None, created: str | None = None,
+                          parameters: dict[str, Any] | None = None) -> ArchivedRun:
+        """
+        Archive a grid search result file.
+        """
+        labels, axes, value_label, results = read_gridsearch_csv(filepath)
+        if name is None:
+            name = os.path.basename(filepath).split('.')[0]
+        return self.add(results, labels, axes, value_label, name, created, parameters, os.path.abspath(filepath))
+
+    def import_store(self, store: ResultsStore, **query: Any) -> list[ArchivedRun]:
+        """
+        Archive the grid search results of a results folder (see ResultsStore.find for the query) that aren't in
+        the archive yet. Returns the runs that were added.
+        """
+        archived = {run.source for run in self._runs.values()}
+        added = []
+        for record in store.find(**query):
+            filepath = os.path.abspath(store.full_path(record))
+            if filepath in archived or record.shape is None or not os.path.exists(filepath):
+                continue  # Already archived, or not a grid search
+            try:
+                added.append(self.import_gridsearch(filepath, record.name, record.created, record.parameters))
+            except (ValueError, IndexError) as e:
+                logger.warning(f'RunArchive:     cannot archive {filepath}: {e}')
+        return added
+
+    def reduce(self, function: Callable[[np.memmap], Any], runs: list[ArchivedRun] | None = None) -> list[Any]:
+        """
+        function(data) for every run (all runs by default), one run at a time.
+        """
+        return [function(run.data) for run in (runs if runs is not None else self.runs())]
+
+    def peaks(self, runs: list[ArchivedRun] | None = None) -> list[tuple[ArchivedRun, float, tuple[float, ...]]]:
+        """
+        The peak value and its position (device values) of every run (all runs by default).
+        """
+        return [(run, *run.peak()) for run in (runs if runs is not None else self.runs())]
+
+    def _save_catalogue(self) -> None:
+        # Written to a temporary file first, so that a crash never leaves a half written catalogue
+        entries = [{key: value for key, value in asdict(run).items() if key != 'archive_path'} for run in self.runs()]
+        temporary = self.catalogue_path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(entries, file, indent=1)
+        os.replace(temporary, self.catalogue_path)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Sequence, TYPE_CHECKING
+import json
+
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    from srcMAX.pythionMAX._routinesMAX.headlessMAX import HeadlessGridSearch
+
+
+@dataclass
+class ScanPlan:
+    """
+    The complete schedule of a grid search, computed before it runs. Every step sets one device and then waits,
+    and possibly measures. All arrays have one entry per step:
+        device      - index of the device that's set
+        targets     - target value to set (corrected to the device's limits)
+        controls    - the corresponding control value
+        valid       - whether the requested target was within the limits
+        waits       - predicted wait after setting, in seconds
+        settle      - whether to wait by settling the device (True), or just sleep waits seconds (False)
+        ramp_times  - predicted time for ramping to the target, if the device is ramped
+        measure     - whether to measure after waiting
+        indices     - grid indices of the point that's measured (one column per device)
+    Steps from reset_start on return the devices to zero after the scan. They are run even if the scan is cancelled.
+    errors lists the requested values that are outside the devices' limits.
+    """
+    labels: list[str]
+    shape: tuple[int, ...]
+    device: npt.NDArray[np.int_]
+    targets: npt.NDArray[np.float64]
+    controls: npt.NDArray[np.float64]
+    valid: npt.NDArray[np.bool_]
+    waits: npt.NDArray[np.float64]
+    settle: npt.NDArray[np.bool_]
+    ramp_times: npt.NDArray[np.float64]
+    measure: npt.NDArray[np.bool_]
+    indices: npt.NDArray[np.int_]
+    reset_start: int
+    measure_time: float = 0
+    errors: list[str] = field(default_factory=list)
+
+    ARRAYS = ('device', 'targets', 'controls', 'valid', 'waits', 'settle', 'ramp_times', 'measure', 'indices')
+
+    def __len__(self) -> int:
+        return len(self.device)
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    @property
+    def n_points(self) -> int:
+        return int(np.count_nonzero(self.measure))
+
+    @property
+    def estimated_duration(self) -> float:
+        """
+        Predicted duration of the whole scan in seconds, assuming every measurement takes measure_time and every
+        device needs its full wait time to settle.
+        """
+        return float(self.waits.sum() + self.ramp_times.sum() + self.n_points * self.measure_time)
+
+    def remaining_duration(self, step: int) -> float:
+        """
+        Predicted time left when the steps before step have been run.
+        """
+        return float(self.waits[step:].sum() + self.ramp_times[step:].sum() + np.count_nonzero(self.measure[step:]) * self.measure_time)
+
+    def schedule(self, device: int) -> npt.NDArray[np.float64]:
+        """
+        The target values of one device, in the order they are set.
+        """
+        schedule: npt.NDArray[np.float64] = self.targets[self.device == device]
+        return schedule
+
+    def to_dict(self) -> dict[str, Any]:
+        d: dict[str, Any] = {name: getattr(self, name).tolist() for name in self.ARRAYS}
+        d.update(labels=self.labels, shape=list(self.shape), reset_start=self.reset_start, measure_time=self.measure_time,
+                 errors=self.errors, estimated_duration=self.estimated_duration)
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict[str, Any]) -> ScanPlan:
+        arrays = {name: np.array(d[name]) for name in cls.ARRAYS}
+        arrays['indices'] = arrays['indices'].reshape(len(arrays['device']), len(d['shape']))
+        return cls(labels=d['labels'], shape=tuple(d['shape']), reset_start=d['reset_start'], measure_time=d['measure_time'],
+                   errors=d['errors'], **arrays)
+
+    def save(self, filename: str) -> None:
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+    @classmethod
+    def load(cls, filename: str) -> ScanPlan:
+        with open(filename, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+    @classmethod
+    def compile(cls, devices: Sequence[HeadlessGridSearch.Device], measure_time: float = 0, reset_to_zero: bool = False) -> ScanPlan:
+        """
+        Work out the visiting order of the grid search and the values to write. The order is the same as the
+        recursive search always had: the last device is swept fastest, bidirectional devices sweep back and forth,
+        and other devices return to their first value before the next device takes a step.
+        """
+        steps: list[tuple[int, float, float, bool, float, bool, bool, tuple[int, ...]]] = []
+        errors: list[str] = []
+        resolved: dict[tuple[int, float], tuple[bool, float, float]] = {}
+        current = [0 for _ in devices]
+        ramp_times: list[float] = []
+        last_target: list[float | None] = [dev.interface.last_set_target for dev in devices]
+
+        def add(i: int, value: float, wait: float, settle: bool, measure: bool) -> None:
+            key = (i, value)
+            if key not in resolved:
+                resolved[key] = devices[i].interface.resolve(value)
+                if not resolved[key][0]:
+                    errors.append(f'{devices[i].label}: {value} is outside the limits, {resolved[key][1]} will be set instead')
+            is_valid, target, control = resolved[key]
+            ramp_rate = devices[i].ramp_rate
+            previous = last_target[i]
+            ramp_times.append(abs(target - previous) / ramp_rate if ramp_rate and previous is not None else 0)
+            last_target[i] = target
+            steps.append((i, target, control, is_valid, wait, settle, measure, tuple(current)))
+
+        def sweep(depth: int) -> None:
+            # Same structure as the recursive search: all points after the first are measured after a device has changed
+            dev = devices[depth]
+            order = list(range(len(dev.values)))
+            if current[depth] > 0:
+                order.reverse()
+            if depth + 1 < len(devices):
+                sweep(depth + 1)
+            for index in order[1:]:
+                current[depth] = index
+                add(depth, dev.values[index], dev.wait_time, True, True)
+                if depth + 1 < len(devices):
+                    sweep(depth + 1)
+            if not dev.bidirectional:
+                current[depth] = 0
+                add(depth, dev.values[0], dev.wait_time, True, False)
+
+        # Set all devices to their first values and measure the first point
+        max_wait = max(dev.wait_time for dev in devices)
+        for i, dev in enumerate(devices):
+            last = i == len(devices) - 1
+            add(i, dev.values[0], max_wait if last else 0, False, last)
+        sweep(0)
+        reset_start = len(steps)
+        if reset_to_zero:
+            for i in range(len(devices)):
+                add(i, 0, 0, False, False)
+
+        device, targets, controls, valid, waits, settle, measure, indices = zip(*steps)
+        return cls(labels=[dev.label for dev in devices],
+                   shape=tuple(len(dev.values) for dev in devices),
+                   device=np.array(device, dtype=int),
+                   targets=np.array(targets, dtype=float),
+                   controls=np.array(controls, dtype=float),
+                   valid=np.array(valid, dtype=bool),
+                   waits=np.array(waits, dtype=float),
+                   settle=np.array(settle, dtype=bool),
+                   ramp_times=np.array(ramp_times, dtype=float),
+                   measure=np.array(measure, dtype=bool),
+                   indices=np.array(indices, dtype=int).reshape(len(steps), len(devices)),
+                   reset_start=reset_start,
+                   measure_time=measure_time,
+                   errors=errors)
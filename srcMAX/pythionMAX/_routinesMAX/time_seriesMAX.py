@@ -1,73 +1,173 @@
-from time import sleep
-import matplotlib.pyplot as plt
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence, Self, TYPE_CHECKING
+import numpy as np
+import numpy.typing as npt
 import logging
+import time
 
 from srcMAX.pythionMAX._connectionsMAX.rbd_inputMAX import RBDInput
-from srcMAX.pythionMAX._routinesMAX.measurement_routineMAX import MeasurementRoutine
+from srcMAX.pythionMAX._routinesMAX.measurement_routineMAX import MeasurementRoutine, ValueUpdateSettings
 from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput
 from srcMAX.pythionMAX._routinesMAX.file_handlingMAX import FileSettings, generate_filename
+from srcMAX.pythionMAX._routinesMAX.results_sinkMAX import ResultsSink, open_results
+from srcMAX.pythionMAX._routinesMAX.results_storeMAX import ResultsStore
 
-logger = logging.getLogger('pythion')
+if TYPE_CHECKING:
+    from srcMAX.pythionMAX._guiMAX.outputMAX import Output
+    from srcMAX.pythionMAX._guiMAX.inputMAX import Input
 
-VALUES = [
-    (0, 0),
-    (0, 150)
-]
-WAIT_TIME = 2
+logger = logging.getLogger('pythion')
 
 
 class TimeSeries(MeasurementRoutine):
-    def __init__(self, devices, input):
+    """
+    Records one or more BufferInputs continuously while the outputs go through a sequence of steps, each holding a
+    set of setpoints for a given time. The samples are streamed to a CSV file (through a ResultsSink) as they are
+    read, one row per sample:
+        time,step,input,value
+    where time is seconds since the start of the series. The buffers only deliver samples in chunks, so the samples
+    of a chunk are spread evenly over the time since the previous read. The file can be analysed (see
+    load_time_series) while the series is still running, and memory use doesn't grow with the length of the series.
+    """
+    @dataclass
+    class Step:
+        setpoints: tuple[float | None, ...]  # One per device. None leaves the device as it is
+        duration: float
+
+    @dataclass
+    class Settings:
+        poll_time: float = 0.1  # How often the input buffers are read (s)
+        update_graphics: bool = True
+        plot: bool = True  # Plot the series when it's finished
+
+    DEFAULT_STEPS = [Step((0, 0), 2), Step((0, 150), 2)]
+
+    devices: Sequence[Output]
+    inputs: Sequence[Input]
+    steps: list[TimeSeries.Step]
+    settings: TimeSeries.Settings
+    file_settings: FileSettings
+    filename: str | None
+
+    def __init__(self,
+                 devices: Sequence[Output],
+                 input: Input | Sequence[Input],
+                 steps: Sequence[TimeSeries.Step] | None = None,
+                 settings: TimeSeries.Settings | None = None,
+                 file_settings: FileSettings | None = None):
         super().__init__()
         self.add_task(self.execute)
         self.devices = devices
-        self.input = input
-        self.buffer_input = input.interface
+        self.inputs = list(input) if isinstance(input, Sequence) else [input]
+        self.steps = list(steps) if steps is not None else list(self.DEFAULT_STEPS)
+        assert all(len(step.setpoints) == len(devices) for step in self.steps)  # One setpoint per device in every step
+        self.settings = settings if settings is not None else TimeSeries.Settings()
+        self.file_settings = file_settings if file_settings is not None else FileSettings('timeseries', path='./timeseries')
+        self.filename = None
 
-    def execute(self):
-        assert isinstance(self.buffer_input, BufferInput)
-        measurements = []
-        start_indices = []
-        logger.debug('TimeSeries:     starting time series measurement')
-        for value in VALUES:
-            start_indices.append(len(measurements))
-            self._set_value(value)
-            self.buffer_input.restart_buffer()
-            sleep(WAIT_TIME)
-            measurements.extend(self.buffer_input.get_buffer())
-        self.run_on_main_thread(self._plot_res, measurements, start_indices)
+    @classmethod
+    def from_waveform(cls, devices: Sequence[Output], input: Input | Sequence[Input], waveform: Callable[[float], Sequence[float | None]],
+                      duration: float, step_time: float, **kwargs: Any) -> Self:
+        """
+        A time series that follows waveform(t), which returns the setpoints at t seconds after the start.
+        The waveform is sampled every step_time seconds.
+        """
+        steps = [cls.Step(tuple(waveform(t)), step_time) for t in np.arange(0, duration, step_time).tolist()]
+        return cls(devices, input, steps, **kwargs)
+
+    def execute(self) -> None:
+        interfaces = [input.interface for input in self.inputs]
+        if not all(isinstance(interface, BufferInput) for interface in interfaces):
+            logger.error('TimeSeries:     Measuring from other InputInterfaces than BufferInput is not implemented!')
+            return
+        update_settings = ValueUpdateSettings.MOVE_KNOBS if self.settings.update_graphics else ValueUpdateSettings.NO_GRAPHICS
+        self.metrics.reset(len(self.steps), sum(step.duration for step in self.steps))
+        step_starts = []
 
+        logger.debug('TimeSeries:     starting time series measurement')
+        parameters = {'devices': [device.label for device in self.devices], 'inputs': [input.label for input in self.inputs],
+                      'steps': len(self.steps), 'duration': sum(step.duration for step in self.steps)}
+        self.filename = generate_filename(self.file_settings, parameters)
+        with ResultsSink(self.filename, ['time', 'step', 'input', 'value'], self._header_comments(), exclusive=False) as sink:
+            for interface in interfaces:
+                interface.restart_buffer()
+            start = time.monotonic()
+            last_read = [0.0 for _ in interfaces]
+            try:
+                for i, step in enumerate(self.steps):
+                    if self.cancelled:
+                        break
+                    step_starts.append(time.monotonic() - start)
+                    with self.metrics.phase('set'):
+                        for value, device in zip(step.setpoints, self.devices):
+                            if value is not None:
+                                self.set_output(device, value, update_settings, block=False)
+                    step_end = time.monotonic() + step.duration
+                    while (remaining := step_end - time.monotonic()) > 0 and not self.cancelled:
+                        with self.metrics.phase('measure'):
+                            self.sleep(min(self.settings.poll_time, remaining))
+                        self._record(sink, i, interfaces, start, last_read)
+                    self.metrics.point_done()
+                    self.publish_metrics()
+            finally:
+                for interface in interfaces:
+                    interface.stop_buffer()
+        ResultsStore(self.file_settings.path).update(self.filename, steps=self.metrics.snapshot().done, cancelled=self.cancelled)
         logger.debug('TimeSeries:     finished time series measurement')
 
-        with open(generate_filename(FileSettings('timeseries', path='./timeseries', extension='txt')), 'x') as file:
-            file.write('Settings:\n')
-            file.write('    Devices:\n')
-            for device in self.devices:
-                file.write(f'       {device}\n')
-            file.write('    Values\n')
-            for val in VALUES:
-                file.write(f'       {val}\n')
-            file.write('    Output:\n')
-            file.write(f'        {self.input}\n')
-            if isinstance(self.buffer_input, RBDInput):
-                file.write('Sample rate:\n')
-                file.write(f'   {self.buffer_input.rbd_sample_rate}')
-            file.write('\nMeasurements:\n')
-            file.write(str(measurements) + '\n')
-            file.write('\nNew output setting indices:\n')
-            file.write(str(start_indices))
-        print(measurements)
-        print(start_indices)
+        if self.settings.plot:
+            self.run_on_main_thread(self._plot_res, self.filename, step_starts)
+
+    def _header_comments(self) -> list[str]:
+        comments = ['Devices: ' + ', '.join(device.label for device in self.devices)]
+        for input in self.inputs:
+            if isinstance(input.interface, RBDInput):
+                comments.append(f'{input.label} sample rate: {input.interface.rbd_sample_rate}')
+        for i, step in enumerate(self.steps):
+            comments.append(f'Step {i}: {", ".join(str(value) for value in step.setpoints)} for {step.duration} s')
+        return comments
+
+    def _record(self, sink: ResultsSink, step: int, interfaces: list[BufferInput], start: float, last_read: list[float]) -> None:
+        """
+        Write the samples that have arrived since the last read, with estimated acquisition times.
+        """
+        with self.metrics.phase('file'):
+            for k, (input, interface) in enumerate(zip(self.inputs, interfaces)):
+                now = time.monotonic() - start
+                samples = interface.clear_buffer()
+                if samples:
+                    interval = (now - last_read[k]) / len(samples)
+                    for j, value in enumerate(samples):
+                        sink.write(f'{last_read[k] + (j + 1) * interval:.4f}', step, input.label, value)
+                last_read[k] = now
 
     @staticmethod
-    def _plot_res(measurements, start_indices):
-        ymin = min(measurements)
-        ymax = max(measurements)
+    def _plot_res(filename: str, step_starts: list[float]) -> None:
+        import matplotlib.pyplot as plt  # type: ignore
         _, ax = plt.subplots()
-        ax.plot(list(range(len(measurements))), measurements, 'x-')
-        ax.vlines(start_indices, ymin, ymax, colors=['k'], linestyles='dashed')
+        for label, data in load_time_series(filename).items():
+            ax.plot(data[:, 0], data[:, 2], 'x-', label=label)
+        ax.vlines(step_starts, *ax.get_ylim(), colors=['k'], linestyles='dashed')
+        ax.set_xlabel('Time [s]')
+        ax.legend()
         plt.show(block=False)
 
-    def _set_value(self, values):
-        for val, dev in zip(values, self.devices):
-            self.set_output(dev, val, block=False)
+
+def load_time_series(filename: str) -> dict[str, npt.NDArray[np.float64]]:
+    """
+    Read a time series file, also while it's still being written. Returns one array per input, with the columns
+    time, step and value.
+    """
+    rows: dict[str, list[tuple[float, float, float]]] = {}
+    with open_results(filename, 'rt') as file:
+        for line in file:
+            if line.startswith('#') or not line.endswith('\n'):
+                continue  # Comments, and a row that's only partially written
+            try:
+                t, step, rest = line.rstrip('\n').split(',', 2)
+                label, value = rest.rsplit(',', 1)
+                rows.setdefault(label, []).append((float(t), float(step), float(value)))
+            except ValueError:
+                continue  # Header row
+    return {label: np.array(values).reshape(-1, 3) for label, values in rows.items()}
@@ -3,10 +3,17 @@
 #  _connections subpackage can be imported externally by simply writing
 # `from pythion.connections import ...`
 
+from typing import TYPE_CHECKING
+
+from srcMAX.pythionMAX._lazyMAX import lazy_exports
+
 __all__ = [
     'Calibration',
     'LinearCalibration',
     'InterpolCalibration',
+    'PolynomialCalibration',
+    'SplineCalibration',
+    'LookupCalibration',
     'USBConnection',
     'USBDevice',
     'PortSelector',
@@ -20,16 +27,52 @@ __all__ = [
     'MockInput',
     'RBDInput',
     'BufferInput',
-    'MockBufferInput'
+    'MockBufferInput',
     'MockCAEN',
-    'CAENOutput'
+    'CAENOutput',
+    'CAENCommandEngine',
+    'CAENCommandError',
+    'CAENMonitor',
+    'PollTier',
+    'SimulatedCAENOutput',
+    'SimulatedR1419',
+    'OutputFeedback',
+    'AcquisitionScheduler'
 ]
-from srcMAX.pythionMAX._connectionsMAX.calibrationMAX import Calibration, LinearCalibration, InterpolCalibration
-from srcMAX.pythionMAX._connectionsMAX.usbMAX import USBConnection, USBDevice, PortSelector, ConnectionSettings
-from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import OutputInterface, MockOutput
-from srcMAX.pythionMAX._connectionsMAX.pico_outputMAX import PicoOutput
-from srcMAX.pythionMAX._connectionsMAX.rs3000_outputMAX import RS3000Output, PowerOptions
-from srcMAX.pythionMAX._connectionsMAX.input_interfaceMAX import InputInterface, MockInput, MockCAEN
-from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput, MockBufferInput
-from srcMAX.pythionMAX._connectionsMAX.rbd_inputMAX import RBDInput
-from srcMAX.pythionMAX._connectionsMAX.CAEN_IOMAX import CAENOutput
+
+# The classes are imported from their modules when they are first used (see lazy_exports), so that importing
+# the package doesn't import every connection, and everything they depend on, up front.
+__getattr__, __dir__ = lazy_exports(__name__, {
+    'srcMAX.pythionMAX._connectionsMAX.calibrationMAX': ['Calibration', 'LinearCalibration', 'InterpolCalibration', 'PolynomialCalibration',
+                                                         'SplineCalibration', 'LookupCalibration'],
+    'srcMAX.pythionMAX._connectionsMAX.usbMAX': ['USBConnection', 'USBDevice', 'PortSelector', 'ConnectionSettings'],
+    'srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX': ['OutputInterface', 'MockOutput'],
+    'srcMAX.pythionMAX._connectionsMAX.pico_outputMAX': ['PicoOutput'],
+    'srcMAX.pythionMAX._connectionsMAX.rs3000_outputMAX': ['RS3000Output', 'PowerOptions'],
+    'srcMAX.pythionMAX._connectionsMAX.input_interfaceMAX': ['InputInterface', 'MockInput', 'MockCAEN'],
+    'srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX': ['BufferInput', 'MockBufferInput'],
+    'srcMAX.pythionMAX._connectionsMAX.rbd_inputMAX': ['RBDInput'],
+    'srcMAX.pythionMAX._connectionsMAX.CAEN_IOMAX': ['CAENOutput', 'CAENCommandEngine', 'PollTier'],
+    'srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX': ['CAENCommandError'],
+    'srcMAX.pythionMAX._connectionsMAX.CAEN_monitorMAX': ['CAENMonitor'],
+    'srcMAX.pythionMAX._connectionsMAX.CAEN_simulatorMAX': ['SimulatedCAENOutput', 'SimulatedR1419'],
+    'srcMAX.pythionMAX._connectionsMAX.feedbackMAX': ['OutputFeedback'],
+    'srcMAX.pythionMAX._connectionsMAX.schedulerMAX': ['AcquisitionScheduler'],
+})
+
+if TYPE_CHECKING:
+    from srcMAX.pythionMAX._connectionsMAX.calibrationMAX import (Calibration, LinearCalibration, InterpolCalibration, PolynomialCalibration,
+                                                                  SplineCalibration, LookupCalibration)
+    from srcMAX.pythionMAX._connectionsMAX.usbMAX import USBConnection, USBDevice, PortSelector, ConnectionSettings
+    from srcMAX.pythionMAX._connectionsMAX.output_interfaceMAX import OutputInterface, MockOutput
+    from srcMAX.pythionMAX._connectionsMAX.pico_outputMAX import PicoOutput
+    from srcMAX.pythionMAX._connectionsMAX.rs3000_outputMAX import RS3000Output, PowerOptions
+    from srcMAX.pythionMAX._connectionsMAX.input_interfaceMAX import InputInterface, MockInput, MockCAEN
+    from srcMAX.pythionMAX._connectionsMAX.buffer_inputMAX import BufferInput, MockBufferInput
+    from srcMAX.pythionMAX._connectionsMAX.rbd_inputMAX import RBDInput
+    from srcMAX.pythionMAX._connectionsMAX.CAEN_IOMAX import CAENOutput, CAENCommandEngine, PollTier
+    from srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX import CAENCommandError
+    from srcMAX.pythionMAX._connectionsMAX.CAEN_monitorMAX import CAENMonitor
+    from srcMAX.pythionMAX._connectionsMAX.CAEN_simulatorMAX import SimulatedCAENOutput, SimulatedR1419
+    from srcMAX.pythionMAX._connectionsMAX.feedbackMAX import OutputFeedback
+    from srcMAX.pythionMAX._connectionsMAX.schedulerMAX import AcquisitionScheduler
@@ -1,8 +1,23 @@
+from typing import TYPE_CHECKING
+
+from srcMAX.pythionMAX._lazyMAX import lazy_exports
+
 __all__ = ['MainWindow', 'Output', 'Input', 'PlotStream', 'Action', 'CAEN']
 
-from srcMAX.pythionMAX._guiMAX.main_windowMAX import MainWindow
-from srcMAX.pythionMAX._guiMAX.outputMAX import Output
-from srcMAX.pythionMAX._guiMAX.inputMAX import Input
-from srcMAX.pythionMAX._guiMAX.plotsMAX import PlotStream
-from srcMAX.pythionMAX._guiMAX.actionMAX import Action
-from srcMAX.pythionMAX._guiMAX.caenMAX import CAEN
\ No newline at end of file
+# Imported when first used, see lazy_exports
+__getattr__, __dir__ = lazy_exports(__name__, {
+    'srcMAX.pythionMAX._guiMAX.main_windowMAX': ['MainWindow'],
+    'srcMAX.pythionMAX._guiMAX.outputMAX': ['Output'],
+    'srcMAX.pythionMAX._guiMAX.inputMAX': ['Input'],
+    'srcMAX.pythionMAX._guiMAX.plotsMAX': ['PlotStream'],
+    'srcMAX.pythionMAX._guiMAX.actionMAX': ['Action'],
+    'srcMAX.pythionMAX._guiMAX.caenMAX': ['CAEN'],
+})
+
+if TYPE_CHECKING:
+    from srcMAX.pythionMAX._guiMAX.main_windowMAX import MainWindow
+    from srcMAX.pythionMAX._guiMAX.outputMAX import Output
+    from srcMAX.pythionMAX._guiMAX.inputMAX import Input
+    from srcMAX.pythionMAX._guiMAX.plotsMAX import PlotStream
+    from srcMAX.pythionMAX._guiMAX.actionMAX import Action
+    from srcMAX.pythionMAX._guiMAX.caenMAX import CAEN
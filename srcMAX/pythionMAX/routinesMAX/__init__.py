@@ -1,3 +1,30 @@
-__all__ = ['GridSearch', 'load_gridsearch_result', 'Heatmap']
+from typing import TYPE_CHECKING
 
-from srcMAX.pythionMAX._routinesMAX.grid_searchMAX import GridSearch, load_gridsearch_result, Heatmap
+from srcMAX.pythionMAX._lazyMAX import lazy_exports
+
+__all__ = ['GridSearch', 'load_gridsearch_result', 'Heatmap', 'HeadlessGridSearch', 'ScanPlan', 'RoutineExecutor', 'TimeSeries',
+           'load_time_series', 'ResultsSink', 'load_results', 'ResultsStore', 'RunRecord', 'RunArchive', 'ArchivedRun']
+
+# Imported when first used (see lazy_exports), so that e.g. a headless scan never imports Qt
+__getattr__, __dir__ = lazy_exports(__name__, {
+    'srcMAX.pythionMAX._routinesMAX.grid_searchMAX': ['GridSearch', 'load_gridsearch_result'],
+    'srcMAX.pythionMAX._routinesMAX.heatmapMAX': ['Heatmap'],
+    'srcMAX.pythionMAX._routinesMAX.headlessMAX': ['HeadlessGridSearch'],
+    'srcMAX.pythionMAX._routinesMAX.scan_planMAX': ['ScanPlan'],
+    'srcMAX.pythionMAX._routinesMAX.executorMAX': ['RoutineExecutor'],
+    'srcMAX.pythionMAX._routinesMAX.time_seriesMAX': ['TimeSeries', 'load_time_series'],
+    'srcMAX.pythionMAX._routinesMAX.results_sinkMAX': ['ResultsSink', 'load_results'],
+    'srcMAX.pythionMAX._routinesMAX.results_storeMAX': ['ResultsStore', 'RunRecord'],
+    'srcMAX.pythionMAX._routinesMAX.run_archiveMAX': ['RunArchive', 'ArchivedRun'],
+})
+
+if TYPE_CHECKING:
+    from srcMAX.pythionMAX._routinesMAX.grid_searchMAX import GridSearch, load_gridsearch_result
+    from srcMAX.pythionMAX._routinesMAX.heatmapMAX import Heatmap
+    from srcMAX.pythionMAX._routinesMAX.headlessMAX import HeadlessGridSearch
+    from srcMAX.pythionMAX._routinesMAX.scan_planMAX import ScanPlan
+    from srcMAX.pythionMAX._routinesMAX.executorMAX import RoutineExecutor
+    from srcMAX.pythionMAX._routinesMAX.time_seriesMAX import TimeSeries, load_time_series
+    from srcMAX.pythionMAX._routinesMAX.results_sinkMAX import ResultsSink, load_results
+    from srcMAX.pythionMAX._routinesMAX.results_storeMAX import ResultsStore, RunRecord
+    from srcMAX.pythionMAX._routinesMAX.run_archiveMAX import RunArchive, ArchivedRun
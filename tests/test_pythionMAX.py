@@ -0,0 +1,898 @@
+from typing import Any
+from concurrent.futures import Future
+from pathlib import Path
+import math
+import os
+import threading
+import time
+import pytest
+import numpy as np
+
+from srcMAX.pythionMAX._connectionsMAX.CAEN_protocolMAX import StatusBits, build_command, parse_reply
+from srcMAX.pythionMAX._connectionsMAX.emulatorsMAX import CAENEmulator, EmulatorFarm, PicoDACEmulator, RBDEmulator, RS3005PEmulator
+from srcMAX.pythionMAX.connectionsMAX import (InterpolCalibration, PolynomialCalibration, SplineCalibration, LookupCalibration, MockOutput,
+                                              LinearCalibration, PicoOutput, RS3000Output, CAENOutput, CAENCommandError, CAENMonitor, PollTier,
+                                              SimulatedCAENOutput, SimulatedR1419, RBDInput, BufferInput)
+from srcMAX.pythionMAX._routinesMAX.headlessMAX import HeadlessGridSearch, MeasurementTimeout, measure_buffer
+from srcMAX.pythionMAX._routinesMAX.metricsMAX import RoutineMetrics
+from srcMAX.pythionMAX._routinesMAX.results_sinkMAX import ResultsSink, load_results
+from srcMAX.pythionMAX._routinesMAX.scan_planMAX import ScanPlan
+from srcMAX.pythionMAX._routinesMAX.file_handlingMAX import FileSettings, generate_filename
+from srcMAX.pythionMAX._routinesMAX.results_storeMAX import ResultsStore
+from srcMAX.pythionMAX._routinesMAX.run_archiveMAX import RunArchive
+
+
+def test_spline_calibration() -> None:
+    cal = SplineCalibration.from_file('testcal.csv')
+    # Interpolates the calibration points exactly
+    for target, control in cal.points:
+        assert cal.to_control(target) == pytest.approx(control)
+        assert cal.to_target(control) == pytest.approx(target)
+    # Monotone between the points, and inverse is consistent
+    previous = None
+    for i in range(101):
+        target = 47 * i / 100
+        control = cal.to_control(target)
+        if previous is not None:
+            assert control > previous
+        previous = control
+        assert cal.to_target(control) == pytest.approx(target)
+    with pytest.raises(ValueError):
+        cal.to_control(48)
+
+
+def test_polynomial_calibration() -> None:
+    points: list[tuple[float, float]] = [(x, 0.5 + 2 * x + 0.1 * x**3) for x in range(6)]
+    cal = PolynomialCalibration(points, degree=3)
+    assert cal.coefficients == pytest.approx([0.5, 2, 0, 0.1], abs=1e-9)
+    assert cal.to_control(2.5) == pytest.approx(0.5 + 5 + 0.1 * 2.5**3)
+    assert cal.to_target(cal.to_control(3.3)) == pytest.approx(3.3)
+    with pytest.raises(ValueError):
+        PolynomialCalibration([(0, 0), (1, 1)], degree=2)
+    with pytest.raises(ValueError):
+        PolynomialCalibration([(x, (x - 2)**2) for x in range(5)], degree=2)  # Not monotone
+
+
+def test_lookup_calibration() -> None:
+    source = InterpolCalibration.from_file('testcal.csv')
+    cal = source.auto_compile(samples=4701)
+    assert isinstance(cal, LookupCalibration)
+    for target in [0, 3.3, 14, 22.5, 47]:
+        assert cal.to_control(target) == pytest.approx(source.to_control(target), abs=1e-6)
+        assert cal.to_target(cal.to_control(target)) == pytest.approx(target, abs=1e-3)
+    with pytest.raises(ValueError):
+        cal.to_control(-1)
+    extrapolating = LookupCalibration([0, 1, 2], [0, 10, 20], samples=3, extrapolate=True)
+    assert extrapolating.to_control(3) == pytest.approx(30)
+    assert extrapolating.to_target(-10) == pytest.approx(-1)
+
+
+class RecordingOutput(MockOutput):
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.written: list[float] = []
+
+    def _write(self, control_value: float) -> None:
+        self.written.append(control_value)
+
+
+def test_output_ramp() -> None:
+    output = RecordingOutput(target_limit=100)
+    output.target = 0
+    future = output.ramp_to(1, rate=10, interval=0.01)
+    assert future.result(timeout=2) == 1
+    assert not output.is_ramping
+    assert len(output.written) == 11
+    assert all(b - a == pytest.approx(0.1) for a, b in zip(output.written, output.written[1:]))
+
+    # Retargeting cancels the first future, and targets beyond the limits are clamped
+    first = output.ramp_to(0, rate=10, interval=0.05)
+    second = output.ramp_to(200, rate=1000, interval=0.01)
+    assert second.result(timeout=2) == 100
+    assert first.cancelled()
+
+    output.ramp_to(0, rate=1, interval=0.01)
+    time.sleep(0.05)
+    output.cancel_ramp(wait=True)
+    assert not output.is_ramping
+    assert output.target is not None and 99 < output.target < 100
+
+
+def test_coalesced_writes() -> None:
+    release = threading.Event()
+
+    class SlowOutput(RecordingOutput):
+        def _write(self, control_value: float) -> None:
+            release.wait()
+            super()._write(control_value)
+
+    output = SlowOutput(coalesce_writes=True)
+    for value in range(10):
+        output.target = value  # Returns immediately even though the link is blocked
+    assert output.target == 9
+    assert not output.flush_writes(timeout=0.05)
+    release.set()
+    assert output.flush_writes(timeout=2)
+    # At most the first value was already in flight, everything in between was superseded
+    assert output.written[-1] == 9 and len(output.written) <= 2
+    with output:
+        output.target = 3
+    assert output.written[-1] == 3
+
+
+class FakeRS3005P:
+    """
+    Just enough of a serial port to answer read-back queries like an RS3005P
+    """
+    def __init__(self) -> None:
+        self.voltage = 0.0
+        self._response = b''
+
+    def write(self, data: bytes) -> None:
+        command = data.decode()
+        if command.startswith('VSET1:'):
+            self.voltage = float(command[6:])
+        elif command == 'VOUT1?':
+            self._response = f'{self.voltage:05.2f}'.encode()
+
+    def read(self, size: int) -> bytes:
+        response, self._response = self._response[:size], self._response[size:]
+        return response
+
+
+def test_rs_feedback() -> None:
+    rs = RS3000Output(port=None, target_limit=30, feedback_rate=50)
+    rs.command_interval = 0
+    rs.ser = FakeRS3005P()
+    assert rs.has_feedback
+    rs.target = 12.3
+    assert rs.feedback.read() == pytest.approx(12.3)
+    assert rs.target == pytest.approx(12.3)
+
+    values: list[float] = []
+    rs.feedback.add_input_handler(values.append)
+    rs.feedback.start_sampling(50)
+    rs.target = 4.5
+    assert rs.wait_until_settled(0.01, timeout=2)
+    rs.feedback.stop_sampling()
+    assert values[-1] == pytest.approx(4.5)
+    assert rs.feedback.age is not None and rs.feedback.age < 1
+
+
+class FakeR1419:
+    """
+    Serial port stand-in that answers CAEN commands after a short delay, like the real link would
+    """
+    def __init__(self, delay: float = 0.01) -> None:
+        self.delay = delay
+        self.received: list[str] = []
+        self.vset = [0.0] * 4
+        self._replies: list[tuple[float, bytes]] = []
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> None:
+        message = data.decode().strip()
+        self.received.append(message)
+        fields = dict(f.split(':', 1) for f in message.lstrip('$').split(','))
+        reply = f"#BD:{fields['BD']},CMD:OK"
+        if fields['PAR'] not in ('VSET', 'ON', 'OFF', 'BDSNUM'):
+            reply = f"#BD:{fields['BD']},PAR:ERR"
+        elif fields['CMD'] == 'SET' and 'VAL' in fields:
+            channels = range(4) if fields['CH'] == '4' else [int(fields['CH'])]
+            for ch in channels:
+                self.vset[ch] = float(fields['VAL'])
+        elif fields['CMD'] == 'MON' and fields['PAR'] == 'VSET':
+            values = self.vset if fields.get('CH') == '4' else [self.vset[int(fields['CH'])]]
+            reply = reply + ',VAL:' + ';'.join(f'{v:06.1f}' for v in values)
+        elif fields['CMD'] == 'MON':
+            reply = reply + ',VAL:12345'
+        with self._lock:
+            self._replies.append((time.monotonic() + self.delay, (reply + '\r\n').encode()))
+
+    def read_until(self) -> bytes:
+        time.sleep(0.001)
+        with self._lock:
+            if self._replies and self._replies[0][0] <= time.monotonic():
+                return self._replies.pop(0)[1]
+        return b''
+
+    def reset_input_buffer(self) -> None:
+        with self._lock:
+            self._replies.clear()
+
+
+def test_caen_command_engine() -> None:
+    caen = CAENOutput(port=None, max_in_flight=4, timeout=0.5)
+    caen.ser = FakeR1419()
+    caen.engine.start()
+    try:
+        assert caen.command('SET', 'VSET', 120, ch=1).result(timeout=2) == []
+        assert caen.ser.received[0] == '$BD:00,CMD:SET,CH:1,PAR:VSET,VAL:120'
+        with pytest.raises(CAENCommandError) as error:
+            caen.command('MON', 'IMON', ch=1).result(timeout=2)
+        assert error.value.field == 'PAR'
+        with pytest.raises(ValueError):
+            caen.command('SET', 'NOPE').result(timeout=2)
+
+        # A batch of commands is pipelined, and every reply still ends up with its own request
+        futures = [caen.command('SET', 'VSET', 10 * i, ch=i) for i in range(4)] + [caen.command('MON', 'VSET', ch=4)]
+        assert futures[-1].result(timeout=2) == [0, 10, 20, 30]
+        assert caen.monitor(['VSET', 'BDSNUM', 'IMON'], ch=2) == {'VSET': [20], 'BDSNUM': [12345]}
+
+        caen.ser.delay = 10  # Device stops answering
+        with pytest.raises(TimeoutError):
+            caen.command('MON', 'VSET', ch=0).result(timeout=2)
+        caen.ser.delay = 0.01
+        assert caen.command('MON', 'VSET', ch=3).result(timeout=2) == [30]
+    finally:
+        caen.engine.stop()
+    assert not caen.engine.running
+
+
+class FragmentedSerial:
+    """
+    Serial port stand-in that returns the given pieces of data, one per read, like reads that time out halfway
+    through a line
+    """
+    def __init__(self, pieces: list[bytes]) -> None:
+        self.pieces = pieces
+        self.received: list[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self.received.append(data)
+
+    def read_until(self) -> bytes:
+        time.sleep(0.001)
+        return self.pieces.pop(0) if self.pieces else b''
+
+    def reset_input_buffer(self) -> None:
+        self.pieces.clear()
+
+
+def test_caen_fragmented_replies() -> None:
+    caen = CAENOutput(port=None, max_in_flight=2)
+    # Split inside VAL, before the CR/LF, and between the CR and LF, with the next reply starting in the same read
+    caen.ser = FragmentedSerial([b'#BD:00,CMD:OK,VAL:0001.0;00', b'02.0;0003.0;0004.0', b' \r', b' \n#BD:00,CMD:OK,VAL:12', b'345 \r \n'])
+    caen.engine.start()
+    try:
+        vmon = caen.command('MON', 'VMON', ch=4)
+        serial_number = caen.command('MON', 'BDSNUM')
+        assert vmon.result(timeout=2) == [1.0, 2.0, 3.0, 4.0]
+        assert serial_number.result(timeout=2) == [12345]
+    finally:
+        caen.engine.stop()
+    assert caen._received == b''
+
+    # A reply with the wrong number of values is rejected rather than parsed
+    with pytest.raises(CAENCommandError) as error:
+        parse_reply('#BD:00,CMD:OK,VAL:0000.0;0000.0;0000.0', 'VMON', count=4)
+    assert error.value.field == 'VAL'
+    with pytest.raises(CAENCommandError):
+        parse_reply('#BD:00,CMD:OK', 'VMON', count=1)
+
+
+def test_caen_monitor() -> None:
+    caen = CAENOutput(port=None, max_in_flight=4)
+    caen.ser = FakeR1419(delay=0.001)
+    caen.engine.start()
+    monitor = CAENMonitor(caen, rate=50, channel_parameters=['VSET'], board_parameters=['BDSNUM'], slow_every=1)
+    batches: list[dict[tuple[int | None, str], Any]] = []
+    monitor.add_change_handler(batches.append)
+    try:
+        assert monitor.poll() == {(0, 'VSET'): 0, (1, 'VSET'): 0, (2, 'VSET'): 0, (3, 'VSET'): 0, (None, 'BDSNUM'): 12345}
+        assert monitor.poll() == {}  # Nothing changed, nothing reported
+        assert len(batches) == 1
+
+        monitor.start()
+        caen.command('SET', 'VSET', 250, ch=2).result(timeout=2)
+        deadline = time.monotonic() + 2
+        while monitor.get('VSET', ch=2) != 250 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        monitor.stop(wait=True)
+        assert monitor.get('VSET', ch=2) == 250
+        assert batches[-1] == {(2, 'VSET'): 250}
+        assert not monitor.active
+    finally:
+        caen.engine.stop()
+
+
+def test_caen_poll_tiers() -> None:
+    caen = CAENOutput(port=None, max_in_flight=4)
+    caen.ser = FakeR1419(delay=0.001)
+    caen.engine.start()
+    assert CAENOutput.poll_tier('VMON') is PollTier.FAST
+    assert CAENOutput.poll_tier('BDSNUM') is PollTier.STATIC
+    monitor = CAENMonitor(caen, rate=1, channel_parameters=['VSET'], board_parameters=['BDSNUM'], slow_every=3)
+    try:
+        sent = []
+        for _ in range(4):
+            before = len(caen.ser.received)
+            monitor.poll()
+            sent.append(len(caen.ser.received) - before)
+        # Everything on the first pass, then nothing (BDSNUM is cached) until the setpoints are due again
+        assert sent == [2, 0, 0, 1]
+
+        # A successful SET invalidates the cached static values
+        caen.command('SET', 'VSET', 5, ch=0).result(timeout=2)
+        before = len(caen.ser.received)
+        monitor.poll()
+        assert caen.ser.received[before:] == ['$BD:00,CMD:MON,PAR:BDSNUM']
+    finally:
+        caen.engine.stop()
+
+
+def test_caen_protocol() -> None:
+    assert parse_reply('#BD:00,CMD:OK\r\n') == []
+    values = parse_reply('#BD:00,CMD:OK,VAL:0123.5;0000.0;12;HIGH')
+    assert values == [123.5, 0.0, 12, 'HIGH']
+    assert [type(v) for v in values] == [float, float, int, str]
+    status, = parse_reply('#BD:00,CMD:OK,VAL:00131', par='STAT')
+    assert isinstance(status, StatusBits) and status == 131
+    assert status['ON'] and status['RUP'] and status['TRIP'] and not status['RDW']
+    for reply, field in [('#BD:00,CH:ERR', 'CH'), ('#BD:00,LOC:ERR', 'LOC'), ('garbage', 'CMD')]:
+        with pytest.raises(CAENCommandError) as error:
+            parse_reply(reply)
+        assert error.value.field == field
+
+    assert build_command(0, 'SET', 'VSET', 12.5, ch=1) == b'$BD:00,CMD:SET,CH:1,PAR:VSET,VAL:12.5 \r \n'
+    assert build_command(3, 'MON', 'BDSNUM') == b'$BD:03,CMD:MON,PAR:BDSNUM \r \n'
+    with pytest.raises(ValueError):
+        build_command(0, 'SET', 'VOLTAGE', 1)
+
+
+def test_caen_setpoints() -> None:
+    caen = CAENOutput(port=None, max_in_flight=2)
+    caen.ser = FakeR1419(delay=0.005)
+    caen.engine.start()
+    try:
+        for value in range(0, 101, 10):  # Like a slider being dragged
+            caen.set_setpoint('VSET', value, ch=1)
+        assert caen.flush_setpoints(timeout=2)
+        sets = [m for m in caen.ser.received if m.startswith('$BD:00,CMD:SET')]
+        assert sets[-1] == '$BD:00,CMD:SET,CH:1,PAR:VSET,VAL:100' and len(sets) <= 2
+        assert caen.acknowledged('VSET', ch=1) == 100
+
+        # Unchanged values aren't sent again
+        before = len(caen.ser.received)
+        assert not caen.set_setpoint('VSET', 100.0, ch=1)
+        assert caen.flush_setpoints(timeout=2)
+        assert len(caen.ser.received) == before
+
+        # Rejected values never become acknowledged
+        caen.set_setpoint('ISET', 5, ch=1)
+        assert caen.flush_setpoints(timeout=2)
+        assert caen.acknowledged('ISET', ch=1) is None
+
+        # A setpoint changed outside of this interface is picked up when it's monitored, and is then written again
+        caen.ser.vset[1] = 50
+        caen.monitor(['VSET'], ch=1, timeout=2)
+        assert caen.acknowledged('VSET', ch=1) == 50
+        assert caen.set_setpoint('VSET', 100, ch=1)
+        assert caen.flush_setpoints(timeout=2)
+        assert caen.ser.vset[1] == 100
+
+        # A broadcast is acknowledged for every channel and for the broadcast itself, until one channel is changed
+        assert caen.set_setpoint('VSET', 20, ch=CAENOutput.ALL_CHANNELS)
+        assert caen.flush_setpoints(timeout=2)
+        assert not caen.set_setpoint('VSET', 20, ch=CAENOutput.ALL_CHANNELS)
+        assert all(caen.acknowledged('VSET', ch=ch) == 20 for ch in range(4))
+        caen.set_setpoint('VSET', 30, ch=2)
+        assert caen.flush_setpoints(timeout=2)
+        assert caen.acknowledged('VSET', ch=CAENOutput.ALL_CHANNELS) is None
+    finally:
+        caen.engine.stop()
+
+
+@pytest.mark.parametrize('chunk_size', [None, 5])
+def test_caen_simulator(chunk_size: int | None) -> None:
+    now = [0.0]
+    device = SimulatedR1419(clock=lambda: now[0])
+    with SimulatedCAENOutput(device=device, max_in_flight=4, realistic_latency=False, chunk_size=chunk_size) as caen:
+        caen.command('SET', 'RUP', 100, ch=0).result(timeout=2)
+        caen.command('SET', 'VSET', 300, ch=0).result(timeout=2)
+        caen.command('SET', 'ON', ch=0).result(timeout=2)
+        now[0] = 1.0
+        vmon, = caen.command('MON', 'VMON', ch=0).result(timeout=2)
+        status, = caen.command('MON', 'STAT', ch=0).result(timeout=2)
+        assert vmon == pytest.approx(100)
+        assert isinstance(status, StatusBits) and status['ON'] and status['RUP']
+        now[0] = 5.0
+        assert caen.monitor(['VMON', 'IMON'], ch=0) == {'VMON': [300.0], 'IMON': [15.0]}
+
+        # Lower the current limit below the load current: the channel is limited, then trips and is killed
+        caen.command('SET', 'TRIP', 2, ch=0).result(timeout=2)
+        caen.command('SET', 'ISET', 10, ch=0).result(timeout=2)
+        now[0] = 5.5
+        status, = caen.command('MON', 'STAT', ch=0).result(timeout=2)
+        assert isinstance(status, StatusBits) and status['OVC'] and not status['TRIP']
+        now[0] = 8.0
+        status, = caen.command('MON', 'STAT', ch=0).result(timeout=2)
+        alarm, = caen.command('MON', 'BDALARM').result(timeout=2)
+        assert isinstance(status, StatusBits) and status['TRIP'] and status['KILL'] and not status['ON']
+        assert isinstance(alarm, StatusBits) and alarm['CH 00']
+        assert caen.command('MON', 'VMON', ch=0).result(timeout=2) == [0.0]
+
+        with pytest.raises(CAENCommandError):
+            caen.command('SET', 'VSET', 9000, ch=1).result(timeout=2)
+        caen.command('SET', 'BDCLR').result(timeout=2)
+        assert caen.command('MON', 'BDALARM').result(timeout=2) == [0]
+    assert device.channels[0].on is False
+
+
+@pytest.mark.parametrize('chunk_size', [None, 8])
+def test_caen_simulator_latency(chunk_size: int | None) -> None:
+    caen = SimulatedCAENOutput(max_in_flight=1, chunk_size=chunk_size)
+    with caen:
+        start = time.monotonic()
+        values = caen.monitor(['VMON', 'IMON', 'VSET', 'ISET'], ch=4)
+        elapsed = time.monotonic() - start
+    assert all(len(values[par]) == 4 for par in ('VMON', 'IMON', 'VSET', 'ISET'))
+    # Every command is ~30 bytes and every reply ~45 bytes, at 9600 baud that's at least 75 ms per round trip
+    assert elapsed > 4 * 0.07
+
+
+def test_caen_fake_serial_timeout() -> None:
+    from srcMAX.pythionMAX._connectionsMAX.CAEN_simulatorMAX import FakeSerial
+    port = FakeSerial(SimulatedR1419(), baud_rate=9600, timeout=0.05, chunk_size=8)
+    port.write(build_command(0, 'MON', 'VMON', ch=4))
+    # The reply takes ~80 ms to arrive, so the first read times out with part of it
+    first = port.read_until()
+    assert 0 < len(first) <= 8 and not first.endswith(b'\n')
+    port.timeout = 1
+    rest = b''
+    while not rest.endswith(b'\n'):
+        rest = rest + port.read_until(size=100)
+    assert (first + rest).startswith(b'#BD:00,CMD:OK,VAL:') and (first + rest).count(b';') == 3
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='Pseudo-terminals are only available on POSIX systems')
+def test_pty_emulators(monkeypatch: pytest.MonkeyPatch) -> None:
+    rs, rbd = RS3005PEmulator(load=10), RBDEmulator(current=lambda t: 42, noise=0)
+    caen_device = SimulatedR1419()
+    with EmulatorFarm({'PORT_VELOCITY': rs, 'PORT_RBD_s': rbd, 'PORT_CAEN': CAENEmulator(caen_device)}, throttle=True) as farm:
+        ports = farm.ports
+        # Replies trickle in at 9600 baud. With a short read timeout, every reply is read in several pieces
+        caen = CAENOutput(port=ports['PORT_CAEN'], max_in_flight=4)
+        monkeypatch.setattr(caen, 'READ_TIMEOUT', 0.01)
+        with caen:
+            caen.command('SET', 'VSET', 250, ch=2).result(timeout=2)
+            assert caen.command('MON', 'VSET', ch=4).result(timeout=2) == [0.0, 0.0, 250.0, 0.0]
+        assert caen_device.channels[2].vset == 250
+        with RS3000Output(port=ports['PORT_VELOCITY'], target_limit=30) as output:
+            output.target = 12.5
+            assert output.feedback.read() == pytest.approx(12.5)
+        assert rs.vset == pytest.approx(12.5)
+
+        rbd_input = RBDInput(port=ports['PORT_RBD_s'], rbd_sample_rate=100, pull_rate=10, unit=RBDInput.CurrentUnit.NANO)
+        rbd_input.start_buffer()
+        with rbd_input:
+            time.sleep(0.5)
+            samples = rbd_input.get_buffer()
+        assert len(samples) > 20 and all(s == pytest.approx(42) for s in samples)
+        deadline = time.monotonic() + 2
+        while rbd.interval is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert rbd.interval is None  # Streaming stopped on exit
+
+
+def test_pty_pico() -> None:
+    dac = PicoDACEmulator()
+    with EmulatorFarm({'PORT_PICO': dac}) as farm:
+        with PicoOutput(port=farm.ports['PORT_PICO'], calibration=LinearCalibration(1000), voltage_limit=800) as output:
+            for target, expected in [(250, 1024), (2000, 3276)]:  # Targets beyond the voltage limit are clamped
+                output.target = target
+                deadline = time.monotonic() + 2
+                while dac.value != expected and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                assert dac.value == expected
+
+
+class ProbeInput(BufferInput):
+    """
+    Measures a value that depends on the current targets of two outputs.
+    """
+    def __init__(self, first: MockOutput, second: MockOutput) -> None:
+        self.first = first
+        self.second = second
+        super().__init__()
+
+    def _read_from_device(self) -> list[float]:
+        first, second = self.first.target, self.second.target
+        assert first is not None and second is not None
+        return [10 * first + second]
+
+
+class SignInput(ProbeInput):
+    """
+    Measures 0 where the first output is at peak and the second at 5, and less everywhere else.
+    """
+    def __init__(self, first: MockOutput, second: MockOutput, peak: float) -> None:
+        self.peak = peak
+        super().__init__(first, second)
+
+    def _read_from_device(self) -> list[float]:
+        first, second = self.first.target, self.second.target
+        assert first is not None and second is not None
+        return [-abs(first - self.peak) - abs(second - 5)]
+
+
+def test_headless_grid_search(tmp_path: Path) -> None:
+    magnet = RecordingOutput(target_limit=100)
+    velocity = RecordingOutput(target_limit=100)
+    progress = []
+    search = HeadlessGridSearch(
+        HeadlessGridSearch.Device(magnet, [0, 1, 2], wait_time=0, label='Magnet'),
+        HeadlessGridSearch.Device(velocity, [0, 5], wait_time=0, label='Velocity'),
+        input=ProbeInput(magnet, velocity),
+        input_label='Current',
+        settings=HeadlessGridSearch.Settings(measure_samples=1, measure_checktime=0),
+        file_settings=FileSettings('scan', str(tmp_path)),
+        on_progress=lambda done, total: progress.append((done, total))
+    )
+    results = search.run()
+    assert results.tolist() == [[0, 5], [10, 15], [20, 25]]
+    assert progress == [(i, 6) for i in range(1, 7)]
+    metrics = search.metrics.snapshot()
+    assert (metrics.done, metrics.total) == (6, 6)
+    assert set(metrics.phase_times) >= {'set', 'settle', 'measure', 'file'}
+    assert metrics.time_per_point is not None and metrics.time_per_point >= sum(metrics.phase_times.values())
+    assert '6/6 points' in str(metrics)
+    assert velocity.written == [0, 5, 0, 5]  # Bidirectional: every other sweep runs backwards
+    assert search.filename is not None
+    with open(search.filename) as file:
+        lines = file.read().splitlines()
+    assert lines[0] == 'Magnet,Velocity,Current'
+    assert sorted(lines[1:]) == sorted(['0,0,0.0', '0,5,5.0', '1,5,15.0', '1,0,10.0', '2,0,20.0', '2,5,25.0'])
+
+    # Cancelling from a callback stops the search after the current point
+    search.file_settings = None
+    search.on_point = lambda indices, value: search.cancel()
+    search.run()
+    assert search.results.tolist() == [[0, 0], [0, 0], [0, 0]]
+
+
+class DeadInput(BufferInput):
+    """
+    An input that never delivers any samples.
+    """
+    def _read_from_device(self) -> list[float]:
+        return []
+
+
+def test_measurement_timeout_and_cancel() -> None:
+    with pytest.raises(MeasurementTimeout):
+        measure_buffer(DeadInput(), n_samples=1, check_time=0.01, timeout=0.05)
+
+    # Cancelling wakes up a long wait right away, and the time actually waited is recorded
+    cancel_event = threading.Event()
+    metrics = RoutineMetrics()
+    threading.Timer(0.05, cancel_event.set).start()
+    start = time.monotonic()
+    assert math.isnan(measure_buffer(DeadInput(), n_samples=1, check_time=60, cancel_event=cancel_event, metrics=metrics))
+    assert time.monotonic() - start < 1
+    snapshot = metrics.snapshot()
+    assert snapshot.waits == 1 and 0.04 < snapshot.idle < 1
+
+    # A dead input doesn't stop a grid search, the points are recorded as nan
+    search = HeadlessGridSearch(
+        HeadlessGridSearch.Device(RecordingOutput(target_limit=100), [0, 1], wait_time=0.01),
+        input=DeadInput(),
+        settings=HeadlessGridSearch.Settings(measure_samples=1, measure_checktime=0.01, measure_timeout=0.02)
+    )
+    assert all(math.isnan(value) for value in search.run())
+    snapshot = search.metrics.snapshot()
+    assert snapshot.done == 2 and snapshot.idle >= 0.01 * snapshot.waits
+
+
+def test_cancel_during_ramp() -> None:
+    # A slow ramp is stopped where it is when the search is cancelled, and the output is still ramped back to zero
+    output = RecordingOutput(target_limit=100)
+    output.target = 0
+    search = HeadlessGridSearch(
+        HeadlessGridSearch.Device(output, [50, 60], wait_time=0, ramp_rate=10),
+        input=DeadInput(),
+        settings=HeadlessGridSearch.Settings(measure_samples=1, measure_checktime=0.01, reset_to_zero=True)
+    )
+    threading.Timer(0.2, search.cancel).start()
+    start = time.monotonic()
+    search.run()
+    assert time.monotonic() - start < 2
+    assert search.metrics.snapshot().done == 0
+    assert output.target == 0 and 0 < max(output.written) < 10
+    assert not output.is_ramping
+
+
+@pytest.mark.parametrize('extension', ['csv', 'csv.gz', 'npy', 'npy.gz'])
+def test_results_sink(tmp_path: Path, extension: str) -> None:
+    filename = str(tmp_path / f'results.{extension}')
+    with ResultsSink(filename, ['x', 'y', 'value'], comments=['A comment'], batch_size=3, fsync_interval=0.01) as sink:
+        for i in range(10):
+            sink.write(i, 2 * i, i / 4)
+        if not extension.endswith('.gz'):
+            # Everything is readable while the sink is still open, once it has been synced
+            deadline = time.monotonic() + 5
+            while load_results(filename).shape != (10, 3) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert load_results(filename).shape == (10, 3)
+    results = load_results(filename)
+    assert results.tolist() == [[i, 2 * i, i / 4] for i in range(10)]
+    with pytest.raises(FileExistsError):
+        ResultsSink(filename, ['x']).open()
+
+
+def test_results_store(tmp_path: Path) -> None:
+    store = ResultsStore(str(tmp_path / 'results'))
+    first = generate_filename(FileSettings('scan', store.path, timestamp=False), {'input': 'Current'}, (3, 2))
+    (tmp_path / 'results' / 'scan(1).csv').touch()  # Not in the index
+    second = generate_filename(FileSettings('scan', store.path, timestamp=False), {'input': 'Voltage'})
+    assert os.path.basename(first) == 'scan.csv' and os.path.basename(second) == 'scan(2).csv'
+    assert os.path.exists(first) and os.path.exists(second)
+    store.update(first, points=6)
+
+    runs = store.runs()
+    assert [run.file for run in runs] == ['scan.csv', 'scan(2).csv']
+    assert runs[0].shape == [3, 2] and runs[0].info == {'points': 6}
+    assert [run.file for run in store.find(name='scan', input='Current')] == ['scan.csv']
+    assert store.find(name='other') == []
+    latest = store.latest(name='scan')
+    assert latest is not None and latest.file == 'scan(2).csv'
+
+    # Files from before the index are picked up by reindex
+    (tmp_path / 'results' / '240101T1200_old.csv').touch()
+    assert store.reindex() == 2
+    old = store.find(name='old')[0]
+    assert old.created == '2024-01-01T12:00:00'
+    assert store.reindex() == 0
+
+
+def test_run_archive(tmp_path: Path) -> None:
+    magnet = RecordingOutput(target_limit=100)
+    velocity = RecordingOutput(target_limit=100)
+    for peak in (1, 2):
+        search = HeadlessGridSearch(
+            HeadlessGridSearch.Device(magnet, [0, 1, 2], wait_time=0, label='Magnet'),
+            HeadlessGridSearch.Device(velocity, [0, 5], wait_time=0, label='Velocity'),
+            input=SignInput(magnet, velocity, peak),
+            input_label='Current',
+            settings=HeadlessGridSearch.Settings(measure_samples=1, measure_checktime=0),
+            file_settings=FileSettings('scan', str(tmp_path / 'results'))
+        )
+        search.run()
+
+    archive = RunArchive(str(tmp_path / 'archive'))
+    added = archive.import_store(ResultsStore(str(tmp_path / 'results')), name='scan')
+    assert len(added) == 2
+    assert archive.import_store(ResultsStore(str(tmp_path / 'results'))) == []  # Already archived
+
+    # Reopening only reads the catalogue, the data is memory-mapped
+    archive = RunArchive(str(tmp_path / 'archive'))
+    first, second = archive.runs()
+    assert (first.labels, first.axes, first.value_label) == (['Magnet', 'Velocity'], [[0, 1, 2], [0, 5]], 'Current')
+    assert isinstance(first.data, np.memmap)
+    assert first.data[:, 1].tolist() == [-1, 0, -1]
+    assert [(value, position) for _, value, position in archive.peaks()] == [(0, (1, 5)), (0, (2, 5))]
+    assert [run.peak(rows_per_chunk=1) for run in (first, second)] == [(0, (1, 5)), (0, (2, 5))]
+    assert archive.reduce(lambda data: float(np.sum(data))) == [-19, -21]
+
+
+def test_logging_rate_limit(tmp_path: Path) -> None:
+    import logging
+    from srcMAX.pythionMAX._loggingMAX import RateLimitFilter, configure_logging
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    listener = configure_logging(str(tmp_path / 'log.txt'), burst=3, interval=0.2)
+    try:
+        logger = logging.getLogger('pythion')
+        for i in range(10):
+            logger.warning('Bad line %d', i)
+        logger.warning('Another message')
+        time.sleep(0.25)
+        logger.warning('Bad line %d', 10)
+    finally:
+        listener.stop()
+        for handler in root.handlers:
+            if handler not in handlers:
+                root.removeHandler(handler)
+    with open(tmp_path / 'log.txt') as file:
+        lines = [line.split(' ', 2)[2].rstrip('\n') for line in file]
+    assert lines == ['Bad line 0', 'Bad line 1', 'Bad line 2', 'Another message', 'Bad line 10 (7 similar messages suppressed)']
+
+    # Windows that have run out are forgotten when new messages come in
+    rate_limit = RateLimitFilter(burst=1, interval=0.05)
+    for i in range(100):
+        rate_limit.filter(logging.LogRecord('pythion', logging.WARNING, __file__, 0, f'Message {i}', None, None))
+    time.sleep(0.06)
+    rate_limit.filter(logging.LogRecord('pythion', logging.WARNING, __file__, 0, 'Message', None, None))
+    assert len(rate_limit._windows) == 1
+
+
+def test_scan_plan(tmp_path: Path) -> None:
+    magnet = RecordingOutput(target_limit=100)
+    velocity = RecordingOutput(target_limit=10)
+    devices = [HeadlessGridSearch.Device(magnet, [0, 50, 100], wait_time=1, bidirectional=False, label='Magnet'),
+               HeadlessGridSearch.Device(velocity, [0, 10, 20], wait_time=0.5, label='Velocity')]
+    plan = ScanPlan.compile(devices, measure_time=0.2, reset_to_zero=True)
+
+    # Velocity sweeps back and forth, the magnet returns to its first value at the end
+    measured = plan.indices[plan.measure].tolist()
+    assert measured == [[0, 0], [0, 1], [0, 2], [1, 2], [1, 1], [1, 0], [2, 0], [2, 1], [2, 2]]
+    assert plan.schedule(0).tolist() == [0, 50, 100, 0, 0]
+    assert len(plan) == plan.reset_start + 2
+    # 20 is out of range for the velocity filter, and is clamped
+    assert not plan.is_valid and len(plan.errors) == 1 and 'Velocity' in plan.errors[0]
+    assert plan.schedule(1).max() == 10
+    assert plan.estimated_duration == pytest.approx(1 + 6 * 0.5 + 3 * 1 + 9 * 0.2)
+    assert magnet.written == []  # Compiling doesn't touch the devices
+
+    plan.save(str(tmp_path / 'plan.json'))
+    loaded = ScanPlan.load(str(tmp_path / 'plan.json'))
+    assert loaded.indices.tolist() == plan.indices.tolist()
+    assert loaded.estimated_duration == pytest.approx(plan.estimated_duration)
+
+
+def test_main_thread_jobs() -> None:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from srcMAX.pythionMAX._routinesMAX.routineMAX import Routine
+    from srcMAX.pythionMAX._routinesMAX.routine_handlerMAX import RoutineHandler
+    app = QApplication.instance() or QApplication([])
+    routine = Routine()
+    handler = RoutineHandler(routine, None)
+    calls: list[tuple[str, int]] = []
+
+    futures: list[Future[Any]] = []
+
+    def submit_from_worker() -> None:
+        futures.append(handler.submit(len, 'abc'))
+        for frame in range(5):
+            routine.run_on_main_thread(lambda frame: calls.append(('frame', frame)), frame, key='plot')
+        routine.run_on_main_thread(calls.append, ('other', 0))
+
+    worker = threading.Thread(target=submit_from_worker)
+    worker.start()
+    worker.join()
+    app.processEvents()
+    # Jobs run in order, and only the latest of the coalesced frames is drawn
+    assert calls == [('frame', 4), ('other', 0)]
+    assert futures[0].result(timeout=0) == 3
+
+    failing = handler.submit(lambda: 1 / 0)
+    app.processEvents()
+    assert isinstance(failing.exception(timeout=0), ZeroDivisionError)
+
+
+def test_grid_search_plot_time() -> None:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from types import SimpleNamespace
+    from PyQt5.QtWidgets import QApplication
+    from srcMAX.pythionMAX._routinesMAX.grid_searchMAX import GridSearch
+    from srcMAX.pythionMAX._routinesMAX.routine_handlerMAX import RoutineHandler
+    app = QApplication.instance() or QApplication([])
+    device = SimpleNamespace(output=SimpleNamespace(label='Magnet'), values=[0, 1])
+    search = GridSearch(device, device, input=SimpleNamespace(label='Current'),
+                        settings=GridSearch.Settings(measure_samples=1, measure_checktime=0, update_graphics=False, plot_every=1))
+    search.heatmap = SimpleNamespace(update=lambda results: time.sleep(0.05))
+    search.results = np.zeros((2, 2))
+    search._counter = 0
+    RoutineHandler(search, None)
+    search.metrics.reset(1)
+    search.metrics.point_done()
+    search._on_point((0, 0), 1.0)
+    assert search.metrics.snapshot().phase_times['plot'] == 0  # Only queued so far
+    app.processEvents()
+    # The time of drawing on the main thread, not of queuing the call
+    assert search.metrics.snapshot().phase_times['plot'] >= 0.05
+
+
+def test_routine_executor_cancel() -> None:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from srcMAX.pythionMAX._routinesMAX.routineMAX import Routine
+    from srcMAX.pythionMAX._routinesMAX.routine_handlerMAX import RoutineHandler
+    from srcMAX.pythionMAX._routinesMAX.executorMAX import RoutineExecutor
+    app = QApplication.instance() or QApplication([])
+    executor = RoutineExecutor(max_routines=2)
+    slept: list[bool] = []
+    sleeping = threading.Semaphore(0)
+    routines = [Routine(), Routine()]
+    handlers = [RoutineHandler(routine, None, executor) for routine in routines]
+    for routine in routines:
+        routine.add_task(sleeping.release)
+        routine.add_task(lambda routine=routine: slept.append(routine.sleep(60)))
+        routine.add_task(lambda: slept.append(True))  # Not run after cancelling
+    for handler in handlers:
+        handler.start()
+    # Both routines run at the same time
+    assert sleeping.acquire(timeout=5) and sleeping.acquire(timeout=5)
+    assert all(executor.is_running(routine) for routine in routines)
+
+    start = time.monotonic()
+    for handler in handlers:
+        handler.cancel()
+    assert time.monotonic() - start < 0.1  # Cancelling doesn't wait for the routines
+    assert executor.wait(timeout=1)
+    assert slept == [False, False]
+    assert not executor.running
+    app.processEvents()
+    assert all(handler.ready for handler in handlers)
+
+
+def test_time_series(tmp_path: Path) -> None:
+    from types import SimpleNamespace
+    from srcMAX.pythionMAX._routinesMAX.time_seriesMAX import TimeSeries, load_time_series
+    magnet = SimpleNamespace(interface=RecordingOutput(target_limit=100), label='Magnet')
+    velocity = SimpleNamespace(interface=RecordingOutput(target_limit=100), label='Velocity')
+    current = SimpleNamespace(interface=ProbeInput(magnet.interface, velocity.interface), label='Current [nA]')
+    for device in (magnet, velocity):
+        device.interface.target = 0
+        device.interface.written.clear()
+    series = TimeSeries.from_waveform(
+        [magnet, velocity], current, lambda t: (round(t * 10), None), duration=0.3, step_time=0.1,
+        settings=TimeSeries.Settings(poll_time=0.02, update_graphics=False, plot=False),
+        file_settings=FileSettings('series', str(tmp_path))
+    )
+    assert [step.setpoints for step in series.steps] == [(0, None), (1, None), (2, None)]
+    series.execute()
+    assert magnet.interface.written == [0, 1, 2]
+    assert velocity.interface.written == []
+    assert series.filename is not None
+    data = load_time_series(series.filename)['Current [nA]']
+    assert set(data[:, 1]) == {0, 1, 2}
+    assert np.all(np.diff(data[:, 0]) > 0)  # Timestamps increase
+    assert np.all(data[:, 2] == 10 * data[:, 1])  # Every sample is recorded with the step it was taken in
+    assert series.metrics.snapshot().done == 3
+
+
+def test_lazy_imports() -> None:
+    import subprocess
+    import sys
+    # In a new interpreter, since this one has imported everything already
+    code = ('import sys\n'
+            'from srcMAX.pythionMAX.connectionsMAX import LinearCalibration, RS3000Output, RBDInput\n'
+            'from srcMAX.pythionMAX.routinesMAX import HeadlessGridSearch, Heatmap, ScanPlan\n'
+            'import srcMAX.pythionMAX.routinesMAX as routines\n'
+            'assert "GridSearch" in dir(routines) and "TimeSeries" not in vars(routines)\n'
+            'Heatmap(Heatmap.Settings(0, 1, None, 10), ["y", "x"], ([0, 1], [0, 1]), "z")\n'
+            'print(sorted(name for name in ("matplotlib.pyplot", "seaborn", "PyQt5.QtWidgets") if name in sys.modules))')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+    from srcMAX.pythionMAX import routinesMAX
+    with pytest.raises(AttributeError):
+        routinesMAX.NotARoutine
+
+
+def test_config(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    from srcMAX.pythionMAX._configMAX import Config, ConfigError, load_config
+    with open('configMAX.txt', 'r') as file:
+        text = file.read()
+    config = Config.parse(text)
+    assert config.port_rbd_a == 'COM6' and config.magnet_stepsize == -100 and config.heatmap_loglimit == 0
+    assert config.velocity_bidirectional is True
+
+    def problems(replacements: dict[str, str]) -> list[str]:
+        changed = text
+        for old, new in replacements.items():
+            assert old in changed
+            changed = changed.replace(old, new)
+        with pytest.raises(ConfigError) as error:
+            Config.parse(changed)
+        return error.value.problems
+
+    # Values are literals, never code
+    assert 'line 2' in problems({"PORT_RBD_a: 'COM6'": "PORT_RBD_a: __import__('os').getcwd()"})[0]
+    assert problems({'MEASURING_SAMPLES: 1 ': 'MEASURING_SAMPLES: True '}) == ['line 25: MEASURING_SAMPLES must be an integer, got True']
+    assert problems({'PLOT_EVERY: 5': ''}) == ['PLOT_EVERY is missing']
+    # 25 bytes per sample at 1000 Hz fill the 1020 byte buffer in 41 ms, so reading 5 times per second overflows it
+    [overflow] = problems({'CURRENT_SAMPLERATE: 10 ': 'CURRENT_SAMPLERATE: 1000 '})
+    assert 'CURRENT_PULLRATE' in overflow and 'USB buffer' in overflow
+    assert len(problems({'MAGNET_STEPSIZE: -100': 'MAGNET_STEPSIZE: 100', 'HEATMAP_SCALEMIN: 1 ': 'HEATMAP_SCALEMIN: 2000 '})) == 2
+    with caplog.at_level('WARNING', logger='pythion'):
+        Config.parse(text + '\nMEASURING_CHECKTIME: 0.2\n')
+    assert 'unknown key MEASURING_CHECKTIME' in caplog.text
+
+    # Cached until the file changes
+    filename = tmp_path / 'config.txt'
+    filename.write_text(text)
+    assert load_config(str(filename)) is load_config(str(filename))
+    filename.write_text(text.replace('PLOT_EVERY: 5', 'PLOT_EVERY: None'))
+    assert load_config(str(filename)).plot_every is None